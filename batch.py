@@ -0,0 +1,211 @@
+# batch.py
+
+import contextvars
+import copy
+import datetime
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import re  # 正規表現を扱うライブラリをインポートします
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from browser_pool import BrowserRuntime
+from checkpoint import RunCheckpoint
+from comparison import run_comparison
+import tracing
+
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_RETRIES = 1
+DEFAULT_OUTPUT_DIR = "batch_out"
+STATUS_LOG_NAME = "status.jsonl"
+
+
+def deep_merge(base, override):
+    """
+    base に override を再帰的に重ねた新しい辞書を返します。
+    辞書同士は項目ごとに統合し、それ以外（リストを含む）は override の値で置き換えます。
+    """
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _safe_job_id(job_id):
+    # ジョブIDは出力先のディレクトリ名に使うため、使えない文字を置き換える
+    return re.sub(r"[^\w.-]+", "_", str(job_id)).strip("._") or "job"
+
+
+def load_jobs(jobs_path):
+    """
+    ジョブファイル（JSONL）を読み込みます。1行が1件の比較ジョブで、以下のどちらかの形式です。
+
+      {"id": "atx-board", "config": {"product": "...", "search_parameters": {"keywords": [...]}}}
+      {"id": "atx-board", "product": "...", "search_parameters": {"keywords": [...]}}
+
+    config（または id 以外の項目）は基本の設定ファイルに重ねる上書き設定です。
+    id を省略した場合は行番号から生成します。空行と # で始まる行は読み飛ばします。
+
+    戻り値:
+      {'id': ジョブID, 'override': 上書き設定} のリスト
+    """
+    jobs = []
+    seen = set()
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{jobs_path} の {line_number} 行目をJSONとして読み込めません: {e}") from e
+            if not isinstance(entry, dict):
+                raise ValueError(f"{jobs_path} の {line_number} 行目がJSONオブジェクトではありません。")
+            job_id = _safe_job_id(entry.get("id") or f"job-{line_number:04d}")
+            if job_id in seen:
+                raise ValueError(f"{jobs_path} の {line_number} 行目のジョブID {job_id} が重複しています。")
+            seen.add(job_id)
+            override = entry["config"] if "config" in entry else {k: v for k, v in entry.items() if k != "id"}
+            jobs.append({"id": job_id, "override": override or {}})
+    return jobs
+
+
+class BatchStatusLog:
+    """
+    ジョブの状態（開始・リトライ・成功・失敗）を1行1イベントのJSONLとして追記するログです。
+    複数のワーカースレッドから同時に書き込めます。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, job_id, status, **fields):
+        record = {"job_id": job_id, "status": status, "time": datetime.datetime.now().isoformat()}
+        record.update(fields)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def succeeded_job_ids(self):
+        """
+        これまでの実行で成功したジョブIDの集合を返します（バッチを再実行したときに成功済みのジョブを飛ばすため）。
+        """
+        if not os.path.exists(self.path):
+            return set()
+        last_status = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                last_status[record.get("job_id")] = record.get("status")
+        return {job_id for job_id, status in last_status.items() if status == "succeeded"}
+
+
+def _run_job(job, base_config, output_dir, scrape_cache, product_store, browser_runtime, max_retries, status_log):
+    """
+    1件のジョブを実行し、失敗した場合は max_retries 回まで再実行します。
+    チェックポイントはジョブごとに固定のIDで保存するため、再実行では取得済みのサイト・製品をスキップします。
+
+    戻り値:
+      ジョブの結果（ステータスログの最終行と同じ内容の辞書）
+    """
+    job_id = job["id"]
+    job_dir = os.path.join(output_dir, job_id)
+    config = deep_merge(base_config, job["override"])
+    checkpoint = RunCheckpoint(run_id=job_id, runs_dir=os.path.join(output_dir, "runs"))
+
+    for attempt in range(1, max_retries + 2):
+        status_log.write(job_id, "running", attempt=attempt)
+        start = time.perf_counter()
+        try:
+            with tracing.span("job", job_id=job_id, attempt=attempt):
+                result = run_comparison(config, output_dir=job_dir, scrape_cache=scrape_cache, checkpoint=checkpoint,
+                                        browser_runtime=browser_runtime, require_products=True,
+                                        product_store=product_store, require_report=True)
+        except Exception as e:
+            duration = round(time.perf_counter() - start, 2)
+            status = "retrying" if attempt <= max_retries else "failed"
+            print(f"ジョブ {job_id} が失敗しました（{attempt}回目）。エラー:", e)
+            status_log.write(job_id, status, attempt=attempt, duration=duration, error=f"{type(e).__name__}: {e}")
+            if status == "failed":
+                return {"job_id": job_id, "status": status, "attempt": attempt, "error": str(e)}
+            continue
+        fields = {
+            "attempt": attempt,
+            "duration": round(time.perf_counter() - start, 2),
+            "products": len(result["products"].get("results", [])),
+            "report": result["report_path"],
+            "scraped_data": os.path.join(job_dir, "scraped_data.json"),
+        }
+        status_log.write(job_id, "succeeded", **fields)
+        return dict(fields, job_id=job_id, status="succeeded")
+
+
+def run_batch(jobs_path, base_config, scrape_cache=None, output_dir=None, workers=None, max_retries=None,
+              product_store=None):
+    """
+    ジョブファイルの各ジョブを、上限付きのワーカープールで並列に実行します。
+
+    全ジョブで1つの BrowserRuntime（起動済みのブラウザプールとイベントループ）を共有するため、
+    ジョブごとにブラウザやLLMクライアントを起動し直すことはありません。キャッシュとレート制限も全ジョブで共有します。
+    ブラウザプールの設定は基本の設定ファイルの browser_settings.browser_pool を使用します。
+
+    各ジョブの report.md / scraped_data.json は <output_dir>/<ジョブID>/ に、
+    ジョブの状態は <output_dir>/status.jsonl に出力します。status.jsonl で成功済みのジョブは再実行しません。
+
+    引数:
+      jobs_path: ジョブファイル（JSONL）のパス
+      base_config: 基本の設定（settings.yaml を読み込んだ辞書）
+      scrape_cache: 全ジョブで共有するスクレイピング結果のキャッシュ（ScrapeCache）
+      output_dir: 出力先ディレクトリ（省略時は batch.output_dir）
+      workers: 同時に実行するジョブ数（省略時は batch.workers）
+      max_retries: 失敗したジョブを再実行する回数（省略時は batch.max_retries）
+      product_store: 全ジョブで共有する製品情報の履歴（ProductStore）
+
+    戻り値:
+      ジョブごとの結果（辞書）のリスト
+    """
+    batch_settings = base_config.get("batch", {}) or {}
+    output_dir = output_dir or batch_settings.get("output_dir", DEFAULT_OUTPUT_DIR)
+    workers = max(1, workers or batch_settings.get("workers", DEFAULT_WORKERS))
+    max_retries = max(0, max_retries if max_retries is not None else batch_settings.get("max_retries", DEFAULT_MAX_RETRIES))
+
+    os.makedirs(output_dir, exist_ok=True)
+    status_log = BatchStatusLog(os.path.join(output_dir, STATUS_LOG_NAME))
+    jobs = load_jobs(jobs_path)
+    succeeded = status_log.succeeded_job_ids()
+    pending = [job for job in jobs if job["id"] not in succeeded]
+    if len(pending) < len(jobs):
+        print(f"成功済みの {len(jobs) - len(pending)} 件のジョブをスキップします。")
+    if not pending:
+        return []
+
+    print(f"{len(pending)} 件のジョブを {workers} 並列で実行します（出力先: {output_dir}）。")
+    browser_settings = base_config.get("search_parameters", {}).get("browser_settings", {})
+    start = time.perf_counter()
+    results = []
+    with BrowserRuntime.from_settings(browser_settings, default_size=workers) as runtime:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-worker") as executor:
+            # ジョブの計測区間が呼び出し元のスパンの子になるよう、コンテキストを引き継いで実行する
+            futures = {
+                executor.submit(contextvars.copy_context().run, _run_job, job, base_config, output_dir, scrape_cache,
+                                product_store, runtime, max_retries, status_log): job
+                for job in pending
+            }
+            for future in as_completed(futures):
+                results.append(future.result())
+
+    elapsed = time.perf_counter() - start
+    succeeded_count = sum(1 for result in results if result["status"] == "succeeded")
+    print(f"バッチ完了: 成功 {succeeded_count} 件 / 失敗 {len(results) - succeeded_count} 件 "
+          f"（{elapsed:.1f}秒、{len(results) / max(elapsed, 1e-9) * 60:.1f} 件/分）")
+    return results
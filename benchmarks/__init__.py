@@ -0,0 +1,14 @@
+# benchmarks/__init__.py
+"""
+ネットワークやAPIを使わずに、製品情報の取得からレポート生成までの性能を計測するベンチマークです。
+
+  fixture_shop: ローカルのHTTPサーバーで動く架空のECサイト（検索・商品・口コミ・公式サイトのページ）
+  mock_llm: 架空のECサイトのページを読んで決まった応答を返すチャットモデル（llm_factory に 'mock' として登録）
+  run: シナリオごとに比較を実行し、所要時間のパーセンタイル・ステップ数・トークン数・ピークメモリを表示
+  startup: CLIの起動時間を計測し、上限を超えた場合や重いライブラリが起動時に読み込まれた場合に失敗
+
+実行例:
+  python -m benchmarks.run
+  python -m benchmarks.run --scenarios adapter-3sites --repeat 5
+  python -m benchmarks.startup --max-seconds 0.5
+"""
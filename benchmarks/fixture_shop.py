@@ -0,0 +1,286 @@
+# benchmarks/fixture_shop.py
+
+import html
+import random
+import re  # 正規表現を扱うライブラリをインポートします
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, urljoin, urlparse
+
+from site_adapters import register_adapter
+from site_adapters.base import SiteAdapter, parse_price_text
+
+
+PRODUCTS_PER_SHOP = 30
+REVIEWS_PER_ITEM = 10
+
+# 同じ製品が複数のショップに並ぶよう、商品名は全ショップ共通の組み合わせから作る
+_VENDORS = ["ASUS", "MSI", "GIGABYTE", "ASRock"]
+_CHIPSETS = ["B650", "X670E", "B650E", "A620", "X870"]
+_VARIANTS = ["", " WIFI", " PRO", " PLUS WIFI", " ELITE"]
+
+_LINE = re.compile(r"<p class=\"fx\">(.*?)</p>", re.S)
+
+
+def build_catalog(shop_index, size=PRODUCTS_PER_SHOP):
+    """
+    ショップ番号から決まる商品一覧を返します。実行のたびに同じ内容になります。
+
+    戻り値:
+      {'id', 'name', 'price', 'specs', 'official_specs', 'reviews'} のリスト（価格の安い順）
+    """
+    rng = random.Random(shop_index)
+    items = []
+    for i in range(size):
+        vendor = _VENDORS[i % len(_VENDORS)]
+        chipset = _CHIPSETS[(i // len(_VENDORS)) % len(_CHIPSETS)]
+        variant = _VARIANTS[(i // (len(_VENDORS) * len(_CHIPSETS))) % len(_VARIANTS)]
+        name = f"{vendor} {chipset}{variant} マザーボード"
+        rating = [5, 4, 5, 3, 4]
+        items.append({
+            "id": i + 1,
+            "name": f"【ショップ{shop_index + 1}】{name}" if rng.random() < 0.3 else name,
+            "price": 10000 + (i * 1370 + shop_index * 500 + rng.randint(0, 999)) % 25000,
+            "specs": {
+                "ソケット": "AM5",
+                "フォームファクタ": "ATX",
+                "メモリ": "DDR5 x4",
+                "M.2スロット": f"{1 + i % 3}x PCIe 4.0 M.2",
+            },
+            "official_specs": {
+                "LAN": "2.5GbE" if i % 2 else "1GbE",
+                "USB": f"USB 3.2 Gen2 x{2 + i % 4}",
+                "保証": "3年",
+            },
+            "reviews": [
+                f"★{rating[k % len(rating)]} {name} の口コミ{k + 1}: 安定して動作しています。BIOS更新も簡単でした。"
+                for k in range(REVIEWS_PER_ITEM)
+            ],
+        })
+    return sorted(items, key=lambda item: item["price"])
+
+
+def _page(title, lines, body=""):
+    # データ行は LLM（ページ抽出）とアダプタの両方が読めるよう「種類|値|...」の形式で1行ずつ表示する
+    rows = "\n".join(f'<p class="fx">{html.escape(line)}</p>' for line in lines)
+    return (
+        "<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\">"
+        f"<title>{html.escape(title)}</title></head><body>\n{body}\n{rows}\n</body></html>"
+    )
+
+
+def parse_fixture_lines(text):
+    """
+    ページのデータ行（「種類|値|...」）を辞書にまとめます。HTMLでも、ページを Markdown に変換したテキストでも読めます。
+
+    戻り値:
+      {'page', 'url', 'name', 'price', 'items', 'specs', 'reviews', 'reviews_url', 'official_url'} の辞書
+      （page が無ければ架空のECサイトのページではありません）
+    """
+    if "<p class=\"fx\">" in text:
+        lines = [html.unescape(line) for line in _LINE.findall(text)]
+    else:
+        lines = [line.strip().replace("\\|", "|") for line in text.splitlines()]
+    page = {"page": None, "url": "", "name": "", "price": None, "items": [], "specs": {}, "reviews": [],
+            "reviews_url": "", "official_url": ""}
+    for line in lines:
+        kind, _, rest = line.partition("|")
+        fields = rest.split("|")
+        if kind == "PAGE":
+            page["page"] = rest
+        elif kind == "URL":
+            page["url"] = rest
+        elif kind == "NAME":
+            page["name"] = rest
+        elif kind == "PRICE":
+            page["price"] = parse_price_text(rest)
+        elif kind == "ITEM" and len(fields) >= 3:
+            page["items"].append({"url": fields[0], "name": fields[1], "price": parse_price_text(fields[2])})
+        elif kind == "SPEC" and len(fields) >= 2:
+            page["specs"][fields[0]] = fields[1]
+        elif kind == "REVIEW":
+            page["reviews"].append(rest)
+        elif kind == "REVIEWS":
+            page["reviews_url"] = rest
+        elif kind == "OFFICIAL":
+            page["official_url"] = rest
+    return page
+
+
+class FixtureShop:
+    """
+    ローカルのHTTPサーバーで動く架空のECサイトです。ページは以下の通りです。
+
+      /search?q=...      検索結果（価格の安い順に全商品）
+      /item/<id>         商品ページ（商品名・価格・仕様、口コミと公式サイトへのリンク）
+      /item/<id>/reviews 口コミページ
+      /official/<id>     メーカー公式サイトの製品ページ
+
+    使用例:
+      with FixtureShop(0) as shop:
+          websites = [shop.site()]
+    """
+
+    def __init__(self, index, page_latency=0.0, host="127.0.0.1"):
+        """
+        引数:
+          index: ショップ番号（商品一覧とショップ名が決まります）
+          page_latency: 1ページの応答にかける時間（秒）。実際のサイトの応答の遅さを再現します
+          host: 待ち受けるアドレス
+        """
+        self.index = index
+        self.page_latency = page_latency
+        self.host = host
+        self.catalog = build_catalog(index)
+        self._items = {item["id"]: item for item in self.catalog}
+        self._server = None
+        self._thread = None
+        self.url = ""
+
+    @property
+    def name(self):
+        return f"Fixture Shop {self.index + 1}"
+
+    def site(self):
+        """
+        settings.yaml の websites と同じ形式のサイト情報を返します。
+        """
+        return {"name": self.name, "url": self.url}
+
+    def start(self):
+        shop = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if shop.page_latency:
+                    time.sleep(shop.page_latency)
+                status, body = shop.render(self.path)
+                data = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        # ポート番号は空いているものを使う（サイトごとに別のホスト名として扱われる）
+        self._server = ThreadingHTTPServer((self.host, 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://{self.host}:{self._server.server_address[1]}/"
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"fixture-shop-{self.index}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def render(self, path):
+        """
+        パスに対応するページのHTMLを返します。
+
+        戻り値:
+          (ステータスコード, HTML)
+        """
+        parsed = urlparse(path)
+        url = urljoin(self.url, path)
+        parts = [part for part in parsed.path.split("/") if part]
+        if not parts:
+            form = '<form action="/search"><input type="text" name="q" aria-label="検索"><button>検索</button></form>'
+            return 200, _page(self.name, ["PAGE|top", f"URL|{url}"], form)
+
+        if parts == ["search"]:
+            lines = ["PAGE|search", f"URL|{url}"]
+            links = []
+            for item in self.catalog:
+                item_url = urljoin(self.url, f"item/{item['id']}")
+                lines.append(f"ITEM|{item_url}|{item['name']}|{item['price']:,}円")
+                links.append(f'<a class="item-link" href="{item_url}">{html.escape(item["name"])}</a>')
+            return 200, _page(f"検索結果 - {self.name}", lines, "\n".join(links))
+
+        item = self._items.get(int(parts[1])) if len(parts) >= 2 and parts[1].isdigit() else None
+        if item is None or parts[0] not in ("item", "official"):
+            return 404, _page("Not Found", ["PAGE|not_found", f"URL|{url}"])
+
+        if parts[0] == "official":
+            lines = ["PAGE|official", f"URL|{url}", f"NAME|{item['name']}"]
+            lines += [f"SPEC|{key}|{value}" for key, value in item["official_specs"].items()]
+            return 200, _page(f"{item['name']} - 製品情報", lines)
+
+        if parts[2:] == ["reviews"]:
+            lines = ["PAGE|reviews", f"URL|{url}"] + [f"REVIEW|{review}" for review in item["reviews"]]
+            return 200, _page(f"{item['name']} の口コミ", lines)
+
+        item_url = urljoin(self.url, f"item/{item['id']}")
+        lines = ["PAGE|item", f"URL|{url}", f"NAME|{item['name']}", f"PRICE|{item['price']:,}円"]
+        lines += [f"SPEC|{key}|{value}" for key, value in item["specs"].items()]
+        lines += [f"REVIEWS|{item_url}/reviews", f"OFFICIAL|{urljoin(self.url, 'official/' + str(item['id']))}"]
+        links = (f'<a href="{item_url}/reviews">口コミを見る</a>'
+                 f'<a href="{urljoin(self.url, "official/" + str(item["id"]))}">メーカー製品情報</a>')
+        return 200, _page(item["name"], lines, links)
+
+
+class FixtureShopAdapter(SiteAdapter):
+    """
+    架空のECサイト用のアダプタです。アダプタ経由の取得（HTTPとHTMLの解析）の性能を計測するために使います。
+    仕様は公式サイトの製品ページから取得します。
+    """
+
+    name = "Fixture Shop"
+    max_workers = 4
+
+    def __init__(self, shop):
+        self.name = shop.name
+        self.domains = (urlparse(shop.url).netloc,)
+        self._base_url = shop.url
+
+    def search_url(self, keywords, search_condition):
+        return urljoin(self._base_url, "search?q=" + quote(" ".join(keywords)))
+
+    def parse_search_results(self, html, page_url):
+        return [item["url"] for item in parse_fixture_lines(_decode(html))["items"]]
+
+    def parse_item(self, html, item_url):
+        page = parse_fixture_lines(_decode(html))
+        return {"product_name": page["name"], "price": page["price"], "manufacturer_url": page["official_url"],
+                "details": "; ".join(f"{k}: {v}" for k, v in page["specs"].items())}
+
+    def spec_url(self, item_url):
+        return item_url.replace("/item/", "/official/")
+
+    def parse_specs(self, html):
+        return parse_fixture_lines(_decode(html))["specs"]
+
+    def review_url(self, item_url):
+        return item_url.rstrip("/") + "/reviews"
+
+    def parse_reviews(self, html):
+        return parse_fixture_lines(_decode(html))["reviews"]
+
+
+def _decode(html):
+    return html.decode("utf-8") if isinstance(html, bytes) else html
+
+
+def start_shops(count, page_latency=0.0):
+    """
+    count 個の架空のECサイトを起動し、それぞれのアダプタを登録します。
+
+    戻り値:
+      起動した FixtureShop のリスト（終了時に stop を呼んでください）
+    """
+    shops = [FixtureShop(index, page_latency=page_latency).start() for index in range(count)]
+    for shop in shops:
+        register_adapter(FixtureShopAdapter(shop))
+    return shops
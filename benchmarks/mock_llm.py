@@ -0,0 +1,335 @@
+# benchmarks/mock_llm.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+import json     # JSON形式のデータを扱うためのライブラリ
+import re  # 正規表現を扱うライブラリをインポートします
+import time
+from urllib.parse import quote, urljoin, urlparse
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from benchmarks.fixture_shop import parse_fixture_lines
+from json_extract import iter_json_values
+from llm_factory import register_llm_provider
+from tokens import estimate_tokens
+
+
+MOCK_PLATFORM = "mock"
+
+# scraper.run_agent がタスク命令文の先頭に付ける文言（エージェントの呼び出しかどうかの判定に使う）
+_AGENT_TASK_MARKER = "以下の指示に従ってください。"
+# vision を使う場合の、スクリーンショット1枚あたりの入力トークン数の概算
+_IMAGE_TOKENS = 765
+
+_SITE = re.compile(r"- (.+?) \(URL: (\S+?)\)")
+_LISTED_URL = re.compile(r"^- URL: (\S+)", re.M)
+_LISTED_SITE = re.compile(r"1\. (.+?) の以下の商品ページ")
+_EXCLUDED_URL = re.compile(r"^\s*・(https?://\S+)", re.M)
+_STEP_MARKER = re.compile(r'mock-step-(\d+): ([^"\s]*)')
+_PRODUCT_NAME = re.compile(r"^\[\d+\] (.+)$|'product_name': '([^']*)'|\"product_name\":\s?\"([^\"]*)\"", re.M)
+
+
+def _message_text(message):
+    """
+    メッセージの本文（文字列・マルチモーダルの配列）とツール呼び出しの引数を1つの文字列にし、画像の枚数を返します。
+    """
+    content = message.content
+    images = 0
+    if isinstance(content, list):
+        parts = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                images += 1
+            elif isinstance(part, dict):
+                parts.append(str(part.get("text", "")))
+            else:
+                parts.append(str(part))
+        text = "\n".join(parts)
+    else:
+        text = str(content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += "\n" + json.dumps([call.get("args", {}) for call in tool_calls], ensure_ascii=False)
+    return text, images
+
+
+def _pages_in(text):
+    """
+    会話中に現れた、架空のECサイトのページの抽出結果を {URL: ページ} で返します。
+    抽出結果のJSON（ページ抽出の応答）と、ページのデータ行そのもの（抽出にLLMを使わないバージョン）の両方を読みます。
+    """
+    pages = {}
+    for value in iter_json_values(text):
+        if isinstance(value, dict) and value.get("fixture_page") and value.get("url"):
+            pages.setdefault(value["url"], value)
+    for chunk in text.split("PAGE|")[1:]:
+        page = parse_fixture_lines("PAGE|" + chunk)
+        if page["url"] and page["page"] not in (None, "not_found"):
+            pages.setdefault(page["url"], dict(page, fixture_page=page["page"]))
+    return pages
+
+
+class _AgentTask:
+    """
+    タスク命令文（scraper.construct_task / construct_fill_task / construct_price_task と、パイプラインの
+    construct_listing_task / construct_detail_task / construct_official_task）から読み取った実行内容です。
+    """
+
+    def __init__(self, task):
+        self.sites = [{"name": name, "url": url} for name, url in _SITE.findall(task)]
+        self.listed_urls = _LISTED_URL.findall(task)
+        listed_site = _LISTED_SITE.search(task)
+        self.listed_site_name = listed_site.group(1) if listed_site else ""
+        self.price_only = "現在の価格だけ" in task
+        self.listing_only = "商品ページは開かないでください" in task
+        self.official_only = "公式サイトの製品ページを開いてください" in task
+        product_url = re.search(r"商品ページ: (\S+)", task)
+        self.product_url = product_url.group(1) if product_url else ""
+        keywords = re.search(r"キーワード \((.*?)\)", task)
+        self.keywords = keywords.group(1) if keywords else ""
+        top = re.search(r"上位 (\d+) 件", task)
+        self.return_products_num = int(top.group(1)) if top else 5
+        reviews = re.search(r"評価の高い順で(\d+)件", task)
+        if "口コミ情報は取得不要" in task:
+            self.reviews = 0
+        elif "全ての口コミ情報" in task:
+            self.reviews = -1
+        elif reviews:
+            self.reviews = int(reviews.group(1))
+        else:
+            self.reviews = 3 if "reviews" in task else 0
+        self.official = "公式情報を取得" in task or "公式サイトの製品ページから取得" in task
+        self.excluded = set(_EXCLUDED_URL.findall(task))
+
+    def plan(self, pages):
+        """
+        これまでに抽出したページから、訪問するURLを順に返します（検索結果を読むと商品ページが追加されます）。
+        """
+        urls = []
+
+        def add_item(url):
+            urls.append(url)
+            page = pages.get(url)
+            if page is None or self.price_only or self.official_only:
+                return
+            if self.reviews and page.get("reviews_url"):
+                urls.append(page["reviews_url"])
+            if self.official and page.get("official_url"):
+                urls.append(page["official_url"])
+
+        if self.listed_urls:
+            for url in self.listed_urls:
+                add_item(url)
+            return urls
+        for site in self.sites:
+            search_url = urljoin(site["url"], "search?q=" + quote(self.keywords))
+            urls.append(search_url)
+            search = pages.get(search_url)
+            if search is None or self.listing_only:
+                continue
+            items = [item for item in search.get("items", []) if item["url"] not in self.excluded]
+            for item in items[:self.return_products_num]:
+                add_item(item["url"])
+        return urls
+
+    def results(self, pages):
+        """
+        抽出したページから、タスクが指定する形式の製品情報のリストを組み立てます。
+        """
+        results = []
+        if self.listing_only:
+            for site in self.sites:
+                search = pages.get(urljoin(site["url"], "search?q=" + quote(self.keywords))) or {}
+                items = [item for item in search.get("items", []) if item["url"] not in self.excluded]
+                results += [{"product_name": item["name"], "price": item["price"], "url": item["url"]}
+                            for item in items[:self.return_products_num]]
+            return results
+        if self.official_only:
+            for url in self.plan(pages):
+                page = pages.get(url) or {}
+                if page.get("fixture_page") == "official":
+                    results.append({"url": self.product_url, "manufacturer_url": url,
+                                    "details": "; ".join(f"{k}: {v}" for k, v in page.get("specs", {}).items())})
+            return results
+        for url in self.plan(pages):
+            page = pages.get(url)
+            if page is None or page.get("fixture_page") != "item":
+                continue
+            if self.price_only:
+                results.append({"url": url, "price": page.get("price")})
+                continue
+            reviews_page = pages.get(page.get("reviews_url"), {}) if self.reviews else {}
+            official_page = pages.get(page.get("official_url"), {}) if self.official else {}
+            reviews = reviews_page.get("reviews", [])
+            specs = dict(page.get("specs", {}))
+            specs.update(official_page.get("specs", {}))
+            results.append({
+                "site_name": self._site_name(url),
+                "product_name": page.get("name", ""),
+                "price": page.get("price"),
+                "url": url,
+                "manufacturer_url": page.get("official_url", ""),
+                "reviews": reviews if self.reviews < 0 else reviews[:self.reviews],
+                "details": "; ".join(f"{k}: {v}" for k, v in specs.items()),
+            })
+        return results
+
+    def _site_name(self, url):
+        host = urlparse(url).netloc
+        for site in self.sites:
+            if urlparse(site["url"]).netloc == host:
+                return site["name"]
+        return self.listed_site_name
+
+
+def _agent_response(text):
+    """
+    Browser-Use エージェントの1ステップ分の応答（AgentOutput のJSON）を返します。
+
+    偶数ステップで次のURLを開き（go_to_url）、奇数ステップでそのページを抽出します（extract_content）。
+    訪問するURLが無くなったら、抽出したページから組み立てた結果で done を返します。
+    """
+    task = _AgentTask(text[text.index(_AGENT_TASK_MARKER):])
+    # 前のステップの応答に残した目印から、ステップ番号と訪問済みのURLを読み取る
+    markers = [(int(step), url) for step, url in _STEP_MARKER.findall(text)]
+    step = max((marker[0] for marker in markers), default=-1) + 1
+    visited = {url for _, url in markers if url}
+    pages = _pages_in(text)
+
+    url = ""
+    if step % 2 == 1 and markers:
+        action = {"extract_content": {"goal": "ページの製品情報を抽出する", "include_links": True}}
+    else:
+        url = next((candidate for candidate in task.plan(pages) if candidate not in visited), "")
+        if url:
+            action = {"go_to_url": {"url": url}}
+        else:
+            done_text = json.dumps({"results": task.results(pages)}, ensure_ascii=False)
+            action = {"done": {"text": done_text, "success": True}}
+    return json.dumps({
+        "current_state": {
+            "page_summary": "",
+            "evaluation_previous_goal": "Success",
+            "memory": f"mock-step-{step}: {url}",
+            "next_goal": next(iter(action)),
+        },
+        "action": [action],
+    }, ensure_ascii=False)
+
+
+def _extraction_response(text):
+    page = parse_fixture_lines(text[text.index("PAGE|"):])
+    return json.dumps(dict(page, fixture_page=page["page"]), ensure_ascii=False)
+
+
+def _report_response(text):
+    names = []
+    for match in _PRODUCT_NAME.finditer(text):
+        name = next(group for group in match.groups() if group is not None)
+        if name not in names:
+            names.append(name)
+    lines = ["# 調査レポート", "", "## おすすめ製品", ""]
+    for rank, name in enumerate(names[:5], 1):
+        lines.append(f"### {rank}. {name}")
+        lines.append("- 価格と仕様のバランスが良く、口コミでも安定性が評価されています。")
+        lines.append("")
+    lines += ["## まとめ", "", f"{len(names)} 件の製品を比較しました。"]
+    return "\n".join(lines)
+
+
+def respond(messages):
+    """
+    会話の内容から、呼び出し元（エージェントのステップ・ページ抽出・レポート生成）に合わせた応答を返します。
+
+    戻り値:
+      (応答の文字列, 推定入力トークン数)
+    """
+    texts = []
+    images = 0
+    for message in messages:
+        text, count = _message_text(message)
+        texts.append(text)
+        images += count
+    text = "\n".join(texts)
+    prompt_tokens = estimate_tokens(text) + images * _IMAGE_TOKENS
+    if _AGENT_TASK_MARKER in text:
+        return _agent_response(text), prompt_tokens
+    if "PAGE|" in text:
+        return _extraction_response(text), prompt_tokens
+    return _report_response(text), prompt_tokens
+
+
+class MockChatModel(BaseChatModel):
+    """
+    架空のECサイト（benchmarks.fixture_shop）に対して決まった応答を返すチャットモデルです。
+
+    APIを呼び出さず、latency（1回の呼び出しの待ち時間）と seconds_per_output_token（出力トークンあたりの待ち時間）
+    だけ待ってから応答します。トークン数は文字数から概算して usage_metadata に入れるため、計測（tracing）にも記録されます。
+    """
+
+    model_name: str = "mock"
+    latency: float = 0.0
+    seconds_per_output_token: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "ec-compass-mock"
+
+    def _respond(self, messages):
+        content, prompt_tokens = respond(messages)
+        completion_tokens = estimate_tokens(content)
+        wait = self.latency + completion_tokens * self.seconds_per_output_token
+        usage = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return content, usage, wait
+
+    def _result(self, content, usage):
+        message = AIMessage(content=content, usage_metadata=usage, response_metadata={"model_name": self.model_name})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, usage, wait = self._respond(messages)
+        time.sleep(wait)
+        return self._result(content, usage)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, usage, wait = self._respond(messages)
+        await asyncio.sleep(wait)
+        return self._result(content, usage)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        # レポートのストリーミング出力を計測できるよう、行ごとに分けて返す
+        content, usage, wait = self._respond(messages)
+        time.sleep(self.latency)
+        lines = content.splitlines(keepends=True) or [""]
+        for index, line in enumerate(lines):
+            time.sleep(estimate_tokens(line) * self.seconds_per_output_token)
+            chunk = AIMessageChunk(content=line, usage_metadata=usage if index == len(lines) - 1 else None)
+            yield ChatGenerationChunk(message=chunk)
+
+    def with_structured_output(self, schema, *, include_raw=False, **kwargs):
+        """
+        応答のJSONを schema（Pydantic モデル）に変換する Runnable を返します（Browser-Use の AgentOutput 用）。
+        """
+        def parse(message):
+            data = json.loads(message.content)
+            parsed = schema.model_validate(data) if hasattr(schema, "model_validate") else data
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return self | RunnableLambda(parse)
+
+
+def register_mock_llm(latency=0.0, seconds_per_output_token=0.0):
+    """
+    llm_factory に 'mock' プラットフォームを登録します。以降 get_llm('mock', モデル名) で MockChatModel が返ります。
+    """
+    def factory(model, cache=False, callbacks=None):
+        return MockChatModel(model_name=model, latency=latency, seconds_per_output_token=seconds_per_output_token,
+                             cache=cache, callbacks=callbacks)
+
+    register_llm_provider(MOCK_PLATFORM, factory)
@@ -0,0 +1,300 @@
+# benchmarks/run.py
+
+import argparse  # コマンドライン引数を扱うためのライブラリ
+import contextlib
+import datetime
+import io
+import json     # JSON形式のデータを扱うためのライブラリ
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+RESULT_PREFIX = "BENCHMARK_RESULT "
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# mode: adapter はサイトアダプタ（HTTP＋HTMLの解析）、agent は Browser-Use エージェント（ブラウザを起動）で取得する
+SCENARIOS = [
+    {"name": "adapter-1site", "mode": "adapter", "sites": 1, "return_products_num": 3, "reviews_per_product": 3,
+     "use_vision": False},
+    {"name": "adapter-3sites", "mode": "adapter", "sites": 3, "return_products_num": 5, "reviews_per_product": 3,
+     "use_vision": False},
+    {"name": "adapter-3sites-noreviews", "mode": "adapter", "sites": 3, "return_products_num": 5,
+     "reviews_per_product": 0, "use_vision": False},
+    {"name": "adapter-5sites-10items", "mode": "adapter", "sites": 5, "return_products_num": 10,
+     "reviews_per_product": -1, "use_vision": False},
+    {"name": "agent-1site", "mode": "agent", "sites": 1, "return_products_num": 3, "reviews_per_product": 3,
+     "use_vision": False},
+    {"name": "agent-1site-vision", "mode": "agent", "sites": 1, "return_products_num": 3, "reviews_per_product": 3,
+     "use_vision": True},
+    {"name": "agent-1site-cascade", "mode": "agent", "sites": 1, "return_products_num": 3, "reviews_per_product": 3,
+     "use_vision": True, "cascade": True},
+    {"name": "agent-2sites-pipeline", "mode": "agent", "sites": 2, "return_products_num": 3, "reviews_per_product": 3,
+     "use_vision": False, "pipeline": True},
+    {"name": "agent-2sites-noreviews", "mode": "agent", "sites": 2, "return_products_num": 3,
+     "reviews_per_product": 0, "use_vision": False},
+]
+
+
+def percentile(values, q):
+    """
+    最近傍順位法によるパーセンタイル（q は 0〜100）を返します。値が無い場合は None を返します。
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def build_config(base_config, scenario, websites):
+    """
+    基本の設定に、シナリオの条件と架空のECサイト・モックモデルを重ねた設定を返します。
+    """
+    from batch import deep_merge
+    from benchmarks.mock_llm import MOCK_PLATFORM
+
+    return deep_merge(base_config, {
+        "search_parameters": {
+            "ai_platform": MOCK_PLATFORM,
+            "search_model": "mock-agent",
+            "websites": websites,
+            "return_products_num": scenario["return_products_num"],
+            "browser_settings": {
+                "use_vision": scenario["use_vision"],
+                "reviews_per_product": scenario["reviews_per_product"],
+                "use_site_adapters": scenario["mode"] == "adapter",
+                "visit_official_site": scenario.get("visit_official_site", True),
+                "pipeline": {"enabled": scenario.get("pipeline", False)},
+                # 段階の記録は実行ごとに結果が変わらないよう保存しない
+                "model_cascade": {
+                    "enabled": scenario.get("cascade", False),
+                    "remember": False,
+                    "tiers": [{"search_model": "mock-agent-mini", "use_vision": False, "max_steps": 40},
+                              {"search_model": "mock-agent", "use_vision": True}],
+                },
+            },
+        },
+        "reporting": {
+            "ai_platform": MOCK_PLATFORM,
+            "report_model": "mock-report",
+            "stream": False,
+            "map_reduce": {"map_platform": MOCK_PLATFORM, "map_model": "mock-map"},
+        },
+    })
+
+
+def run_worker(scenario, repeat, warmup, config_path, llm_latency, page_latency, verbose):
+    """
+    1つのシナリオを repeat 回実行し、計測結果を RESULT_PREFIX に続くJSONの1行で出力します。
+    ピークメモリを他のシナリオと分けて測るため、シナリオごとに別プロセスで呼び出されます。
+    """
+    import resource
+
+    from benchmarks.fixture_shop import start_shops
+    from benchmarks.mock_llm import register_mock_llm
+    from comparison import run_comparison
+    from config_loader import load_config
+    import tracing
+
+    register_mock_llm(latency=llm_latency)
+    shops = start_shops(scenario["sites"], page_latency=page_latency)
+    config = build_config(load_config(config_path), scenario, [shop.site() for shop in shops])
+
+    runs = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="ec_compass_bench_") as output_dir:
+            for index in range(warmup + repeat):
+                tracer = tracing.configure_tracing({"enabled": True})
+                # 比較処理の出力は計測結果の表示の邪魔になるため、--verbose のときだけ表示する
+                output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+                start = time.perf_counter()
+                error = None
+                products = 0
+                try:
+                    with output, tracing.span("run"):
+                        result = run_comparison(config, output_dir=os.path.join(output_dir, f"run-{index}"),
+                                                require_products=True)
+                    products = len(result["products"].get("results", []))
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                duration = time.perf_counter() - start
+                if index < warmup:
+                    continue
+                runs.append({
+                    "duration": duration,
+                    "error": error,
+                    "products": products,
+                    "agent_steps": sum(span.counters.get("agent_steps", 0) for span in tracer.spans),
+                    "prompt_tokens": sum(usage["prompt_tokens"] for usage in tracer.model_usage.values()),
+                    "completion_tokens": sum(usage["completion_tokens"] for usage in tracer.model_usage.values()),
+                    "llm_calls": sum(usage["calls"] for usage in tracer.model_usage.values()),
+                })
+    finally:
+        for shop in shops:
+            shop.stop()
+
+    # ru_maxrss は Linux では KB、macOS ではバイト単位
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+    print(RESULT_PREFIX + json.dumps(summarize(scenario, runs, peak_rss_mb), ensure_ascii=False))
+
+
+def summarize(scenario, runs, peak_rss_mb):
+    """
+    シナリオの各実行の計測値を集計します（失敗した実行は所要時間の集計から除きます）。
+    """
+    ok = [run for run in runs if run["error"] is None]
+    durations = [run["duration"] for run in ok]
+    count = max(1, len(ok))
+    return {
+        "scenario": scenario["name"],
+        "params": {key: value for key, value in scenario.items() if key != "name"},
+        "runs": len(runs),
+        "failures": len(runs) - len(ok),
+        "errors": sorted({run["error"] for run in runs if run["error"]}),
+        "p50": percentile(durations, 50),
+        "p90": percentile(durations, 90),
+        "p99": percentile(durations, 99),
+        "products": sum(run["products"] for run in ok) / count,
+        "agent_steps": sum(run["agent_steps"] for run in ok) / count,
+        "llm_calls": sum(run["llm_calls"] for run in ok) / count,
+        "prompt_tokens": sum(run["prompt_tokens"] for run in ok) / count,
+        "completion_tokens": sum(run["completion_tokens"] for run in ok) / count,
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def run_scenario(scenario, args):
+    """
+    シナリオを別プロセスで実行し、集計結果を返します。
+    """
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--worker", scenario["name"],
+        "--repeat", str(args.repeat), "--warmup", str(args.warmup), "--config", os.path.abspath(args.config),
+        "--llm-latency", str(args.llm_latency), "--page-latency", str(args.page_latency),
+    ]
+    if args.verbose:
+        command.append("--verbose")
+    completed = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True, encoding="utf-8")
+    if args.verbose:
+        print(completed.stdout, end="")
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    detail = (completed.stderr or completed.stdout).strip().splitlines()[-1:] or ["出力がありません"]
+    return {"scenario": scenario["name"], "runs": 0, "failures": args.repeat, "errors": detail}
+
+
+def _seconds(value):
+    return f"{value:.2f}" if value is not None else "-"
+
+
+def print_results(results):
+    print()
+    print("=== ベンチマーク結果 ===")
+    print(f"{'シナリオ':<28}{'実行':>6}{'失敗':>6}{'p50(秒)':>10}{'p90(秒)':>10}{'p99(秒)':>10}"
+          f"{'製品':>8}{'ステップ':>10}{'入力トークン':>14}{'出力トークン':>14}{'ピークRSS(MB)':>16}")
+    for result in results:
+        print(f"{result['scenario']:<28}{result['runs']:>6}{result['failures']:>6}"
+              f"{_seconds(result.get('p50')):>10}{_seconds(result.get('p90')):>10}{_seconds(result.get('p99')):>10}"
+              f"{result.get('products', 0):>8.1f}{result.get('agent_steps', 0):>10.1f}"
+              f"{result.get('prompt_tokens', 0):>14.0f}{result.get('completion_tokens', 0):>14.0f}"
+              f"{result.get('peak_rss_mb', 0):>16.1f}")
+        for error in result.get("errors", []):
+            print(f"  エラー: {error}")
+
+
+def load_baseline(path):
+    """
+    以前の結果ファイル（JSONL）から、シナリオごとに最後の結果を返します。
+    """
+    baseline = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if result.get("p50") is not None:
+                baseline[result["scenario"]] = result
+    return baseline
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    基準の結果と比べて、p50・トークン数・ピークメモリが tolerance（割合）を超えて増えた項目を返します。
+    """
+    regressions = []
+    for result in results:
+        before = baseline.get(result["scenario"])
+        if before is None:
+            continue
+        if result.get("failures"):
+            regressions.append(f"{result['scenario']}: {result['failures']} 回失敗しました")
+        for key in ("p50", "prompt_tokens", "completion_tokens", "peak_rss_mb"):
+            old, new = before.get(key), result.get(key)
+            if old and new is not None and new > old * (1 + tolerance):
+                regressions.append(f"{result['scenario']}: {key} が {old:.2f} から {new:.2f} に増えました")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EC Compass オフラインベンチマーク')
+    parser.add_argument('--scenarios', type=str, help='実行するシナリオ名（カンマ区切り。省略時は全シナリオ）')
+    parser.add_argument('--mode', choices=['adapter', 'agent'], help='指定した取得方法のシナリオだけを実行する')
+    parser.add_argument('--repeat', type=int, default=5, help='シナリオごとの計測回数')
+    parser.add_argument('--warmup', type=int, default=1, help='計測前に捨てる実行回数')
+    parser.add_argument('--config', type=str, default='settings.yaml', help='基本の設定ファイルのパス')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='モックモデルの1回の呼び出しの待ち時間（秒）')
+    parser.add_argument('--page-latency', type=float, default=0.0, help='架空のECサイトの1ページの応答時間（秒）')
+    parser.add_argument('--output', type=str, default='bench_results.jsonl', help='結果を追記するファイル（JSONL）')
+    parser.add_argument('--baseline', type=str, help='比較する以前の結果ファイル。悪化していれば終了コード1で終了する')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='悪化とみなす増加率（0.2: 20%%）')
+    parser.add_argument('--verbose', action='store_true', help='比較処理の出力も表示する')
+    parser.add_argument('--worker', type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    scenarios = {scenario["name"]: scenario for scenario in SCENARIOS}
+    if args.worker:
+        run_worker(scenarios[args.worker], args.repeat, args.warmup, args.config, args.llm_latency,
+                   args.page_latency, args.verbose)
+        return
+
+    selected = SCENARIOS
+    if args.scenarios:
+        names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+        unknown = [name for name in names if name not in scenarios]
+        if unknown:
+            parser.error(f"不明なシナリオ: {', '.join(unknown)}（選択肢: {', '.join(scenarios)}）")
+        selected = [scenarios[name] for name in names]
+    if args.mode:
+        selected = [scenario for scenario in selected if scenario["mode"] == args.mode]
+
+    # 結果ファイルを基準にする場合もあるため、今回の結果を追記する前に読み込む
+    baseline = load_baseline(args.baseline) if args.baseline else None
+
+    results = []
+    for scenario in selected:
+        print(f"{scenario['name']} を実行しています...", flush=True)
+        results.append(run_scenario(scenario, args))
+    print_results(results)
+
+    timestamp = datetime.datetime.now().isoformat()
+    with open(args.output, 'a', encoding='utf-8') as f:
+        for result in results:
+            f.write(json.dumps(dict(result, time=timestamp), ensure_ascii=False) + "\n")
+    print(f"結果を {args.output} に追記しました。")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("悪化: " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# benchmarks/startup.py
+
+import argparse  # コマンドライン引数を扱うためのライブラリ
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.run import REPO_ROOT, percentile
+
+
+# CLIの起動時（import main・--help・--report-only）に読み込まれてはいけない重いライブラリ
+HEAVY_MODULES = ("browser_use", "playwright", "langchain", "langchain_core", "langchain_openai",
+                 "langchain_google_genai", "langchain_google_vertexai", "openai")
+
+# import main の後に、読み込まれた重いライブラリの名前をJSONで出力するコード
+_LOADED_CHECK = (
+    "import json, sys; import main; "
+    "print(json.dumps(sorted({{name.split('.')[0] for name in sys.modules}} & set({modules!r}))))"
+)
+
+
+def _run(args):
+    started_at = time.perf_counter()
+    completed = subprocess.run([sys.executable] + args, cwd=REPO_ROOT, capture_output=True, text=True)
+    return time.perf_counter() - started_at, completed
+
+
+def measure(args, repeat):
+    """
+    python に args を渡して repeat 回起動し、所要時間（秒）のリストを返します。1回でも失敗すれば RuntimeError を送出します。
+    """
+    times = []
+    for _ in range(repeat):
+        elapsed, completed = _run(args)
+        if completed.returncode != 0:
+            raise RuntimeError(f"python {' '.join(args)} が失敗しました:\n{completed.stderr.strip()}")
+        times.append(elapsed)
+    return times
+
+
+def loaded_heavy_modules():
+    """
+    import main の後に読み込まれている重いライブラリの名前のリストを返します。
+    """
+    elapsed, completed = _run(["-c", _LOADED_CHECK.format(modules=HEAVY_MODULES)])
+    if completed.returncode != 0:
+        raise RuntimeError(f"import main が失敗しました:\n{completed.stderr.strip()}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit=10):
+    """
+    python -X importtime の結果から、import main で読み込みに時間がかかったモジュールを
+    (累積時間（秒）, モジュール名) のリストで返します（遅い順。main 自体は除きます）。
+    """
+    _, completed = _run(["-X", "importtime", "-c", "import main"])
+    imports = []
+    for line in completed.stderr.splitlines():
+        # 形式: "import time: self [us] | cumulative | imported package"
+        fields = line.split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if name != "main":
+            imports.append((int(fields[1]) / 1e6, name))
+    return sorted(imports, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EC Compass CLIの起動時間のベンチマーク')
+    parser.add_argument('--repeat', type=int, default=10, help='計測回数')
+    parser.add_argument('--max-seconds', type=float, default=1.0,
+                        help='python main.py --help の起動時間（p50、インタプリタ自体の起動時間を除く）の上限（秒）')
+    args = parser.parse_args()
+
+    interpreter = measure(["-c", "pass"], args.repeat)
+    import_main = measure(["-c", "import main"], args.repeat)
+    help_times = measure([os.path.join(REPO_ROOT, "main.py"), "--help"], args.repeat)
+
+    base = percentile(interpreter, 50)
+    print(f"{'対象':<24}{'p50':>10}{'p95':>10}")
+    for label, times in (("python -c pass", interpreter), ("import main", import_main), ("main.py --help", help_times)):
+        print(f"{label:<24}{percentile(times, 50):>9.3f}s{percentile(times, 95):>9.3f}s")
+
+    print("\nimport main で時間のかかったモジュール（累積）:")
+    for seconds, name in slowest_imports():
+        print(f"  {seconds:>8.3f}s  {name}")
+
+    failures = []
+    startup = percentile(help_times, 50) - base
+    if startup > args.max_seconds:
+        failures.append(f"main.py --help の起動時間 {startup:.3f}s が上限 {args.max_seconds:.3f}s を超えています")
+    heavy = loaded_heavy_modules()
+    if heavy:
+        failures.append(f"import main で重いライブラリが読み込まれています: {', '.join(heavy)}")
+    for failure in failures:
+        print("悪化: " + failure)
+    if failures:
+        sys.exit(1)
+    print(f"\n起動時間 {startup:.3f}s（上限 {args.max_seconds:.3f}s）、重いライブラリの読み込みなし")
+
+
+if __name__ == '__main__':
+    main()
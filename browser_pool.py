@@ -0,0 +1,216 @@
+# browser_pool.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+import contextvars
+import threading
+from contextlib import asynccontextmanager
+
+from browser_use.browser.browser import Browser, BrowserConfig
+from browser_use.browser.context import BrowserContextConfig
+
+
+class _BrowserSlot:
+    """
+    プール内の1ブラウザ分の状態（ブラウザ本体と、これまでに処理したタスク数）を保持します。
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.browser = None
+        self.task_count = 0
+
+
+class BrowserPool:
+    """
+    ヘッドレスブラウザを事前に起動して使い回すためのプールです。
+
+    タスクごとに独立したブラウザコンテキスト（Cookie・タブを共有しない）を払い出し、
+    タスク終了後にコンテキストだけを閉じてブラウザ本体は次のタスクへ回します。
+    一定数のタスクを処理したブラウザや、タスク中に例外が発生したブラウザは再起動します。
+
+    使用例:
+      async with BrowserPool(size=3) as pool:
+          async with pool.context() as browser_context:
+              agent = Agent(task=..., llm=..., browser_context=browser_context)
+    """
+
+    def __init__(self, size=2, headless=True, recycle_after=20, context_config=None):
+        """
+        引数:
+          size: 同時に起動しておくブラウザ数（＝同時に払い出せるコンテキスト数の上限）
+          headless: ヘッドレスモードで起動するかどうか
+          recycle_after: 1つのブラウザで処理するタスク数の上限。超えたら再起動します（0以下で無制限）
+          context_config: コンテキスト作成時に使用する BrowserContextConfig
+        """
+        self.size = max(1, size)
+        self.headless = headless
+        self.recycle_after = recycle_after
+        self.context_config = context_config or BrowserContextConfig()
+        self._slots = [_BrowserSlot(i) for i in range(self.size)]
+        self._available = None
+        self._closed = False
+
+    @classmethod
+    def from_settings(cls, browser_settings, default_size=2):
+        """
+        settings.yaml の browser_settings.browser_pool からプールを作成します。
+        """
+        pool_settings = (browser_settings or {}).get("browser_pool", {}) or {}
+        return cls(
+            size=pool_settings.get("size", default_size),
+            headless=pool_settings.get("headless", True),
+            recycle_after=pool_settings.get("recycle_after", 20),
+        )
+
+    async def start(self):
+        """
+        全ブラウザを起動し、払い出し可能な状態にします。
+        """
+        self._available = asyncio.Queue()
+        await asyncio.gather(*(self._launch(slot) for slot in self._slots))
+        for slot in self._slots:
+            self._available.put_nowait(slot)
+        return self
+
+    async def close(self):
+        """
+        全ブラウザを終了します。
+        """
+        self._closed = True
+        await asyncio.gather(*(self._shutdown(slot) for slot in self._slots))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @asynccontextmanager
+    async def context(self):
+        """
+        空いているブラウザから独立したコンテキストを1つ払い出します。
+        空きが無い場合は、他のタスクがコンテキストを返却するまで待機します。
+        """
+        if self._available is None:
+            raise RuntimeError("BrowserPool.start() が呼ばれていません。")
+
+        slot = await self._available.get()
+        browser_context = None
+        crashed = False
+        try:
+            try:
+                if slot.browser is None:
+                    await self._launch(slot)
+                browser_context = await slot.browser.new_context(config=self.context_config)
+            except BaseException:
+                # 起動やコンテキストの作成に失敗したブラウザだけを作り直す。エージェントのエラーやタイムアウトでは
+                # ブラウザ自体は使えるため、起動済みのまま次のタスクに払い出す
+                crashed = True
+                raise
+            yield browser_context
+        finally:
+            if browser_context is not None:
+                try:
+                    await browser_context.close()
+                except Exception as e:
+                    print(f"ブラウザコンテキストの終了に失敗しました (browser #{slot.index})。エラー:", e)
+                    crashed = True
+            slot.task_count += 1
+            if crashed or (self.recycle_after > 0 and slot.task_count >= self.recycle_after):
+                await self._shutdown(slot)
+                if not self._closed:
+                    # 次に払い出すときに起動し直す
+                    slot.task_count = 0
+            self._available.put_nowait(slot)
+
+    async def _launch(self, slot):
+        slot.browser = Browser(config=BrowserConfig(headless=self.headless))
+        # Playwright のブラウザプロセスをここで起動しておき、最初のタスクの待ち時間をなくす
+        await slot.browser.get_playwright_browser()
+
+    async def _shutdown(self, slot):
+        if slot.browser is None:
+            return
+        try:
+            await slot.browser.close()
+        except Exception as e:
+            print(f"ブラウザの終了に失敗しました (browser #{slot.index})。エラー:", e)
+        slot.browser = None
+
+
+class BrowserRuntime:
+    """
+    BrowserPool を専用スレッドのイベントループ上で起動したままにし、複数のスレッドから共有するためのランタイムです。
+
+    通常の実行ではスクレイピングのたびに asyncio.run でプールを起動・終了しますが、
+    バッチ実行のように多数の比較を続けて行う場合は、このランタイムに処理を投入することで
+    ブラウザと（ループごとに保持される）LLMクライアントを全ジョブで使い回せます。
+
+    使用例:
+      with BrowserRuntime(BrowserPool(size=3)) as runtime:
+          result = runtime.run(run_agent(task, browser_pool=runtime.pool))
+    """
+
+    def __init__(self, pool):
+        """
+        引数:
+          pool: 共有する BrowserPool（start() はランタイムが呼び出します）
+        """
+        self.pool = pool
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="browser-runtime", daemon=True)
+        self._started = False
+
+    @classmethod
+    def from_settings(cls, browser_settings, default_size=2):
+        """
+        settings.yaml の browser_settings.browser_pool からプールを作成し、ランタイムを返します。
+        """
+        return cls(BrowserPool.from_settings(browser_settings, default_size=default_size))
+
+    def start(self):
+        """
+        イベントループのスレッドを開始し、プールのブラウザを起動します。
+        """
+        self._thread.start()
+        self._started = True
+        self.run(self.pool.start())
+        return self
+
+    def run(self, coro):
+        """
+        コルーチンをランタイムのイベントループで実行し、完了するまで呼び出し元のスレッドを待機させます。
+        コルーチン内で発生した例外はそのまま送出されます。
+        呼び出し元のコンテキスト変数（計測中のスパンなど）は、コルーチン内にも引き継がれます。
+        """
+        if not self._started:
+            raise RuntimeError("BrowserRuntime.start() が呼ばれていません。")
+        caller_context = contextvars.copy_context()
+
+        async def run_in_caller_context():
+            # ループ側のタスクは呼び出し元と別のコンテキストで動くため、呼び出し元の値を設定し直す
+            for var, value in caller_context.items():
+                var.set(value)
+            return await coro
+
+        return asyncio.run_coroutine_threadsafe(run_in_caller_context(), self.loop).result()
+
+    def close(self):
+        """
+        プールのブラウザを終了し、イベントループのスレッドを停止します。
+        """
+        if not self._started:
+            return
+        try:
+            self.run(self.pool.close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+            self._started = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,168 @@
+# checkpoint.py
+
+import datetime
+import hashlib  # ファイル名に使うハッシュ計算に使用
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import re  # 正規表現を扱うライブラリをインポートします
+import uuid
+from urllib.parse import urlparse
+
+
+DEFAULT_RUNS_DIR = "runs"
+
+
+def _write_json_atomic(path, data):
+    """
+    書き込み途中で中断されても壊れたファイルが残らないよう、一時ファイルに書いてから置き換えます。
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _site_key(site):
+    """
+    サイト情報から、ファイル名に使えるキー（例: 'kakaku.com-1a2b3c4d'）を生成します。
+    site が None の場合（複数サイトをまとめて巡回したエージェントの途中経過）は '_all' を返します。
+    """
+    if site is None:
+        return "_all"
+    url = site.get("url", "")
+    host = urlparse(url).netloc or site.get("name", "site")
+    slug = re.sub(r"[^A-Za-z0-9.-]+", "_", host) or "site"
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()[:8]
+    return f"{slug}-{digest}"
+
+
+def _product_key(product):
+    """
+    製品情報から、重複判定に使うキー（URL、無ければ商品名）を返します。
+    """
+    return str(product.get("url") or product.get("product_name") or json.dumps(product, ensure_ascii=False, sort_keys=True))
+
+
+def _new_run_id(runs_dir):
+    """
+    まだ使われていない実行IDを生成し、その実行ディレクトリを作成します（例: '20250101-120000-1a2b3c'）。
+    """
+    os.makedirs(runs_dir, exist_ok=True)
+    while True:
+        run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        try:
+            os.mkdir(os.path.join(runs_dir, run_id))
+        except FileExistsError:
+            continue
+        return run_id
+
+
+class RunCheckpoint:
+    """
+    1回のスクレイピング実行の途中経過を、実行ディレクトリ（runs/<run-id>/）に保存します。
+
+    - sites/<サイト>.json: 完了したサイトの製品情報（再開時はこのサイトを丸ごとスキップ）
+    - products/<サイト>.jsonl: 抽出できた製品情報を1件ずつ追記（再開時は取得済みの製品を除外して続きから取得）
+    - steps/<サイト>.jsonl: エージェントの各ステップで抽出された生の内容
+
+    使用例:
+      checkpoint = RunCheckpoint.resume("20250101-120000-1a2b3c")  # または RunCheckpoint()
+      scrape_data(websites, search_params, checkpoint=checkpoint)
+    """
+
+    def __init__(self, run_id=None, runs_dir=DEFAULT_RUNS_DIR):
+        """
+        引数:
+          run_id: 実行ID。省略時は現在時刻とランダムな接尾辞から生成します（同じ秒に開始した実行が
+            同じ実行ディレクトリを共有して、互いの途中経過を取得済みとみなさないように、新しいディレクトリを作成します）
+          runs_dir: 実行ディレクトリを置く親ディレクトリ
+        """
+        if run_id is None:
+            run_id = _new_run_id(runs_dir)
+        self.run_id = run_id
+        self.path = os.path.join(runs_dir, self.run_id)
+        # サイトごとに追記済みの製品のキー。追記のたびに jsonl を読み直さないよう、最初の追記時に読み込んで保持する
+        self._saved_keys = {}
+        for sub in ("sites", "products", "steps"):
+            os.makedirs(os.path.join(self.path, sub), exist_ok=True)
+
+    @classmethod
+    def resume(cls, run_id, runs_dir=DEFAULT_RUNS_DIR):
+        """
+        既存の実行ディレクトリから再開します。存在しない場合は FileNotFoundError を送出します。
+        """
+        if not os.path.isdir(os.path.join(runs_dir, run_id)):
+            raise FileNotFoundError(f"実行ID {run_id} のチェックポイントが見つかりません: {os.path.join(runs_dir, run_id)}")
+        return cls(run_id, runs_dir)
+
+    def load_site(self, site):
+        """
+        完了済みのサイトであれば製品情報のリストを、未完了であれば None を返します。
+        """
+        path = os.path.join(self.path, "sites", _site_key(site) + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("products", [])
+
+    def save_site(self, site, products):
+        """
+        サイトの処理完了を記録します。
+        """
+        for product in products:
+            self.save_product(site, product)
+        path = os.path.join(self.path, "sites", _site_key(site) + ".json")
+        _write_json_atomic(path, {
+            "site": site,
+            "completed_at": datetime.datetime.now().isoformat(),
+            "products": products,
+        })
+
+    def load_products(self, site):
+        """
+        サイトについて、これまでに抽出できた製品情報のリストを返します（重複は除きます）。
+        """
+        path = os.path.join(self.path, "products", _site_key(site) + ".jsonl")
+        if not os.path.exists(path):
+            return []
+        products = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    product = json.loads(line)
+                except ValueError:
+                    # 書き込み途中で中断された最終行は読み飛ばす
+                    continue
+                products[_product_key(product)] = product
+        return list(products.values())
+
+    def save_product(self, site, product):
+        """
+        抽出できた製品情報を1件追記します。取得済みの製品（同じURL）は追記しません。
+        """
+        if not isinstance(product, dict):
+            return
+        site_key = _site_key(site)
+        saved_keys = self._saved_keys.get(site_key)
+        if saved_keys is None:
+            saved_keys = self._saved_keys[site_key] = {_product_key(p) for p in self.load_products(site)}
+        key = _product_key(product)
+        if key in saved_keys:
+            return
+        saved_keys.add(key)
+        path = os.path.join(self.path, "products", site_key + ".jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(product, ensure_ascii=False) + "\n")
+            f.flush()
+
+    def save_step(self, site, step_number, extracted_contents):
+        """
+        エージェントの1ステップ分の抽出内容を追記します。
+        """
+        path = os.path.join(self.path, "steps", _site_key(site) + ".jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"step": step_number, "extracted": extracted_contents}, ensure_ascii=False) + "\n")
+            f.flush()
@@ -0,0 +1,298 @@
+# comparison.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import time
+
+from report import generate_report, generate_report_async, stream_report  # レポート生成モジュール
+from evaluator import rank_products  # 評価基準に基づく製品のスコアリング
+from dedup import deduplicate_products  # サイト間で重複した製品の統合
+import tracing
+
+
+class ComparisonError(Exception):
+    """
+    比較の実行に失敗した（製品情報を1件も取得できなかった）ことを表す例外です。
+    """
+
+
+def write_streaming_report(chunks, output_path):
+    """
+    レポートの断片を受け取るたびに端末へ表示し、出力ファイルへ追記します。
+    最初の断片が届くまでの時間（time-to-first-token）と全体の所要時間を表示します。
+
+    引数:
+      chunks: レポートの断片を返すイテラブル（report.stream_report の戻り値）
+      output_path: 出力先のファイルパス
+    """
+    start = time.perf_counter()
+    first_chunk_at = None
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            print(chunk, end='', flush=True)
+            f.write(chunk)
+            f.flush()
+    total = time.perf_counter() - start
+    print()
+    if first_chunk_at is not None:
+        print(f'最初の出力までの時間: {first_chunk_at - start:.2f}秒 / 合計時間: {total:.2f}秒')
+    else:
+        print(f'合計時間: {total:.2f}秒')
+
+
+def prefilter_products(all_products, config):
+    """
+    LLMに渡す前に、評価設定（criteria.scoring）に基づいてローカルで製品を絞り込みます。
+    評価設定が無い場合や、製品情報が取得できていない場合はそのまま返します。
+    """
+    scoring = config.get('criteria', {}).get('scoring')
+    if scoring and isinstance(all_products, dict) and isinstance(all_products.get('results'), list):
+        candidates = all_products['results']
+        ranked = rank_products(candidates, scoring, scoring.get('prefilter_top_n', len(candidates)))
+        print(f'評価設定に基づき {len(candidates)} 件から {len(ranked)} 件に絞り込みました。')
+        return dict(all_products, results=ranked)
+    return all_products
+
+
+def merge_duplicate_products(all_products, config):
+    """
+    複数サイトで重複して取得された同じ製品を、サイトごとの価格（offers）を持つ1つの製品にまとめます。
+    dedup.enabled が false の場合や、製品情報が取得できていない場合はそのまま返します。
+    """
+    dedup_settings = config.get('dedup', {}) or {}
+    if not dedup_settings.get('enabled', True):
+        return all_products
+    if isinstance(all_products, dict) and isinstance(all_products.get('results'), list):
+        products = all_products['results']
+        merged = deduplicate_products(products, dedup_settings)
+        if len(merged) < len(products):
+            print(f'重複した製品を統合しました（{len(products)} 件 → {len(merged)} 件）。')
+        return dict(all_products, results=merged)
+    return all_products
+
+
+def scrape_products(config, output_dir='.', scrape_cache=None, checkpoint=None, browser_runtime=None,
+                    product_store=None):
+    """
+    1つの設定について、製品情報の取得だけを実行します。結果は output_dir の scraped_data.json に保存されます。
+    引数は run_comparison と同じです。
+
+    戻り値:
+      製品情報（scrape_data の戻り値）
+    """
+    # Browser-Use・LangChain の読み込みには時間がかかるため、製品情報を取得する場合にだけ読み込む
+    from scraper import scrape_data  # 製品情報を収集するモジュール
+
+    os.makedirs(output_dir, exist_ok=True)
+    search_params = config.get('search_parameters', {})
+    websites = search_params.get('websites', [])
+    with tracing.span('scrape', sites=len(websites)):
+        all_products = scrape_data(websites, search_params, scrape_cache=scrape_cache, checkpoint=checkpoint,
+                                   browser_runtime=browser_runtime, output_dir=output_dir, product_store=product_store)
+    return all_products
+
+
+async def scrape_products_async(config, output_dir='.', scrape_cache=None, checkpoint=None, browser_pool=None,
+                                product_store=None, timeout=None):
+    """
+    scrape_products の非同期版です。引数は run_comparison_async と同じです（timeout は取得の制限時間（秒））。
+
+    戻り値:
+      製品情報（scrape_data_async の戻り値）
+    """
+    from scraper import scrape_data_async  # 製品情報を収集するモジュール
+
+    os.makedirs(output_dir, exist_ok=True)
+    search_params = config.get('search_parameters', {})
+    websites = search_params.get('websites', [])
+    with tracing.span('scrape', sites=len(websites)):
+        all_products = await scrape_data_async(websites, search_params, scrape_cache=scrape_cache,
+                                               checkpoint=checkpoint, browser_pool=browser_pool, output_dir=output_dir,
+                                               product_store=product_store, timeout=timeout)
+    return all_products
+
+
+def load_scraped_data(path):
+    """
+    以前の実行で保存した製品情報（scraped_data.json）を読み込みます。
+    JSONとして読めないファイル（パースできなかった生の結果の scraped_data.txt など）は文字列のまま返します。
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+def _report_options(config):
+    # レポート生成設定の取得
+    reporting = config.get('reporting', {}) or {}
+    return {
+        'top_n': config.get('top_n', 5),
+        'ai_platform': reporting.get('ai_platform', config.get('ai_platform', 'openai')),
+        'report_model': reporting.get('report_model', config.get('report_model', 'gpt-4o-mini')),
+        'reporting': reporting,
+    }
+
+
+def _check_report(report, require_report):
+    # LLMが空の応答を返した場合も、レポートを生成できなかったものとして扱う
+    if require_report and not report.strip():
+        raise ComparisonError('レポートを生成できませんでした: 空のレポートが返されました')
+
+
+def _narrow_products(all_products, config):
+    with tracing.span('dedup'):
+        all_products = merge_duplicate_products(all_products, config)
+    with tracing.span('prefilter'):
+        return prefilter_products(all_products, config)
+
+
+def write_report(all_products, config, output_dir='.', stream=False, require_report=False):
+    """
+    取得済みの製品情報を重複の統合・絞り込みしたうえで、レポートを生成して output_dir の report.md に保存します。
+
+    引数:
+      all_products: 製品情報（scrape_products または load_scraped_data の戻り値）
+      config: settings.yaml を読み込んだ辞書
+      output_dir: 出力先ディレクトリ
+      stream: レポートを生成しながら端末と report.md に逐次出力するかどうか
+      require_report: True の場合、レポートを生成できなければ ComparisonError を送出します
+        （False の場合は失敗のメッセージを report.md に書き込みます）
+
+    戻り値:
+      (重複の統合・絞り込み後の製品情報, レポートのパス)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    all_products = _narrow_products(all_products, config)
+    options = _report_options(config)
+    report_path = os.path.join(output_dir, 'report.md')
+
+    try:
+        if stream or options['reporting'].get('stream', False):
+            # レポートを生成しながら端末と report.md に逐次出力
+            write_streaming_report(
+                stream_report(all_products, config.get('criteria', {}), options['top_n'],
+                              report_model=options['report_model'], ai_platform=options['ai_platform'],
+                              reporting_settings=options['reporting'], raise_errors=require_report),
+                report_path
+            )
+            report = None
+        else:
+            # レポート生成
+            report = generate_report(all_products, config.get('criteria', {}), options['top_n'],
+                                     report_model=options['report_model'], ai_platform=options['ai_platform'],
+                                     reporting_settings=options['reporting'], raise_errors=require_report)
+    except Exception as e:
+        if not require_report:
+            raise
+        raise ComparisonError(f'レポートを生成できませんでした: {e}') from e
+    if report is not None:
+        _check_report(report, require_report)
+        # 生成されたレポートの保存
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write(report)
+
+    print(f'生成されたレポートが {report_path} に保存されました。')
+    return all_products, report_path
+
+
+async def write_report_async(all_products, config, output_dir='.', timeout=None, require_report=False):
+    """
+    write_report の非同期版です。レポートはまとめて生成して report.md に保存します（端末への逐次出力は行いません）。
+
+    引数:
+      timeout: レポート生成の制限時間（秒）。超えた場合は asyncio.TimeoutError を送出します
+      その他の引数は write_report と同じです
+
+    戻り値:
+      (重複の統合・絞り込み後の製品情報, レポートのパス)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    all_products = _narrow_products(all_products, config)
+    options = _report_options(config)
+    report_path = os.path.join(output_dir, 'report.md')
+
+    try:
+        report = await generate_report_async(all_products, config.get('criteria', {}), options['top_n'],
+                                             report_model=options['report_model'],
+                                             ai_platform=options['ai_platform'],
+                                             reporting_settings=options['reporting'], timeout=timeout,
+                                             raise_errors=require_report)
+    except Exception as e:
+        if not require_report or isinstance(e, asyncio.TimeoutError):
+            raise
+        raise ComparisonError(f'レポートを生成できませんでした: {e}') from e
+    _check_report(report, require_report)
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(report)
+
+    print(f'生成されたレポートが {report_path} に保存されました。')
+    return all_products, report_path
+
+
+def run_comparison(config, output_dir='.', scrape_cache=None, checkpoint=None, browser_runtime=None, stream=False,
+                   require_products=False, product_store=None, require_report=False):
+    """
+    1つの設定について、製品情報の取得から絞り込み、レポート生成までを実行します。
+    結果は output_dir の scraped_data.json と report.md に保存されます。
+
+    引数:
+      config: settings.yaml を読み込んだ辞書
+      output_dir: 出力先ディレクトリ
+      scrape_cache: サイト単位の結果キャッシュ（ScrapeCache）
+      checkpoint: 途中経過の保存先（RunCheckpoint）
+      browser_runtime: 起動済みの BrowserRuntime（複数の比較でブラウザを共有する場合）
+      stream: レポートを生成しながら端末と report.md に逐次出力するかどうか
+      require_products: True の場合、製品情報を取得できなければレポートを生成せずに ComparisonError を送出します
+      product_store: 製品情報の履歴（ProductStore）。差分取得の設定もここから参照します
+      require_report: True の場合、レポートを生成できなければ ComparisonError を送出します
+
+    戻り値:
+      {'products': 製品情報, 'report_path': レポートのパス}
+    """
+    all_products = scrape_products(config, output_dir=output_dir, scrape_cache=scrape_cache, checkpoint=checkpoint,
+                                   browser_runtime=browser_runtime, product_store=product_store)
+    if require_products and not isinstance(all_products, dict):
+        raise ComparisonError(f'製品情報を取得できませんでした: {str(all_products)[:200]}')
+
+    all_products, report_path = write_report(all_products, config, output_dir=output_dir, stream=stream,
+                                             require_report=require_report)
+    return {'products': all_products, 'report_path': report_path}
+
+
+async def run_comparison_async(config, output_dir='.', scrape_cache=None, checkpoint=None, browser_pool=None,
+                               require_products=False, product_store=None, scrape_timeout=None, report_timeout=None,
+                               require_report=False):
+    """
+    run_comparison の非同期版です。呼び出し元のイベントループで取得とレポート生成を行うため、
+    asyncio.gather などで複数の比較を並行に実行すると、ある比較のレポート生成中に別の比較の取得を進められます。
+
+    タスクがキャンセルされた場合や制限時間を超えた場合は、起動したブラウザを閉じて
+    asyncio.CancelledError / asyncio.TimeoutError を送出します。
+
+    引数:
+      browser_pool: 起動済みの BrowserPool（複数の比較でブラウザを共有する場合）。None の場合は実行ごとに起動します
+      scrape_timeout: 製品情報の取得の制限時間（秒）
+      report_timeout: レポート生成の制限時間（秒）
+      その他の引数は run_comparison と同じです（stream は指定できません）
+
+    戻り値:
+      {'products': 製品情報, 'report_path': レポートのパス}
+
+    使用例:
+      results = await asyncio.gather(run_comparison_async(config_a, 'out_a'), run_comparison_async(config_b, 'out_b'))
+    """
+    all_products = await scrape_products_async(config, output_dir=output_dir, scrape_cache=scrape_cache,
+                                               checkpoint=checkpoint, browser_pool=browser_pool,
+                                               product_store=product_store, timeout=scrape_timeout)
+    if require_products and not isinstance(all_products, dict):
+        raise ComparisonError(f'製品情報を取得できませんでした: {str(all_products)[:200]}')
+
+    all_products, report_path = await write_report_async(all_products, config, output_dir=output_dir,
+                                                         timeout=report_timeout, require_report=require_report)
+    return {'products': all_products, 'report_path': report_path}
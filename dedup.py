@@ -0,0 +1,236 @@
+# dedup.py
+
+import re  # 正規表現を扱うライブラリをインポートします
+import unicodedata
+
+from evaluator import parse_price
+from json_extract import merge_fields
+
+
+DEFAULT_THRESHOLD = 0.8
+DEFAULT_MAX_BLOCK_SIZE = 50
+NGRAM_SIZE = 3
+
+# 同じメーカーの表記ゆれ（英字・カタカナ）を1つの名前にまとめる
+DEFAULT_VENDORS = {
+    "asus": "asus", "エイスース": "asus", "アスース": "asus",
+    "msi": "msi", "エムエスアイ": "msi",
+    "gigabyte": "gigabyte", "ギガバイト": "gigabyte", "aorus": "gigabyte",
+    "asrock": "asrock", "アスロック": "asrock",
+    "biostar": "biostar", "バイオスター": "biostar",
+    "nzxt": "nzxt",
+}
+
+# 商品名に付く販売上の文言や製品カテゴリ名。同一商品の判定には使わない
+DEFAULT_STOPWORDS = {
+    "motherboard", "mainboard", "マザーボード", "マザボ", "atx", "新品", "中古", "送料無料", "国内正規品", "正規品",
+    "new", "original", "genuine", "for", "with", "the", "and", "desktop", "gaming", "pc",
+}
+
+# 片方にだけ含まれていれば別の製品とみなす型番の派生を表す語（WIFI有無、PRO/PLUS など）
+DEFAULT_VARIANT_TOKENS = {
+    "wifi", "wifi6", "wifi6e", "wifi7", "ax", "pro", "plus", "max", "elite", "lite", "ultra", "ii", "d4", "ddr4",
+    "m", "mini", "itx", "matx", "micro",
+}
+
+_BRACKETS = re.compile(r"【[^】]*】|\[[^\]]*\]")
+# 'Rev.1.1' / 'Ver 2' のような改訂の表記を1語（'rev11' / 'rev2'）にまとめる
+_REVISION_TEXT = re.compile(r"(?<![a-z0-9])(?:rev|ver)\.?\s*(\d+(?:\.\d+)?)")
+# 改訂を表す語（'v2', 'rev11'）。片方にだけ含まれるか値が異なれば別の製品とみなし、型番の語としては扱わない
+_REVISION_TOKEN = re.compile(r"^(?:v|rev)\d+$")
+_TOKEN = re.compile(r"[a-z0-9]+|[^\sa-z0-9]+")
+
+
+def _settings_set(settings, key, default):
+    values = settings.get(key)
+    return default if values is None else {unicodedata.normalize("NFKC", str(v)).lower() for v in values}
+
+
+class ProductNameKey:
+    """
+    商品名を正規化した比較用のキーです。
+
+      tokens: 販売文言・メーカー名を除いた語
+      vendor: 商品名から分かったメーカー（分からなければ None）
+      model_tokens: 英字と数字を両方含む語（'b650', 'x670e' などの型番。'v2' などの改訂は除く）
+      revision_tokens: 改訂を表す語（'v2', 'rev11'）
+      ngrams: 空白を除いた正規化済みの商品名の文字 n-gram
+    """
+
+    def __init__(self, tokens, vendor):
+        self.tokens = tokens
+        self.vendor = vendor
+        self.revision_tokens = {t for t in tokens if _REVISION_TOKEN.match(t)}
+        self.model_tokens = {t for t in tokens if re.search(r"\d", t) and re.search(r"[a-z]", t)} - self.revision_tokens
+        compact = "".join(tokens)
+        self.compact = compact
+        self.ngrams = {compact[i:i + NGRAM_SIZE] for i in range(max(1, len(compact) - NGRAM_SIZE + 1))} if compact else set()
+
+
+def normalize_name(name, vendors=None, stopwords=None):
+    """
+    商品名を正規化して ProductNameKey を返します。
+
+    全角/半角と大文字/小文字の違いを吸収し（NFKC）、【国内正規品】のような括弧書き、
+    'B650-PLUS' の区切り記号、メーカー名と販売上の文言を取り除きます。
+    """
+    vendors = DEFAULT_VENDORS if vendors is None else vendors
+    stopwords = DEFAULT_STOPWORDS if stopwords is None else stopwords
+    text = unicodedata.normalize("NFKC", str(name or "")).lower()
+    text = _BRACKETS.sub(" ", text)
+    text = text.replace("wi-fi", "wifi")
+    text = _REVISION_TEXT.sub(lambda m: "rev" + m.group(1).replace(".", ""), text)
+    tokens = []
+    vendor = None
+    for token in _TOKEN.findall(text):
+        if not token.strip() or not any(ch.isalnum() for ch in token):
+            continue
+        if token in vendors:
+            vendor = vendor or vendors[token]
+            continue
+        if token in stopwords:
+            continue
+        tokens.append(token)
+    return ProductNameKey(tokens, vendor)
+
+
+def is_same_product(a, b, threshold=DEFAULT_THRESHOLD, variant_tokens=None):
+    """
+    2つの ProductNameKey が同じ製品を表すかどうかを判定します。
+
+    - メーカーが両方分かっていて異なれば別製品
+    - 型番の語は、少ない方がもう一方に含まれていること（'b650' と 'b650m' は別製品）
+    - 派生を表す語（WIFI など）が片方にだけあれば別製品
+    - 改訂を表す語（V2, Rev.1.1 など）が一致しなければ別製品
+    - 文字 n-gram の包含率（共通部分 / 小さい方）が threshold 以上
+    """
+    variant_tokens = DEFAULT_VARIANT_TOKENS if variant_tokens is None else variant_tokens
+    if a.vendor and b.vendor and a.vendor != b.vendor:
+        return False
+    small, large = sorted((a.model_tokens, b.model_tokens), key=len)
+    if not small <= large:
+        return False
+    if (set(a.tokens) ^ set(b.tokens)) & variant_tokens:
+        return False
+    if a.revision_tokens != b.revision_tokens:
+        return False
+    if not a.ngrams or not b.ngrams:
+        return False
+    return len(a.ngrams & b.ngrams) / min(len(a.ngrams), len(b.ngrams)) >= threshold
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def _blocking_keys(key):
+    """
+    比較候補を絞り込むためのブロッキングキーを返します。
+    型番の語があればそれぞれを、無ければ正規化済みの商品名全体をキーにします。
+    """
+    if key.model_tokens:
+        return {"model:" + token for token in key.model_tokens}
+    return {"name:" + key.compact} if key.compact else set()
+
+
+def find_duplicate_groups(products, threshold=DEFAULT_THRESHOLD, max_block_size=DEFAULT_MAX_BLOCK_SIZE,
+                          vendors=None, stopwords=None, variant_tokens=None):
+    """
+    同じ製品と判定された製品のインデックスのグループを返します。
+
+    全ての組を比較するのではなく、型番の語が共通する製品（ブロック）の中だけを比較するため、
+    製品数にほぼ比例する時間で終わります。max_block_size より大きいブロック（'am5' のように
+    多くの製品に共通する語）は識別に役立たないため比較しません。
+
+    戻り値:
+      インデックスのリストのリスト（元の順序。重複の無い製品は要素1つのグループ）
+    """
+    keys = [normalize_name(p.get("product_name") if isinstance(p, dict) else "", vendors, stopwords) for p in products]
+    blocks = {}
+    for index, key in enumerate(keys):
+        for block_key in _blocking_keys(key):
+            blocks.setdefault(block_key, []).append(index)
+
+    union_find = _UnionFind(len(products))
+    compared = set()
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block_size:
+            continue
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                if (i, j) in compared or union_find.find(i) == union_find.find(j):
+                    continue
+                compared.add((i, j))
+                if is_same_product(keys[i], keys[j], threshold, variant_tokens):
+                    union_find.union(i, j)
+
+    groups = {}
+    for index in range(len(products)):
+        groups.setdefault(union_find.find(index), []).append(index)
+    return list(groups.values())
+
+
+def _offer(product):
+    return {
+        "site_name": product.get("site_name", ""),
+        "price": product.get("price"),
+        "url": product.get("url", ""),
+    }
+
+
+def _price_sort_key(product):
+    price = parse_price(product.get("price"))
+    return (price != price, price if price == price else 0.0)
+
+
+def merge_duplicates(products, group):
+    """
+    同じ製品と判定された製品を1つにまとめます。
+
+    最も安い製品を基準に、空の項目を他の製品の値で補い、各サイトの価格とURLを安い順に offers にまとめます。
+    """
+    members = sorted((products[i] for i in group), key=_price_sort_key)
+    merged = dict(members[0])
+    for product in members[1:]:
+        merged = merge_fields(merged, product)
+    # 商品名は販売文言の少ない（最も短い）表記を使う
+    merged["product_name"] = min((p.get("product_name") or "" for p in members), key=len) or merged.get("product_name")
+    merged["offers"] = [_offer(product) for product in members]
+    return merged
+
+
+def deduplicate_products(products, dedup_settings=None):
+    """
+    複数サイトで重複して取得された製品を統合します。
+
+    引数:
+      products: 製品情報（辞書）のリスト
+      dedup_settings: settings.yaml の dedup セクション（threshold, max_block_size, vendors, stopwords, variant_tokens）
+
+    戻り値:
+      統合後の製品情報のリスト。重複していた製品には、サイトごとの価格を表す offers が付きます
+    """
+    dedup_settings = dedup_settings or {}
+    vendors = dict(DEFAULT_VENDORS)
+    vendors.update({unicodedata.normalize("NFKC", str(k)).lower(): v for k, v in (dedup_settings.get("vendors") or {}).items()})
+    groups = find_duplicate_groups(
+        products,
+        threshold=dedup_settings.get("threshold", DEFAULT_THRESHOLD),
+        max_block_size=dedup_settings.get("max_block_size", DEFAULT_MAX_BLOCK_SIZE),
+        vendors=vendors,
+        stopwords=_settings_set(dedup_settings, "stopwords", DEFAULT_STOPWORDS),
+        variant_tokens=_settings_set(dedup_settings, "variant_tokens", DEFAULT_VARIANT_TOKENS),
+    )
+    return [products[group[0]] if len(group) == 1 else merge_duplicates(products, group) for group in groups]
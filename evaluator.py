@@ -1,21 +1,188 @@
 # evaluator.py
 
+import re  # 正規表現を扱うライブラリをインポートします
+import unicodedata
+
+import numpy as np
+
+
+# スペック表記で使われる数詞（"dual M.2 slots" / "M.2スロット×二" など）を数値に変換するための表
+_NUMBER_WORDS = {
+    "single": 1, "one": 1, "dual": 2, "two": 2, "twin": 2, "triple": 3, "three": 3,
+    "quad": 4, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8,
+}
+
+
+def _text_of(value):
+    """
+    製品情報の値（文字列・数値・リスト）を、検索用の1つの文字列にまとめます。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return " ".join(_text_of(v) for v in value)
+    if isinstance(value, dict):
+        return " ".join(f"{k} {_text_of(v)}" for k, v in value.items())
+    return unicodedata.normalize("NFKC", str(value))
+
+
+def _to_number(text):
+    """
+    '23,980円' や '¥23980'、'dual' のような表記を数値に変換します。変換できない場合は NaN を返します。
+    """
+    if text is None:
+        return np.nan
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        return float(text)
+    text = unicodedata.normalize("NFKC", str(text)).strip().lower()
+    if text in _NUMBER_WORDS:
+        return float(_NUMBER_WORDS[text])
+    match = re.search(r"\d[\d,]*(?:\.\d+)?", text)
+    if not match:
+        return np.nan
+    return float(match.group(0).replace(",", ""))
+
+
+def parse_price(value):
+    """
+    価格の値（数値または '23980' / '¥23,980' / '23,980円' のような文字列）を float に変換します。
+    """
+    return _to_number(value)
+
+
+def _normalize_rules(scoring):
+    """
+    評価設定を、ルールのリストに正規化します。
+    旧形式の price: {weight, threshold} は price 項目の threshold ルールとして扱います。
+    threshold が無い旧形式の設定は、従来どおり得点に加えません（範囲の指定が無いルールとして全製品に満点を与えないため）。
+    """
+    rules = []
+    if isinstance(scoring.get("price"), dict) and scoring["price"].get("threshold") is not None:
+        legacy = dict(scoring["price"])
+        legacy.setdefault("field", "price")
+        legacy.setdefault("name", "price")
+        rules.append(legacy)
+    rules.extend(scoring.get("rules", []) or [])
+    return rules
+
+
+def _extract_column(products, rule):
+    """
+    ルールの対象項目を全製品分まとめて数値の列（NumPy配列）に変換します。
+    pattern が指定されている場合は、その最初のグループを数値として取り出します。
+    """
+    field = rule.get("field", "price")
+    values = [product.get(field) if isinstance(product, dict) else None for product in products]
+    pattern = rule.get("pattern")
+    if not pattern:
+        if field == "price":
+            return np.array([parse_price(v) for v in values], dtype=float)
+        return np.array([_to_number(v) for v in values], dtype=float)
+
+    regex = re.compile(pattern, flags=re.IGNORECASE)
+    column = np.full(len(values), np.nan, dtype=float)
+    for i, value in enumerate(values):
+        match = regex.search(_text_of(value))
+        if match:
+            column[i] = _to_number(match.group(1) if match.groups() else match.group(0))
+    return column
+
+
+def _rule_scores(products, rule):
+    """
+    1つのルールについて、全製品の得点（0〜10）を配列演算でまとめて計算します。
+    値が取得できなかった製品は 0 点です。
+    """
+    if "contains" in rule:
+        # 真偽値チェック: 対象項目の文字列にキーワードが含まれるか
+        keyword = unicodedata.normalize("NFKC", str(rule["contains"])).lower()
+        field = rule.get("field", "details")
+        hits = np.array(
+            [keyword in _text_of(p.get(field) if isinstance(p, dict) else None).lower() for p in products],
+            dtype=bool,
+        )
+        return np.where(hits, 10.0, 0.0)
+
+    column = _extract_column(products, rule)
+    valid = ~np.isnan(column)
+
+    if "threshold" in rule:
+        # 閾値以下なら満点、超えた分だけ比例して減点（価格など、小さいほど良い項目向け）
+        threshold = float(rule["threshold"])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(column <= threshold, 10.0, 10.0 * threshold / column)
+    else:
+        # 範囲・下限・上限チェック（例: M.2スロットが2つ以上）
+        ok = valid.copy()
+        if rule.get("min") is not None:
+            ok &= column >= float(rule["min"])
+        if rule.get("max") is not None:
+            ok &= column <= float(rule["max"])
+        scores = np.where(ok, 10.0, 0.0)
+
+    return np.where(valid, scores, 0.0)
+
+
+def score_products(products, scoring):
+    """
+    製品リスト全体を一括で評価し、各製品のスコアを NumPy 配列で返します。
+
+    引数:
+      products: 製品情報（辞書）のリスト
+      scoring: 評価設定。price: {weight, threshold} と rules: [...] を持つ辞書
+        rules の各要素:
+          field: 対象項目（既定: price）
+          pattern: 対象項目の文字列から数値を取り出す正規表現（最初のグループを使用）
+          weight: 重み
+          threshold: 閾値以下で満点・超えると比例して減点
+          min / max: 範囲・下限・上限を満たせば満点
+          contains: 対象項目にこの文字列が含まれれば満点
+
+    戻り値:
+      スコアの配列（products と同じ順序）
+    """
+    scores = np.zeros(len(products), dtype=float)
+    if not products:
+        return scores
+    for rule in _normalize_rules(scoring or {}):
+        weight = float(rule.get("weight", 0))
+        if weight == 0:
+            continue
+        scores += weight * _rule_scores(products, rule)
+    return scores
+
+
+def rank_products(products, scoring, top_n):
+    """
+    製品リストを評価し、スコア上位 top_n 件をスコアの高い順に返します。
+    各製品には 'score' キーにスコアを追加します（元の辞書は変更しません）。
+
+    引数:
+      products: 製品情報（辞書）のリスト
+      scoring: 評価設定（score_products を参照）
+      top_n: 返す件数
+
+    戻り値:
+      上位 top_n 件の製品情報のリスト
+    """
+    scores = score_products(products, scoring)
+    count = len(products)
+    if count == 0:
+        return []
+    k = count if top_n is None else max(0, min(int(top_n), count))
+    if k == 0:
+        return []
+    # 全件ソートせず、上位 k 件だけを選んでから並べ替える
+    top_indices = np.argpartition(-scores, k - 1)[:k] if k < count else np.arange(count)
+    top_indices = top_indices[np.argsort(-scores[top_indices], kind="stable")]
+    return [dict(products[i], score=round(float(scores[i]), 3)) for i in top_indices]
+
+
 def evaluate_product(product_info, criteria):
     """
     製品情報と評価基準に基づいて、製品の評価スコアを計算します。
     戻り値:
       float 型の評価スコア
     """
-    score = 0.0
-
-    # 価格評価
-    if 'price' in product_info and 'price' in criteria:
-        price_settings = criteria['price']
-        weight = price_settings.get('weight', 0)
-        threshold = price_settings.get('threshold', 0)
-        if product_info['price'] <= threshold:
-            score += weight * 10
-        else:
-            score += weight * (10 * threshold / product_info['price'])
-
-    return score 
\ No newline at end of file
+    return float(score_products([product_info], criteria)[0])
@@ -0,0 +1,302 @@
+# json_extract.py
+
+import json     # JSON形式のデータを扱うためのライブラリ
+import re  # 正規表現を扱うライブラリをインポートします
+
+
+_QUOTE_TRANSLATION = str.maketrans({"“": '"', "”": '"', "„": '"', "‘": "'", "’": "'"})
+_BARE_WORDS = {"None": "null", "True": "true", "False": "false", "NaN": "null"}
+_IDENTITY_KEYS = ("url", "product_name")
+
+_SPECIAL = re.compile(r"[\"'{}\[\]]")
+_QUOTED_SPECIAL = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+# 1つの候補として読む文字数の上限と、最後の要素を切り捨てて読み直す回数の上限
+_MAX_CANDIDATE_CHARS = 200000
+_MAX_REPAIR_PASSES = 5
+# 閉じていないまま文字列の終わりに達した候補（途中で切れた出力）を修正して読む回数の上限
+_MAX_TAIL_REPAIRS = 3
+# 読めなかった候補の中をさらに探す深さの上限（深く入れ子になった読めない括弧で時間がかからないようにする）
+_MAX_NESTED_SEARCH = 16
+_OPENING = re.compile(r"[{\[]")
+
+
+def _scan(text, start, stop=None):
+    """
+    text[start] の '{' または '[' に対応する閉じ括弧を、文字列リテラルを考慮して探します。
+
+    引数:
+      stop: 探す範囲の終わりの位置（省略時は text の終わり）。そこまでに閉じなければ閉じていないものとして扱います
+
+    戻り値:
+      (終端位置, 閉じているかどうか, 内側で閉じた値のうち最も外側のものの範囲のリスト, 閉じていない文字列の開始位置)。
+      閉じていない（途中で切れている）場合の終端位置は、対応しない閉じ括弧の直後か、探した範囲の終わりです
+    """
+    stop = len(text) if stop is None else min(len(text), stop)
+    stack = []
+    children = []
+    quote = None
+    quote_at = None
+    pos = start
+    while True:
+        # 文字列の中では引用符とエスケープだけ、外では括弧と引用符だけを見ればよいため、その位置まで読み飛ばす
+        match = (_QUOTED_SPECIAL[quote] if quote else _SPECIAL).search(text, pos, stop)
+        if match is None:
+            return stop, False, children, quote_at if quote else None
+        i = match.start()
+        ch = text[i]
+        pos = i + 1
+        if quote:
+            if ch == "\\":
+                pos = i + 2
+            else:
+                quote = None
+            continue
+        if ch in "\"'":
+            # 英文中のアポストロフィ（don't など）は文字列の開始とみなさない
+            if ch == "'" and i > 0 and text[i - 1].isalnum():
+                continue
+            quote = ch
+            quote_at = i
+        elif ch in "{[":
+            stack.append(("}" if ch == "{" else "]", i))
+        else:
+            if not stack or stack[-1][0] != ch:
+                return i + 1, False, children, None
+            _, opened_at = stack.pop()
+            if not stack:
+                return i + 1, True, children, None
+            # 外側の括弧が閉じていなくても中の値を探せるよう、閉じた範囲のうち最も外側のものを覚えておく
+            while children and children[-1][0] > opened_at:
+                children.pop()
+            children.append((opened_at, i + 1))
+
+
+def repair_json(text):
+    """
+    LLMの出力によくある崩れを修正したJSON文字列を返します。
+
+    - シングルクォートの文字列・Pythonの None / True / False
+    - 閉じ括弧の直前の余分なカンマ
+    - 途中で切れた文字列・オブジェクト・配列（閉じ括弧を補う）
+    """
+    text = text.translate(_QUOTE_TRANSLATION)
+    out = []
+    stack = []
+    quote = None
+    escaped = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(ch)
+            elif ch == "\\":
+                escaped = True
+                out.append(ch)
+            elif ch == quote:
+                quote = None
+                out.append('"')
+            elif ch == '"' and quote == "'":
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+        if ch in "\"'":
+            quote = ch
+            out.append('"')
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            out.append(ch)
+        elif ch in "}]":
+            _strip_trailing_comma(out)
+            if stack:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha():
+            match = re.match(r"\w+", text[i:])
+            word = match.group(0)
+            out.append(_BARE_WORDS.get(word, word))
+            i += len(word)
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    # 途中で切れている場合は、文字列と括弧を閉じる
+    if quote:
+        if escaped:
+            out.pop()
+        out.append('"')
+    _strip_trailing_comma(out)
+    _strip_dangling_colon(out)
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _strip_trailing_comma(out):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j:]
+
+
+def _strip_dangling_colon(out):
+    # {"key": で切れている場合は、値として null を補う
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ":":
+        out.append("null")
+
+
+def _loads_lenient(candidate):
+    """
+    JSONとしてそのまま読み、失敗した場合は修正してから読みます。
+    それでも失敗する場合は、最後の要素を切り捨てながら読める形を探します。読めなければ None を返します。
+    """
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        pass
+    repaired = repair_json(candidate)
+    for _ in range(_MAX_REPAIR_PASSES):
+        try:
+            return json.loads(repaired)
+        except ValueError:
+            pass
+        # {"a": 1, "b で切れた場合のように、最後の要素だけが壊れているものは、その要素を捨てて閉じ直す
+        cut = repaired.rstrip("}] \n\t").rfind(",")
+        if cut <= 0:
+            return None
+        repaired = repair_json(repaired[:cut])
+    return None
+
+
+def iter_json_values(text):
+    """
+    文字列中に含まれるJSONの値（オブジェクト・配列）を先頭から順に返します。
+    読めない候補は、その中で閉じている値だけを探してから候補の後ろへ進むため、壊れた外側のオブジェクトの中に
+    ある正しいオブジェクトも見つけつつ、同じ範囲を何度も修正し直すことはありません（文字数にほぼ比例する時間で終わります）。
+    """
+    if not text:
+        return
+    text = str(text)
+    tail_repairs = _MAX_TAIL_REPAIRS
+    # 探す範囲 (開始, 終わり, 深さ) のスタック。読めなかった候補の中の範囲を、候補より後ろの範囲より先に探す
+    ranges = [(0, len(text), 0)]
+    while ranges:
+        i, stop, depth = ranges.pop()
+        while True:
+            opening = _OPENING.search(text, i, stop)
+            if opening is None:
+                break
+            i = opening.start()
+            end, complete, children, open_quote = _scan(text, i, min(stop, i + _MAX_CANDIDATE_CHARS))
+            value = None
+            if complete or end < stop:
+                value = _loads_lenient(text[i:end])
+            elif end == len(text) and tail_repairs > 0:
+                # 文字列の終わりまで閉じていない候補は途中で切れた出力のことが多いが、修正は重いため回数を制限する
+                tail_repairs -= 1
+                value = _loads_lenient(text[i:end])
+            if isinstance(value, (dict, list)) and value:
+                yield value
+                i = end
+                continue
+            # 閉じていない引用符（インチの " など）で終わりまで読んだ場合は、その引用符の後ろから探し直す
+            i = open_quote + 1 if open_quote is not None else max(end, i + 1)
+            if children and depth < _MAX_NESTED_SEARCH:
+                ranges.append((i, stop, depth))
+                ranges.extend((start, end, depth + 1) for start, end in reversed(children))
+                break
+
+
+def _collect_products(value, products):
+    """
+    JSONの値から製品情報（URLか商品名を持つ辞書）を再帰的に取り出します。
+    """
+    if isinstance(value, list):
+        for item in value:
+            _collect_products(item, products)
+    elif isinstance(value, dict):
+        if any(value.get(key) for key in _IDENTITY_KEYS):
+            products.append(value)
+            return
+        for item in value.values():
+            if isinstance(item, (list, dict)):
+                _collect_products(item, products)
+
+
+def product_identity(product):
+    """
+    製品の重複判定に使うキー（URL、無ければ商品名）を返します。
+    """
+    return str(product.get("url") or product.get("product_name") or "")
+
+
+def extract_products(texts):
+    """
+    エージェントの最終出力や途中の抽出内容から、読み取れる製品情報をすべて取り出します。
+    同じ製品（同じURL）が複数回現れた場合は、空でない項目を後から現れたもので補います。
+
+    引数:
+      texts: 文字列、または文字列のリスト
+
+    戻り値:
+      製品情報（辞書）のリスト
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    merged = {}
+    for text in texts:
+        found = []
+        for value in iter_json_values(text):
+            _collect_products(value, found)
+        for product in found:
+            key = product_identity(product)
+            if key not in merged:
+                merged[key] = dict(product)
+                continue
+            for field, field_value in product.items():
+                if _is_missing(merged[key].get(field)) and not _is_missing(field_value):
+                    merged[key][field] = field_value
+    return list(merged.values())
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, (str, list, dict)) and len(value) == 0)
+
+
+def missing_fields(product, result_items):
+    """
+    result_items のキーのうち、製品情報に無い・空のものを返します。
+    """
+    keys = result_items.keys() if isinstance(result_items, dict) else (result_items or [])
+    return [key for key in keys if _is_missing(product.get(key))]
+
+
+def merge_fields(product, update):
+    """
+    product の空の項目を update の値で補った新しい辞書を返します。
+    """
+    merged = dict(product)
+    for field, value in update.items():
+        if _is_missing(merged.get(field)) and not _is_missing(value):
+            merged[field] = value
+    return merged
+
+
+def overwrite_fields(product, update):
+    """
+    product の項目を update の空でない値で上書きした新しい辞書を返します（取り直した値を優先する場合に使います）。
+    """
+    merged = dict(product)
+    for field, value in update.items():
+        if not _is_missing(value):
+            merged[field] = value
+    return merged
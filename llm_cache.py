@@ -0,0 +1,117 @@
+# llm_cache.py
+
+import hashlib  # キャッシュキーのハッシュ計算に使用
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import sqlite3  # キャッシュの永続化に使用
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+import tracing
+
+
+DEFAULT_MAX_SIZE_MB = 64
+
+
+class ResponseCache(BaseCache):
+    """
+    LLMの応答をディスクに保存する、内容アドレス方式のキャッシュです。
+
+    キーは LangChain が渡す llm_string（モデル名・temperature などのパラメータ）と
+    プロンプトのハッシュ値で、同じモデル・同じ設定・同じプロンプトの呼び出しには保存済みの応答を返します。
+    保存サイズの合計が max_size_mb を超えると、最後に参照された時刻が古いものから削除します（LRU）。
+
+    チャットモデルの cache 引数に渡して使用します（llm_factory.get_llm(..., use_response_cache=True)）。
+    """
+
+    def __init__(self, cache_dir, max_size_mb=DEFAULT_MAX_SIZE_MB):
+        """
+        引数:
+          cache_dir: キャッシュファイルを置くディレクトリ
+          max_size_mb: キャッシュ全体の上限サイズ（MB）
+        """
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "llm_responses.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " cache_key TEXT PRIMARY KEY,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, check_same_thread=False)
+
+    @staticmethod
+    def make_key(prompt, llm_string):
+        """
+        llm_string とプロンプトからキャッシュキーを生成します。
+        """
+        llm_hash = hashlib.sha256(llm_string.encode("utf-8")).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{llm_hash}:{prompt_hash}"
+
+    def lookup(self, prompt, llm_string):
+        key = self.make_key(prompt, llm_string)
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT response FROM responses WHERE cache_key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), key))
+        self.hits += 1
+        tracing.count("llm_cache_hits")
+        generations = [loads(generation) for generation in json.loads(row[0])]
+        for generation in generations:
+            # キャッシュから返した応答はトークンを消費していないため、計測でトークン数に数えないようにする
+            message = getattr(generation, "message", None)
+            if message is not None and getattr(message, "usage_metadata", None):
+                message.usage_metadata = None
+        return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = self.make_key(prompt, llm_string)
+        response = json.dumps([dumps(generation) for generation in return_val], ensure_ascii=False)
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, size, time.time()),
+            )
+            self._evict(conn)
+
+    def clear(self, **kwargs):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def _evict(self, conn):
+        """
+        合計サイズが上限を超えている間、最終参照時刻が古いエントリから削除します。
+        """
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute("SELECT cache_key, size FROM responses ORDER BY last_access ASC").fetchall()
+        for cache_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+            total -= size
+
+    def stats(self):
+        """
+        ヒット数・ミス数を辞書で返します。
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
@@ -1,43 +1,190 @@
+import asyncio  # 非同期処理を行うためのライブラリ
 import os
+import threading
+import weakref
 
+# (プラットフォーム, モデル, バリアント, 応答キャッシュ) ごとに作成済みのLLMインスタンスを保持し、
+# HTTPクライアント（コネクションプール）を呼び出し間で共有する
+# 非同期HTTPクライアントは作成時のイベントループに紐づくため、ループ内で作成したものはループごとに分けて保持する
+_llm_instances = {}
+_llm_instances_by_loop = weakref.WeakKeyDictionary()
+_llm_instances_lock = threading.Lock()
 
-def get_llm(ai_platform: str, model: str, variant: str = "genai"):
+# configure_response_cache で設定される応答キャッシュ（未設定の場合は None）
+_response_cache = None
+
+# configure_rate_limits で設定される、全LLM呼び出しで共有するスケジューラ（未設定の場合は None）
+_rate_limit_scheduler = None
+
+# register_llm_provider で登録された、プラットフォーム名ごとのLLM作成関数
+_llm_providers = {}
+
+
+def register_llm_provider(ai_platform, factory):
+    """
+    独自のプラットフォーム名に対して、LLMインスタンスを作成する関数を登録します（ベンチマーク用のモックモデルなど）。
+    登録したプラットフォーム名は組み込みのプラットフォームより優先されます。
+    作成済みのLLMインスタンスは破棄され、以降の get_llm で factory が使われます。
+
+    引数:
+      ai_platform: プラットフォーム名（例: 'mock'）
+      factory: factory(model, cache=..., callbacks=[...]) でチャットモデルのインスタンスを返す関数
+    """
+    with _llm_instances_lock:
+        _llm_providers[ai_platform.lower()] = factory
+        _llm_instances.clear()
+        _llm_instances_by_loop.clear()
+
+
+def configure_rate_limits(rate_limit_settings):
+    """
+    全LLM呼び出しで共有するレート制限スケジューラを設定します。settings.yaml の rate_limits を渡してください。
+    設定済みのLLMインスタンスは破棄され、以降の get_llm で新しいスケジューラを使うインスタンスが作成されます。
+
+    引数:
+      rate_limit_settings: rate_limits セクションの辞書（None または enabled: false で無効）
+
+    戻り値:
+      設定された RateLimitScheduler（無効の場合は None）
+    """
+    global _rate_limit_scheduler
+    scheduler = None
+    if rate_limit_settings and rate_limit_settings.get("enabled", True):
+        from rate_limiter import RateLimitScheduler
+        scheduler = RateLimitScheduler.from_settings(rate_limit_settings)
+    with _llm_instances_lock:
+        _rate_limit_scheduler = scheduler
+        _llm_instances.clear()
+        _llm_instances_by_loop.clear()
+    return scheduler
+
+
+def configure_response_cache(cache_settings):
+    """
+    LLM応答キャッシュを設定します。settings.yaml の cache.llm_responses を渡してください。
+    enabled が false の場合や cache_settings が None の場合はキャッシュを無効にします。
+
+    引数:
+      cache_settings: {'enabled': bool, 'dir': str, 'max_size_mb': int} 形式の辞書
+
+    戻り値:
+      設定された ResponseCache（無効の場合は None）
     """
-    共通のLLMインスタンスを作成するファクトリ関数です。
+    global _response_cache
+    if not cache_settings or not cache_settings.get("enabled", False):
+        _response_cache = None
+        return None
+
+    from llm_cache import ResponseCache, DEFAULT_MAX_SIZE_MB
+    _response_cache = ResponseCache(
+        cache_settings.get("dir", ".ec_compass_cache"),
+        max_size_mb=cache_settings.get("max_size_mb", DEFAULT_MAX_SIZE_MB),
+    )
+    return _response_cache
+
+
+def get_response_cache():
+    """
+    現在設定されている応答キャッシュを返します（未設定の場合は None）。
+    """
+    return _response_cache
+
+
+def get_llm(ai_platform: str, model: str, variant: str = "genai", use_response_cache: bool = False):
+    """
+    共通のLLMインスタンスを返すファクトリ関数です。
+    同じ (プラットフォーム, モデル, バリアント) の組み合わせには、作成済みのインスタンスを使い回します。
 
     引数:
       ai_platform: 使用するAIプラットフォームの名前（例: 'deepseek', 'google', 'openai'）
       model: 使用するモデル名
       variant: googleプラットフォームの場合のバリアント（例: 'genai' を指定すると ChatGoogleGenerativeAI を利用し、指定しない場合は ChatVertexAI を利用）
+      use_response_cache: True の場合、configure_response_cache で設定した応答キャッシュを使用します
 
     戻り値:
       作成されたLLMインスタンス
     """
     platform = ai_platform.lower()
+    cache = _response_cache if use_response_cache else None
+    key = (platform, model, variant, id(cache) if cache is not None else None)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _llm_instances_lock:
+        if loop is None:
+            instances = _llm_instances
+        else:
+            instances = _llm_instances_by_loop.setdefault(loop, {})
+        llm = instances.get(key)
+        if llm is None:
+            llm = _create_llm(platform, model, variant, cache)
+            instances[key] = llm
+    return llm
+
+
+def _create_llm(platform: str, model: str, variant: str, cache):
+    """
+    LLMインスタンスを新規に作成します。
+    """
+    # 応答キャッシュを使わない場合は cache=False を渡し、グローバルキャッシュの影響も受けないようにする
+    # トークン数・推定コストの計測用コールバックは常に登録する（計測が無効な場合は何もしない）
+    from tracing import make_usage_callback
+    cache_option = {"cache": cache if cache is not None else False, "callbacks": [make_usage_callback(model)]}
+
+    if platform in _llm_providers:
+        return _llm_providers[platform](model, **cache_option)
 
     if platform == "deepseek":
         from langchain_openai import ChatOpenAI
         base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
         api_key = os.getenv("DEEPSEEK_API_KEY")
         extra = {"base_url": base_url} if base_url else {}
-        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7, **extra)
+        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7, **extra, **cache_option,
+                          **_openai_http_clients(platform, model))
 
     elif platform == "google":
         api_key = os.getenv("GOOGLE_API_KEY")
+        extra = {}
+        if _rate_limit_scheduler is not None:
+            from rate_limiter import make_rate_limiter
+            extra["rate_limiter"] = make_rate_limiter(_rate_limit_scheduler, platform, model)
         if variant == "genai":
             from langchain_google_genai import ChatGoogleGenerativeAI
-            return ChatGoogleGenerativeAI(model=model, api_key=api_key, temperature=0.7)
+            return ChatGoogleGenerativeAI(model=model, api_key=api_key, temperature=0.7, **cache_option, **extra)
         else:
             from langchain_google_vertexai import ChatVertexAI
-            return ChatVertexAI(model=model, api_key=api_key, temperature=0.7)
+            return ChatVertexAI(model=model, api_key=api_key, temperature=0.7, **cache_option, **extra)
 
     elif platform == "openai":
         from langchain_openai import ChatOpenAI
         api_key = os.getenv("OPENAI_API_KEY")
-        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7)
+        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7, **cache_option,
+                          **_openai_http_clients(platform, model))
 
     else:
         # デフォルトはOpenAIを使用
         from langchain_openai import ChatOpenAI
         api_key = os.getenv("OPENAI_API_KEY")
-        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7) 
\ No newline at end of file
+        return ChatOpenAI(model=model, api_key=api_key, temperature=0.7, **cache_option,
+                          **_openai_http_clients("openai", model))
+
+
+def _openai_http_clients(platform: str, model: str):
+    """
+    レート制限スケジューラが設定されている場合、OpenAI互換APIのリクエストが必ずスケジューラを通るよう
+    専用のトランスポートを持つHTTPクライアントを返します（ChatOpenAI の引数として展開して使用）。
+    """
+    if _rate_limit_scheduler is None:
+        return {}
+    import httpx
+    from rate_limiter import RateLimitedTransport, RateLimitedAsyncTransport
+    # openai SDK の既定値と同じく、接続は短く・応答待ちは長く取る
+    timeout = httpx.Timeout(600.0, connect=5.0)
+    return {
+        "http_client": httpx.Client(
+            transport=RateLimitedTransport(_rate_limit_scheduler, platform, model), timeout=timeout),
+        "http_async_client": httpx.AsyncClient(
+            transport=RateLimitedAsyncTransport(_rate_limit_scheduler, platform, model), timeout=timeout),
+    }
@@ -1,8 +1,13 @@
 # main.py
 import argparse  # コマンドライン引数を扱うためのライブラリ
+import os
+import time
 from config_loader import load_config  # 設定ファイルを読み込むモジュール
-from scraper import scrape_data  # 製品情報を収集するモジュール
-from report import generate_report  # レポート生成モジュール（旧ai_report_generator）
+from scrape_cache import ScrapeCache  # スクレイピング結果のキャッシュ
+from product_store import ProductStore  # 製品情報・価格の履歴
+from checkpoint import RunCheckpoint  # サイト・製品ごとの途中経過の保存
+from llm_factory import configure_response_cache, configure_rate_limits  # LLM応答キャッシュ・レート制限の設定
+import tracing  # 処理区間ごとの時間・トークン数・推定コストの計測
 from dotenv import load_dotenv  # .env ファイルから環境変数を読み込むためのライブラリ
 
 
@@ -11,38 +16,121 @@ def main():
     EC Compassのエントリーポイント。
     設定ファイルからデータを読み込み、各ECサイトからBrowser-Useを使って製品情報を取得し、
     その全情報を基に評価基準に従ったレポートを生成します。
+    --batch を指定した場合は、ジョブファイルの各行を設定ファイルへの上書きとして、複数の比較をまとめて実行します。
+    --scrape-only では製品情報の取得だけを、--report-only では保存済みの製品情報からレポートの生成だけを実行します。
+    --serve を指定した場合は、HTTP APIで比較ジョブを受け付けるサービスとして起動し、Ctrl+C で停止するまで実行し続けます。
+
+    起動を速くするため、Browser-Use・LangChain などの重いライブラリは、それを使う処理の直前に読み込みます。
     """
     load_dotenv()  # .envファイルから環境変数をロード
 
     # コマンドライン引数の設定
     parser = argparse.ArgumentParser(description='EC Compass - 製品比較CLIツール')
     parser.add_argument('--config', type=str, default='settings.yaml', help='設定ファイルのパス (YAML形式)')
+    parser.add_argument('--refresh', action='store_true', help='キャッシュを読まずに再取得し、結果でキャッシュを更新する')
+    parser.add_argument('--no-cache', action='store_true', help='スクレイピング結果・LLM応答のキャッシュを読み書きしない')
+    parser.add_argument('--resume', type=str, metavar='RUN_ID', help='指定した実行IDの途中経過から再開する（取得済みのサイト・製品をスキップ）')
+    parser.add_argument('--stream', action='store_true', help='レポートを生成しながら端末と report.md に逐次出力する')
+    parser.add_argument('--incremental', action='store_true', help='既知の商品は価格だけを再確認し、口コミ・詳細情報は新しい商品と古くなった商品だけ取得する')
+    parser.add_argument('--batch', type=str, metavar='JOBS_JSONL', help='ジョブファイル（1行1ジョブの上書き設定）の比較をまとめて実行する')
+    parser.add_argument('--batch-output', type=str, metavar='DIR', help='バッチ実行の出力先ディレクトリ（省略時は batch.output_dir）')
+    parser.add_argument('--workers', type=int, help='バッチ実行・サービスで同時に実行するジョブ数（省略時は batch.workers / service.workers）')
+    parser.add_argument('--scrape-only', action='store_true', help='製品情報の取得だけを実行し、レポートを生成しない')
+    parser.add_argument('--report-only', action='store_true', help='製品情報を取得せず、保存済みの製品情報からレポートだけを生成する')
+    parser.add_argument('--from-file', type=str, metavar='PATH', help='--report-only で読み込む製品情報のファイル（省略時は scraped_data.json。指定すると --report-only を含む）')
+    parser.add_argument('--serve', action='store_true', help='HTTP APIで比較ジョブを受け付けるサービスとして起動する（ブラウザ・LLMクライアントを起動したまま使い回す）')
+    parser.add_argument('--host', type=str, help='サービスが待ち受けるアドレス（省略時は service.host）')
+    parser.add_argument('--port', type=int, help='サービスが待ち受けるポート（省略時は service.port）')
     args = parser.parse_args()
+    if args.from_file:
+        args.report_only = True
+    if args.scrape_only and args.report_only:
+        parser.error('--scrape-only と --report-only（--from-file）は同時に指定できません')
+    if args.batch and (args.scrape_only or args.report_only):
+        parser.error('--batch と --scrape-only / --report-only は同時に指定できません')
+    if args.resume and args.report_only:
+        parser.error('--resume と --report-only は同時に指定できません')
+    if args.serve and (args.batch or args.scrape_only or args.report_only or args.resume):
+        parser.error('--serve と --batch / --scrape-only / --report-only / --resume は同時に指定できません')
 
     # 設定ファイルの読み込み
+    config_started_at = time.perf_counter()
     config = load_config(args.config)
+    config_load_time = time.perf_counter() - config_started_at
+
+    # 全LLM呼び出しで共有するレート制限スケジューラの設定
+    configure_rate_limits(config.get('rate_limits'))
 
-    # 製品情報の取得
-    search_params = config.get('search_parameters', {})
-    websites = search_params.get('websites', [])
-    all_products = scrape_data(websites, search_params)
-    print('debug:')
-    print(all_products)
+    # キャッシュの設定
+    cache_settings = config.get('cache', {}) or {}
+    response_cache = None if args.no_cache else configure_response_cache(cache_settings.get('llm_responses'))
+    if args.report_only:
+        # レポートだけを生成する場合は、スクレイピング結果のキャッシュも製品情報の履歴も使わない
+        scrape_cache = None
+        product_store = None
+    else:
+        scrape_cache = None if args.no_cache else ScrapeCache.from_settings(cache_settings, refresh=args.refresh)
+        product_store = ProductStore.from_settings(config.get('product_store'), incremental=True if args.incremental else None)
 
-    # レポート生成設定の取得
-    top_n = config.get('top_n', 5)
-    ai_platform = config.get('ai_platform', 'openai')
-    report_model = config.get('report_model', 'gpt-4o-mini')
+    if args.serve:
+        import service  # HTTP APIで比較ジョブを受け付けるサービス
+        service_output = (config.get('service', {}) or {}).get('output_dir', service.DEFAULT_OUTPUT_DIR)
+        trace_path = os.path.join(service_output, 'trace.jsonl')
+    elif args.batch:
+        from batch import run_batch, DEFAULT_OUTPUT_DIR  # ジョブファイルによるバッチ実行
+        batch_output = args.batch_output or (config.get('batch', {}) or {}).get('output_dir', DEFAULT_OUTPUT_DIR)
+        trace_path = os.path.join(batch_output, 'trace.jsonl')
+    else:
+        runs_dir = config.get('checkpoint', {}).get('dir', 'runs')
+        checkpoint = RunCheckpoint.resume(args.resume, runs_dir) if args.resume else RunCheckpoint(runs_dir=runs_dir)
+        if args.report_only:
+            print(f'実行ID: {checkpoint.run_id}')
+        else:
+            print(f'実行ID: {checkpoint.run_id}（失敗した場合は --resume {checkpoint.run_id} で続きから再開できます）')
+        trace_path = os.path.join(checkpoint.path, 'trace.jsonl')
 
-    # レポート生成
-    report = generate_report(all_products, config.get('criteria', {}), top_n, report_model=report_model, ai_platform=ai_platform)
+    # 計測の設定（トレースは実行ディレクトリ、バッチ実行では出力先ディレクトリに保存）
+    tracer = tracing.configure_tracing(config.get('tracing'), trace_path)
 
-    # 生成されたレポートの保存
-    with open('report.md', 'w', encoding='utf-8') as f:
-        f.write(report)
+    if args.serve:
+        mode = 'serve'
+    elif args.batch:
+        mode = 'batch'
+    elif args.scrape_only:
+        mode = 'scrape_only'
+    elif args.report_only:
+        mode = 'report_only'
+    else:
+        mode = 'single'
+    with tracing.span('run', mode=mode):
+        tracing.record_span('config.load', config_load_time)
+        if args.serve:
+            service.serve(config, host=args.host, port=args.port, output_dir=service_output, workers=args.workers,
+                          scrape_cache=scrape_cache, product_store=product_store)
+        elif args.batch:
+            run_batch(args.batch, config, scrape_cache=scrape_cache, output_dir=batch_output, workers=args.workers,
+                      product_store=product_store)
+        elif args.scrape_only:
+            from comparison import scrape_products  # 製品情報の取得
+            scrape_products(config, scrape_cache=scrape_cache, checkpoint=checkpoint, product_store=product_store)
+        elif args.report_only:
+            from comparison import load_scraped_data, write_report  # 保存済みの製品情報からのレポート生成
+            from_file = args.from_file or 'scraped_data.json'
+            with tracing.span('load_products'):
+                all_products = load_scraped_data(from_file)
+            print(f'{from_file} の製品情報からレポートを生成します。')
+            write_report(all_products, config, stream=args.stream)
+        else:
+            from comparison import run_comparison  # 製品情報の取得からレポート生成までの一連の処理
+            run_comparison(config, scrape_cache=scrape_cache, checkpoint=checkpoint, stream=args.stream,
+                           product_store=product_store)
 
-    print('OpenAIが生成したレポートが report.md に保存されました。')
+    if response_cache is not None:
+        stats = response_cache.stats()
+        print(f"LLM応答キャッシュ: ヒット {stats['hits']} 件 / ミス {stats['misses']} 件")
+    if tracer is not None:
+        tracer.print_summary()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
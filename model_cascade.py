@@ -0,0 +1,196 @@
+# model_cascade.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+import os
+import sqlite3  # 記録の永続化に使用
+import time
+from urllib.parse import urlparse
+
+import tracing
+
+
+DEFAULT_DIR = ".ec_compass_cache"
+DEFAULT_RECHECK_AFTER = 604800
+
+# ドメインが分からないタスク（複数サイトをまとめて巡回するエージェントなど）の記録に使うキー
+ANY_DOMAIN = "*"
+
+
+class StepBudgetExceeded(Exception):
+    """
+    エージェントがステップ数の上限（max_steps）までに完了しなかったことを表す例外です。
+    """
+
+
+def site_domain(site):
+    """
+    サイト情報（またはURL）から、段階の記録に使うドメイン名を返します。
+    """
+    url = site.get("url", "") if isinstance(site, dict) else str(site or "")
+    parsed = urlparse(url)
+    return (parsed.netloc or parsed.path).lower() or ANY_DOMAIN
+
+
+def _tier_key(tier):
+    # 設定の順序を入れ替えても記録が別の段階を指さないよう、段階はモデルと vision の組で識別する
+    return f"{tier['ai_platform']}/{tier['search_model']}/vision={bool(tier['use_vision'])}"
+
+
+class TierStore:
+    """
+    ドメインごとに、最後に成功した段階（モデルと vision の組）を SQLite に記録します。
+    """
+
+    def __init__(self, store_dir=DEFAULT_DIR):
+        os.makedirs(store_dir, exist_ok=True)
+        self.path = os.path.join(store_dir, "model_tiers.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS model_tiers ("
+                " domain TEXT PRIMARY KEY,"
+                " tier_key TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def get(self, domain):
+        """
+        記録があれば (段階のキー, 記録した時刻) を、無ければ None を返します。
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT tier_key, updated_at FROM model_tiers WHERE domain = ?", (domain,)).fetchone()
+        return row
+
+    def record(self, domain, tier_key):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO model_tiers (domain, tier_key, updated_at) VALUES (?, ?, ?)",
+                (domain, tier_key, time.time())
+            )
+
+
+class ModelCascade:
+    """
+    エージェントのタスクを、安いモデル・テキストのみの段階から順に試し、失敗した場合だけ
+    vision や強いモデルの段階に切り替えます（settings.yaml の browser_settings.model_cascade）。
+
+    次の場合に失敗とみなして、次の段階を試します。
+      - 最終出力から製品情報を読み取れない、または必要な項目が欠けている（validate が False を返す）
+      - 段階の timeout 秒以内に終わらない
+      - 段階の max_steps までに完了しない、またはエージェントの実行が例外で終わる
+
+    成功した段階はドメインごとに記録し、次回からはその段階から始めます。
+    記録から recheck_after 秒が経つと、安い段階で足りるようになっていないか最初の段階から試し直します。
+    """
+
+    def __init__(self, tiers, store=None, recheck_after=DEFAULT_RECHECK_AFTER):
+        """
+        引数:
+          tiers: {'ai_platform', 'search_model', 'use_vision', 'max_steps', 'timeout'} の辞書のリスト（試す順）
+          store: 成功した段階の記録先（TierStore）。None の場合は記録しません
+          recheck_after: 記録を使う期間（秒）
+        """
+        self.tiers = tiers
+        self.store = store
+        self.recheck_after = recheck_after
+
+    @classmethod
+    def from_settings(cls, cascade_settings, search_model, ai_platform, use_vision):
+        """
+        model_cascade セクションから作成します。enabled が false の場合や段階が無い場合は None を返します。
+        段階で省略した ai_platform / search_model / use_vision は search_parameters の値を使います。
+        """
+        cascade_settings = cascade_settings or {}
+        if not cascade_settings.get("enabled", False) or not cascade_settings.get("tiers"):
+            return None
+        tiers = [
+            {
+                "ai_platform": tier.get("ai_platform", ai_platform),
+                "search_model": tier.get("search_model", search_model),
+                "use_vision": tier.get("use_vision", use_vision),
+                "max_steps": tier.get("max_steps"),
+                "timeout": tier.get("timeout"),
+            }
+            for tier in cascade_settings["tiers"]
+        ]
+        store = TierStore(cascade_settings.get("dir", DEFAULT_DIR)) if cascade_settings.get("remember", True) else None
+        return cls(tiers, store, cascade_settings.get("recheck_after", DEFAULT_RECHECK_AFTER))
+
+    def start_tier(self, domain):
+        """
+        domain のタスクを始める段階の番号を返します。
+        """
+        if self.store is None:
+            return 0
+        try:
+            recorded = self.store.get(domain)
+        except sqlite3.Error as e:
+            print("モデルの段階の記録を読み込めませんでした。エラー:", e)
+            return 0
+        if recorded is None or time.time() - recorded[1] > self.recheck_after:
+            return 0
+        keys = [_tier_key(tier) for tier in self.tiers]
+        return keys.index(recorded[0]) if recorded[0] in keys else 0
+
+    def _record(self, domain, index):
+        if self.store is None:
+            return
+        try:
+            self.store.record(domain, _tier_key(self.tiers[index]))
+        except sqlite3.Error as e:
+            print("モデルの段階を記録できませんでした。エラー:", e)
+
+    async def run(self, domain, run_tier, validate):
+        """
+        段階を順に試し、validate を通った最初の結果を返します。
+
+        引数:
+          domain: 段階を記録するドメイン名（site_domain の戻り値）
+          run_tier: run_tier(tier) で段階の設定を受け取り、エージェントを実行して結果文字列を返すコルーチン関数
+          validate: validate(result_str) で結果から必要な製品情報を読み取れるかを返す関数
+
+        戻り値:
+          結果文字列。どの段階も validate を通らなかった場合は最後に得られた結果を返し、
+          結果が1つも得られなかった場合は最後の段階の例外を送出します
+        """
+        start = self.start_tier(domain)
+        last_result = None
+        last_error = None
+        for index in range(start, len(self.tiers)):
+            tier = self.tiers[index]
+            label = f"{tier['search_model']}{'（vision）' if tier['use_vision'] else ''}"
+            if index > start:
+                print(f"{domain}: 次の段階（{label}）で再実行します。")
+                tracing.count("cascade_escalations")
+            with tracing.span("cascade.tier", domain=domain, tier=index, model=tier["search_model"],
+                              use_vision=tier["use_vision"]) as tier_span:
+                try:
+                    if tier.get("timeout"):
+                        result = await asyncio.wait_for(run_tier(tier), tier["timeout"])
+                    else:
+                        result = await run_tier(tier)
+                except Exception as e:
+                    if isinstance(e, asyncio.TimeoutError):
+                        print(f"{domain}: {label} が {tier['timeout']} 秒でタイムアウトしました。")
+                    elif isinstance(e, StepBudgetExceeded):
+                        print(f"{domain}: {label} が {tier['max_steps']} ステップで完了しませんでした。")
+                    else:
+                        print(f"{domain}: {label} の実行に失敗しました。エラー:", e)
+                    if tier_span is not None:
+                        tier_span.set_attribute("outcome", type(e).__name__)
+                    last_error = e
+                    continue
+                if validate(result):
+                    if tier_span is not None:
+                        tier_span.set_attribute("outcome", "ok")
+                    self._record(domain, index)
+                    return result
+                print(f"{domain}: {label} の出力から必要な製品情報を読み取れませんでした。")
+                if tier_span is not None:
+                    tier_span.set_attribute("outcome", "invalid")
+                last_result = result
+        if last_result is not None:
+            return last_result
+        raise last_error
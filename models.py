@@ -0,0 +1,307 @@
+# models.py
+
+import json     # JSON形式のデータを扱うためのライブラリ
+import math
+import re  # 正規表現を扱うライブラリをインポートします
+import unicodedata
+
+from evaluator import parse_price
+from reviews import format_review_summary
+
+
+DEFAULT_CURRENCY = "JPY"
+DEFAULT_PROMPT_STYLE = "text"
+DEFAULT_MAX_REVIEWS = 3
+DEFAULT_REVIEW_CHARS = 200
+DEFAULT_DETAILS_CHARS = 600
+
+# 価格表記から通貨を判定するための記号・略称（先に一致したものを使う）
+_CURRENCY_MARKS = (
+    ("JPY", ("円", "¥", "￥", "jpy")),
+    ("USD", ("us$", "$", "usd", "ドル")),
+    ("EUR", ("€", "eur", "ユーロ")),
+    ("CNY", ("元", "cny", "rmb")),
+)
+_CURRENCY_LABELS = {"JPY": "円"}
+
+# 製品の項目として扱うキー。これ以外のキーは extra にまとめる
+_FIELDS = ("site_name", "product_name", "price", "url", "manufacturer_url", "reviews", "review_summary", "details", "offers",
+           "score")
+
+# 箇条書きの記号・番号。番号は「4.5 (22件)」のような評価と区別するため、後ろに空白があるものだけを記号とみなす
+_REVIEW_BULLET = re.compile(r"^\s*(?:[-・*•]\s*|\d+[.)]\s+)")
+# 値が無いことを表す表記（エージェントが空欄の代わりに出力するもの）
+_MISSING_TEXTS = {"n/a", "na", "none", "null", "不明", "なし", "-"}
+
+
+def _clean_text(value):
+    text = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", str(value))).strip()
+    return "" if text.lower() in _MISSING_TEXTS else text
+
+
+def parse_currency(value, default=DEFAULT_CURRENCY):
+    """
+    価格の表記（'¥23,980' / '$199.99' など）から通貨コードを返します。数値だけの場合は default を返します。
+    """
+    if isinstance(value, str):
+        text = value.lower()
+        for code, marks in _CURRENCY_MARKS:
+            if any(mark in text for mark in marks):
+                return code
+    return default
+
+
+def _price_number(value):
+    price = parse_price(value)
+    if price is None or math.isnan(price):
+        return None
+    return int(price) if float(price).is_integer() else float(price)
+
+
+def normalize_reviews(value):
+    """
+    口コミ（文字列・文字列のリスト・辞書のリスト）を、空白を詰めた文字列のタプルに正規化します。
+    1つの文字列に複数の口コミが改行や箇条書きで入っている場合は、行ごとに分けます。
+    """
+    if value is None or value == "":
+        return ()
+    if isinstance(value, str):
+        items = value.splitlines() if "\n" in value else [value]
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = [value]
+    reviews = []
+    for item in items:
+        if isinstance(item, dict):
+            item = " ".join(_clean_text(v) for v in item.values() if v not in (None, ""))
+        text = _REVIEW_BULLET.sub("", _clean_text(item)) if item is not None else ""
+        if text:
+            reviews.append(text)
+    return tuple(reviews)
+
+
+def normalize_details(value):
+    """
+    詳細情報（文字列・辞書・リスト）を1つの文字列にまとめます。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, dict):
+        return "; ".join(f"{k}: {_clean_text(v)}" for k, v in value.items() if v not in (None, ""))
+    if isinstance(value, (list, tuple)):
+        return "; ".join(_clean_text(v) for v in value if v not in (None, ""))
+    return _clean_text(value)
+
+
+class Offer:
+    """
+    同じ製品の、サイトごとの価格とURLです（dedup で統合した製品の offers）。
+    """
+
+    __slots__ = ("site_name", "price", "currency", "url")
+
+    def __init__(self, site_name="", price=None, currency=DEFAULT_CURRENCY, url=""):
+        self.site_name = site_name
+        self.price = price
+        self.currency = currency
+        self.url = url
+
+    @classmethod
+    def from_dict(cls, offer, default_currency=DEFAULT_CURRENCY):
+        raw_price = offer.get("price")
+        return cls(
+            site_name=str(offer.get("site_name") or ""),
+            price=_price_number(raw_price),
+            currency=parse_currency(raw_price, default_currency),
+            url=str(offer.get("url") or ""),
+        )
+
+    def to_dict(self):
+        return {"site_name": self.site_name, "price": self.price, "currency": self.currency, "url": self.url}
+
+
+class Product:
+    """
+    1件の製品情報です。価格は数値（変換できなければ None）、口コミは文字列のタプル、詳細情報は1つの文字列に
+    正規化して保持します。result_items にあるその他の項目は extra に入ります。
+
+    scraper・キャッシュ・dedup は JSON で保存する辞書のまま扱い、レポート生成の前に from_dict で変換します。
+    """
+
+    __slots__ = ("site_name", "product_name", "price", "currency", "url", "manufacturer_url", "reviews",
+                 "review_summary", "details", "offers", "score", "extra")
+
+    def __init__(self, site_name="", product_name="", price=None, currency=DEFAULT_CURRENCY, url="",
+                 manufacturer_url="", reviews=(), details="", offers=(), score=None, extra=None, review_summary=None):
+        self.site_name = site_name
+        self.product_name = product_name
+        self.price = price
+        self.currency = currency
+        self.url = url
+        self.manufacturer_url = manufacturer_url
+        self.reviews = reviews
+        # 口コミをファイルに書き出して集計した場合の集計結果（reviews.ReviewCollector.apply）
+        self.review_summary = review_summary
+        self.details = details
+        self.offers = offers
+        self.score = score
+        self.extra = extra
+
+    @classmethod
+    def from_dict(cls, product, default_currency=DEFAULT_CURRENCY):
+        """
+        scraper が返す製品情報（辞書）から Product を作成します。
+        """
+        raw_price = product.get("price")
+        extra = {k: v for k, v in product.items() if k not in _FIELDS and v not in (None, "", [], {})}
+        return cls(
+            site_name=str(product.get("site_name") or ""),
+            product_name=_clean_text(product.get("product_name") or ""),
+            price=_price_number(raw_price),
+            currency=parse_currency(raw_price, default_currency),
+            url=_clean_text(product.get("url") or ""),
+            manufacturer_url=_clean_text(product.get("manufacturer_url") or ""),
+            reviews=normalize_reviews(product.get("reviews")),
+            review_summary=product.get("review_summary") if isinstance(product.get("review_summary"), dict) else None,
+            details=normalize_details(product.get("details")),
+            offers=tuple(Offer.from_dict(o, default_currency) for o in product.get("offers") or () if isinstance(o, dict)),
+            score=product.get("score"),
+            extra=extra or None,
+        )
+
+    def to_dict(self):
+        product = {
+            "site_name": self.site_name,
+            "product_name": self.product_name,
+            "price": self.price,
+            "currency": self.currency,
+            "url": self.url,
+            "manufacturer_url": self.manufacturer_url,
+            "reviews": list(self.reviews),
+            "details": self.details,
+        }
+        if self.review_summary:
+            product["review_summary"] = self.review_summary
+        if self.offers:
+            product["offers"] = [offer.to_dict() for offer in self.offers]
+        if self.score is not None:
+            product["score"] = self.score
+        if self.extra:
+            product.update(self.extra)
+        return product
+
+
+def products_from_results(product_results, default_currency=DEFAULT_CURRENCY):
+    """
+    scrape_data の結果（{'results': [...]} または製品のリスト）を Product のリストに変換します。
+    製品のリストとして読めない結果（パースできなかった文字列など）の場合は None を返します。
+    """
+    if isinstance(product_results, dict) and isinstance(product_results.get("results"), list):
+        items = product_results["results"]
+    elif isinstance(product_results, list):
+        items = product_results
+    else:
+        return None
+    products = []
+    for item in items:
+        if isinstance(item, Product):
+            products.append(item)
+        elif isinstance(item, dict):
+            products.append(Product.from_dict(item, default_currency))
+        else:
+            products.append(Product(details=normalize_details(item)))
+    return products
+
+
+def _truncate(text, limit):
+    if limit is None or limit < 0 or len(text) <= limit:
+        return text
+    return text[:max(0, limit - 1)] + "…"
+
+
+def _format_price(price, currency):
+    if price is None:
+        return "不明"
+    label = _CURRENCY_LABELS.get(currency)
+    amount = f"{price:,}" if isinstance(price, int) else f"{price:,.2f}"
+    return f"{amount}{label}" if label else f"{amount} {currency}"
+
+
+class PromptFormat:
+    """
+    製品情報をプロンプトに埋め込むときの形式と省略の設定です（settings.yaml の reporting.prompt）。
+
+      style: 'text'（項目名付きの簡潔なテキスト）または 'json'（空の項目を省いた1行のJSON）
+      max_reviews: 1製品あたりの口コミの件数の上限（-1: 全件）
+      review_chars / details_chars: 口コミ1件・詳細情報の文字数の上限（-1: 省略しない）
+    """
+
+    __slots__ = ("style", "max_reviews", "review_chars", "details_chars")
+
+    def __init__(self, style=DEFAULT_PROMPT_STYLE, max_reviews=DEFAULT_MAX_REVIEWS, review_chars=DEFAULT_REVIEW_CHARS,
+                 details_chars=DEFAULT_DETAILS_CHARS):
+        self.style = style
+        self.max_reviews = max_reviews
+        self.review_chars = review_chars
+        self.details_chars = details_chars
+
+    @classmethod
+    def from_settings(cls, prompt_settings):
+        prompt_settings = prompt_settings or {}
+        return cls(
+            style=prompt_settings.get("style", DEFAULT_PROMPT_STYLE),
+            max_reviews=prompt_settings.get("max_reviews", DEFAULT_MAX_REVIEWS),
+            review_chars=prompt_settings.get("review_chars", DEFAULT_REVIEW_CHARS),
+            details_chars=prompt_settings.get("details_chars", DEFAULT_DETAILS_CHARS),
+        )
+
+    def reviews_of(self, product):
+        reviews = product.reviews if self.max_reviews < 0 else product.reviews[:self.max_reviews]
+        return [_truncate(review, self.review_chars) for review in reviews]
+
+    def format_product(self, product, index):
+        """
+        1製品分の文字列を返します。
+        """
+        if self.style == "json":
+            return json.dumps(self._compact_dict(product), ensure_ascii=False, separators=(",", ":"))
+        # 1行目は「[番号] 商品名 | 価格 | サイト名 | URL」。それ以外の項目は値がある場合だけ項目名付きで続ける
+        header = [f"[{index}] {product.product_name or '(商品名不明)'}", _format_price(product.price, product.currency),
+                  product.site_name or "不明"]
+        lines = [" | ".join(header + ([product.url] if product.url else []))]
+        if product.manufacturer_url:
+            lines.append(f"公式: {product.manufacturer_url}")
+        if product.score is not None:
+            lines.append(f"スコア: {product.score}")
+        if product.offers:
+            lines.append("offers: " + " | ".join(
+                f"{offer.site_name} {_format_price(offer.price, offer.currency)} {offer.url}".rstrip()
+                for offer in product.offers))
+        if product.details:
+            lines.append("詳細: " + _truncate(product.details, self.details_chars))
+        if product.review_summary:
+            lines.append("口コミ集計: " + format_review_summary(product.review_summary))
+        reviews = self.reviews_of(product)
+        if reviews:
+            lines.append("口コミ: " + " / ".join(reviews))
+        for key, value in (product.extra or {}).items():
+            lines.append(f"{key}: {_truncate(normalize_details(value), self.details_chars)}")
+        return "\n".join(lines)
+
+    def _compact_dict(self, product):
+        compact = product.to_dict()
+        compact["details"] = _truncate(product.details, self.details_chars)
+        compact["reviews"] = self.reviews_of(product)
+        if product.review_summary:
+            # 口コミ全件のファイルの場所はレポートには不要
+            compact["review_summary"] = {k: v for k, v in product.review_summary.items() if k != "file"}
+        if product.currency == DEFAULT_CURRENCY:
+            compact.pop("currency")
+        return {k: v for k, v in compact.items() if v not in (None, "", [], {})}
+
+    def format_products(self, products):
+        """
+        製品のリストを、プロンプトに埋め込む文字列にします。
+        """
+        return "\n".join(self.format_product(product, index) for index, product in enumerate(products, 1))
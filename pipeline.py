@@ -0,0 +1,112 @@
+# pipeline.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+
+import tracing
+
+
+DEFAULT_QUEUE_SIZE = 10
+
+# ワーカーに入力の終わりを知らせる目印
+_DONE = object()
+
+
+class Stage:
+    """
+    パイプラインの1段階です。handler(item) は前の段階から受け取った1件を処理し、次の段階へ渡すもののリストを返します。
+
+    各段階は concurrency 個のワーカーで並行に処理し、1件の処理が timeout 秒を超えると打ち切ります。
+    handler が失敗（タイムアウトを含む）した場合は on_error(item, error) の戻り値を次の段階へ渡します
+    （on_error が無ければその1件を捨てます）。
+    """
+
+    def __init__(self, name, handler, concurrency=1, timeout=None, on_error=None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.on_error = on_error
+
+    async def process(self, item):
+        try:
+            with tracing.span(f"pipeline.{self.name}"):
+                if self.timeout:
+                    return await asyncio.wait_for(self.handler(item), self.timeout) or []
+                return await self.handler(item) or []
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                print(f"{self.name} 段階の処理が {self.timeout} 秒でタイムアウトしました。")
+            else:
+                print(f"{self.name} 段階の処理に失敗しました。エラー:", e)
+            if self.on_error is None:
+                return []
+            try:
+                return self.on_error(item, e) or []
+            except Exception as error:
+                print(f"{self.name} 段階の失敗時の処理に失敗しました。エラー:", error)
+                return []
+
+
+async def run_pipeline(items, stages, queue_size=DEFAULT_QUEUE_SIZE, on_result=None):
+    """
+    items を最初の段階に流し、各段階の出力を上限付きのキューで次の段階へ渡しながら、全段階を並行に実行します。
+
+    後の段階が詰まるとキューが一杯になり、前の段階は空きが出るまで待つため、処理待ちのものが際限なく溜まりません。
+    ある段階の全ワーカーが終わった時点で次の段階の入力が締め切られます。
+
+    引数:
+      items: 最初の段階への入力のリスト
+      stages: Stage のリスト（先頭から順に実行）
+      queue_size: 段階の間のキューの上限
+      on_result: 最後の段階から出てきたものを1件ずつ受け取るコールバック（途中経過の保存用）
+
+    戻り値:
+      最後の段階の出力のリスト（完了した順）
+    """
+    queues = [asyncio.Queue(maxsize=max(1, queue_size)) for _ in stages]
+    results = []
+
+    async def worker(index, stage):
+        queue = queues[index]
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            for output in await stage.process(item):
+                if index + 1 < len(stages):
+                    await queues[index + 1].put(output)
+                    continue
+                results.append(output)
+                if on_result is not None:
+                    try:
+                        on_result(output)
+                    except Exception as e:
+                        # 途中経過の保存に失敗しても、結果は返り値に残して処理を続ける
+                        print("パイプラインの結果の保存に失敗しました。エラー:", e)
+
+    async def feed():
+        for item in items:
+            await queues[0].put(item)
+        for index, stage_workers in enumerate(workers):
+            for _ in stage_workers:
+                await queues[index].put(_DONE)
+            await asyncio.gather(*stage_workers)
+
+    workers = [[asyncio.create_task(worker(index, stage)) for _ in range(stage.concurrency)]
+               for index, stage in enumerate(stages)]
+    tasks = [task for stage_workers in workers for task in stage_workers]
+    tasks.append(asyncio.create_task(feed()))
+    try:
+        # ワーカーが予期しない例外で止まると前の段階がキューへの put で待ち続けるため、
+        # どれか1つでも失敗したら残りを止めて例外を送出する
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in tasks:
+            if task in done and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+    finally:
+        # 失敗・キャンセルされた場合などに、残っているワーカーを止める
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return results
@@ -0,0 +1,205 @@
+# product_store.py
+
+import json     # JSON形式のデータを扱うためのライブラリ
+import math
+import os
+import sqlite3  # 履歴の永続化に使用
+import time
+
+from evaluator import parse_price
+from scrape_cache import _normalize_site_url, make_cache_key
+
+
+DEFAULT_STORE_DIR = ".ec_compass_cache"
+DEFAULT_MAX_DETAIL_AGE = 7 * 24 * 3600
+
+
+def _price_value(value):
+    price = parse_price(value)
+    return None if price is None or math.isnan(price) else float(price)
+
+
+class ProductStore:
+    """
+    取得した製品情報の履歴を SQLite に追記していくストアです。
+
+    製品はサイトURLと商品URLで識別し、取得のたびに価格のスナップショット（price_snapshots）と、
+    口コミ・詳細情報を含む製品情報全体のスナップショット（detail_snapshots）を時刻付きで追記します。
+    価格だけを再確認した場合は価格のスナップショットだけを追記するため、
+    詳細情報の取得時刻から「どの商品の口コミ・詳細情報が古くなっているか」を判定できます。
+
+    incremental が有効な場合、scraper は既知の商品について価格だけを再確認し、
+    新しい商品と詳細情報が max_detail_age 秒より古い商品だけ口コミ・詳細情報を取り直します。
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR, incremental=False, max_detail_age=DEFAULT_MAX_DETAIL_AGE):
+        """
+        引数:
+          store_dir: データベースファイルを置くディレクトリ
+          incremental: 既知の商品の価格だけを再確認する差分取得を行うかどうか
+          max_detail_age: 口コミ・詳細情報を取り直すまでの期間（秒）
+        """
+        self.incremental = incremental
+        self.max_detail_age = max_detail_age
+        os.makedirs(store_dir, exist_ok=True)
+        self.path = os.path.join(store_dir, "products.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " site_url TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " product_name TEXT,"
+                " first_seen REAL NOT NULL,"
+                " last_seen REAL NOT NULL,"
+                " PRIMARY KEY (site_url, url))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS price_snapshots ("
+                " site_url TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " scraped_at REAL NOT NULL,"
+                " price REAL,"  # 数値に変換した価格（変換できなければ NULL）
+                " raw_price TEXT)"  # 取得したままの価格（JSON）
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS detail_snapshots ("
+                " site_url TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " scraped_at REAL NOT NULL,"
+                " product TEXT NOT NULL)"
+            )
+            # どの検索条件でどの商品が見つかったか（差分取得で再確認する商品の一覧に使う）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                " search_key TEXT NOT NULL,"
+                " site_url TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " rank INTEGER NOT NULL,"
+                " last_seen REAL NOT NULL,"
+                " PRIMARY KEY (search_key, url))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_price_snapshots ON price_snapshots (site_url, url, scraped_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_detail_snapshots ON detail_snapshots (site_url, url, scraped_at)")
+
+    @classmethod
+    def from_settings(cls, store_settings, incremental=None):
+        """
+        settings.yaml の product_store セクションからストアを作成します。
+        enabled が false の場合は None を返します。
+
+        引数:
+          incremental: 指定した場合は設定ファイルの incremental より優先します（--incremental）
+        """
+        store_settings = store_settings or {}
+        if not store_settings.get("enabled", True):
+            return None
+        return cls(
+            store_dir=store_settings.get("dir", DEFAULT_STORE_DIR),
+            incremental=store_settings.get("incremental", False) if incremental is None else incremental,
+            max_detail_age=store_settings.get("max_detail_age", DEFAULT_MAX_DETAIL_AGE),
+        )
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def record(self, site, search_parameters, products, price_only_urls=()):
+        """
+        取得した製品情報のスナップショットを追記します。URLの無い製品は識別できないため記録しません。
+
+        引数:
+          site: ECサイト情報（辞書）
+          search_parameters: 検索条件を含む辞書（検索結果と商品の対応付けに使用）
+          products: 製品情報（辞書）のリスト
+          price_only_urls: 価格だけを再確認した商品のURL。これらの商品は価格のスナップショットだけを追記します
+        """
+        site_url = _normalize_site_url(site.get("url", ""))
+        search_key = make_cache_key(site, search_parameters)
+        now = time.time()
+        with self._connect() as conn:
+            for rank, product in enumerate(products):
+                url = product.get("url") if isinstance(product, dict) else None
+                if not url:
+                    continue
+                conn.execute(
+                    "INSERT INTO products (site_url, url, product_name, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (site_url, url) DO UPDATE SET last_seen = excluded.last_seen,"
+                    " product_name = COALESCE(excluded.product_name, products.product_name)",
+                    (site_url, url, product.get("product_name"), now, now),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO search_results (search_key, site_url, url, rank, last_seen) VALUES (?, ?, ?, ?, ?)",
+                    (search_key, site_url, url, rank, now),
+                )
+                raw_price = product.get("price")
+                conn.execute(
+                    "INSERT INTO price_snapshots (site_url, url, scraped_at, price, raw_price) VALUES (?, ?, ?, ?, ?)",
+                    (site_url, url, now, _price_value(raw_price), json.dumps(raw_price, ensure_ascii=False)),
+                )
+                if url not in price_only_urls:
+                    conn.execute(
+                        "INSERT INTO detail_snapshots (site_url, url, scraped_at, product) VALUES (?, ?, ?, ?)",
+                        (site_url, url, now, json.dumps(product, ensure_ascii=False)),
+                    )
+
+    def known_products(self, site, search_parameters, limit=None):
+        """
+        同じサイト・検索条件で前回までに見つかった商品を、最新の情報で返します。
+        価格は最新の価格スナップショット、それ以外の項目は最新の詳細スナップショットの値です。
+
+        戻り値:
+          {'product': 製品情報, 'detail_scraped_at': 詳細情報の取得時刻, 'price_scraped_at': 価格の取得時刻} のリスト
+          （前回の検索結果の順）
+        """
+        search_key = make_cache_key(site, search_parameters)
+        site_url = _normalize_site_url(site.get("url", ""))
+        with self._connect() as conn:
+            urls = [row[0] for row in conn.execute(
+                "SELECT url FROM search_results WHERE search_key = ? ORDER BY last_seen DESC, rank ASC",
+                (search_key,),
+            )]
+            if limit is not None:
+                urls = urls[:limit]
+            known = []
+            for url in urls:
+                detail = conn.execute(
+                    "SELECT scraped_at, product FROM detail_snapshots WHERE site_url = ? AND url = ?"
+                    " ORDER BY scraped_at DESC LIMIT 1",
+                    (site_url, url),
+                ).fetchone()
+                if detail is None:
+                    continue
+                price = conn.execute(
+                    "SELECT scraped_at, raw_price FROM price_snapshots WHERE site_url = ? AND url = ?"
+                    " ORDER BY scraped_at DESC LIMIT 1",
+                    (site_url, url),
+                ).fetchone()
+                product = json.loads(detail[1])
+                if price is not None and price[1] is not None:
+                    # 価格は取得時の表記（数値または文字列）のまま保存している
+                    product["price"] = json.loads(price[1])
+                known.append({
+                    "product": product,
+                    "detail_scraped_at": detail[0],
+                    "price_scraped_at": price[0] if price is not None else detail[0],
+                })
+        return known
+
+    def is_detail_stale(self, known_product, now=None):
+        """
+        口コミ・詳細情報が max_detail_age 秒より古ければ True を返します。
+        """
+        now = time.time() if now is None else now
+        return now - known_product["detail_scraped_at"] > self.max_detail_age
+
+    def price_history(self, site, url):
+        """
+        商品の価格の履歴を古い順に返します。
+
+        戻り値:
+          (取得時刻, 価格) のリスト。価格を数値に変換できなかった取得は None になります
+        """
+        with self._connect() as conn:
+            return [tuple(row) for row in conn.execute(
+                "SELECT scraped_at, price FROM price_snapshots WHERE site_url = ? AND url = ? ORDER BY scraped_at",
+                (_normalize_site_url(site.get("url", "")), url),
+            )]
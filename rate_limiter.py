@@ -0,0 +1,368 @@
+# rate_limiter.py
+
+import asyncio  # 非同期処理を行うためのライブラリ
+import json     # JSON形式のデータを扱うためのライブラリ
+import random
+import re
+import threading
+import time
+
+import httpx
+
+from tokens import estimate_tokens
+
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30000
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_MAX_BACKOFF = 60.0
+
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+# 画像1枚あたりの入力トークン数の概算（OpenAI の detail: high の 512px タイル4枚分 + 基本分、low は基本分のみ）
+IMAGE_TOKENS = 765
+LOW_DETAIL_IMAGE_TOKENS = 85
+_IMAGE_PART_TYPES = ("image_url", "input_image", "image")
+
+
+def parse_reset_duration(value):
+    """
+    x-ratelimit-reset-* ヘッダーの値（例: '1s', '6m0s', '20ms'）を秒数に変換します。
+    解釈できない場合は None を返します。
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+class TokenBucket:
+    """
+    1分あたりの上限値から補充速度を決めるトークンバケットです。
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    @property
+    def refill_rate(self):
+        return self.capacity / 60.0
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """
+        amount 分のトークンが貯まるまでの待ち時間（秒）を返します。
+        """
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_rate if self.refill_rate > 0 else 1.0
+
+
+class _ModelBudget:
+    """
+    1つの (プロバイダー, モデル) に対するリクエスト数・トークン数のバケットと一時停止時刻です。
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+
+
+class RateLimitScheduler:
+    """
+    llm_factory 経由のすべてのLLM呼び出しで共有する、プロバイダー・モデル単位のリクエストスケジューラです。
+
+    呼び出し前に acquire/aacquire でリクエスト数・推定トークン数の予算を確保し、予算が無ければ
+    失敗させずに待機させます。予算はレスポンスの x-ratelimit-* ヘッダーで随時更新し、
+    429 を受けた場合はそのモデルへの送信をジッター付きの指数バックオフで一時停止します。
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE,
+                 max_retries=DEFAULT_MAX_RETRIES, max_backoff=DEFAULT_MAX_BACKOFF, model_limits=None):
+        """
+        引数:
+          requests_per_minute: ヘッダーを受け取るまでに使う、1分あたりのリクエスト数の初期値
+          tokens_per_minute: ヘッダーを受け取るまでに使う、1分あたりのトークン数の初期値
+          max_retries: 429 を受けたときの再送回数の上限
+          max_backoff: バックオフの最大待ち時間（秒）
+          model_limits: {'openai/gpt-4o': {'requests_per_minute': ..., 'tokens_per_minute': ...}} 形式の個別設定
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.model_limits = model_limits or {}
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, rate_limit_settings):
+        """
+        settings.yaml の rate_limits セクションからスケジューラを作成します。
+        enabled が false の場合は None を返します。
+        """
+        rate_limit_settings = rate_limit_settings or {}
+        if not rate_limit_settings.get("enabled", True):
+            return None
+        return cls(
+            requests_per_minute=rate_limit_settings.get("requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE),
+            tokens_per_minute=rate_limit_settings.get("tokens_per_minute", DEFAULT_TOKENS_PER_MINUTE),
+            max_retries=rate_limit_settings.get("max_retries", DEFAULT_MAX_RETRIES),
+            max_backoff=rate_limit_settings.get("max_backoff", DEFAULT_MAX_BACKOFF),
+            model_limits=rate_limit_settings.get("models"),
+        )
+
+    def _budget(self, provider, model):
+        key = (provider, model)
+        budget = self._budgets.get(key)
+        if budget is None:
+            limits = self.model_limits.get(f"{provider}/{model}", {})
+            budget = _ModelBudget(
+                limits.get("requests_per_minute", self.requests_per_minute),
+                limits.get("tokens_per_minute", self.tokens_per_minute),
+            )
+            self._budgets[key] = budget
+        return budget
+
+    def _try_reserve(self, provider, model, estimated_tokens):
+        """
+        予算が確保できれば消費して 0 を、できなければ次に試すまでの待ち時間を返します。
+        """
+        with self._lock:
+            budget = self._budget(provider, model)
+            now = time.monotonic()
+            if now < budget.paused_until:
+                return budget.paused_until - now
+            budget.requests.refill(now)
+            budget.tokens.refill(now)
+            wait = max(budget.requests.wait_time(1), budget.tokens.wait_time(estimated_tokens))
+            if wait > 0:
+                return wait
+            budget.requests.tokens -= 1
+            budget.tokens.tokens -= min(estimated_tokens, budget.tokens.capacity)
+            return 0.0
+
+    def acquire(self, provider, model, estimated_tokens=0):
+        """
+        予算が確保できるまでスレッドを待機させます（同期版）。
+        """
+        while True:
+            wait = self._try_reserve(provider, model, estimated_tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, provider, model, estimated_tokens=0):
+        """
+        予算が確保できるまでコルーチンを待機させます（非同期版）。
+        """
+        while True:
+            wait = self._try_reserve(provider, model, estimated_tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, provider, model, headers):
+        """
+        レスポンスの x-ratelimit-* ヘッダーで予算を更新します。ヘッダーが無ければ何もしません。
+        """
+        limit_requests = _to_number(headers.get("x-ratelimit-limit-requests"))
+        limit_tokens = _to_number(headers.get("x-ratelimit-limit-tokens"))
+        remaining_requests = _to_number(headers.get("x-ratelimit-remaining-requests"))
+        remaining_tokens = _to_number(headers.get("x-ratelimit-remaining-tokens"))
+        if limit_requests is None and limit_tokens is None and remaining_requests is None and remaining_tokens is None:
+            return
+        with self._lock:
+            budget = self._budget(provider, model)
+            now = time.monotonic()
+            for bucket, limit, remaining in (
+                (budget.requests, limit_requests, remaining_requests),
+                (budget.tokens, limit_tokens, remaining_tokens),
+            ):
+                bucket.refill(now)
+                if limit is not None and limit > 0:
+                    bucket.capacity = limit
+                if remaining is not None:
+                    # 送信中の他リクエスト分を差し引いた手元の値の方が小さければそちらを信用する
+                    bucket.tokens = min(bucket.tokens, remaining)
+
+    def backoff(self, provider, model, attempt, headers=None):
+        """
+        429 を受けたときに呼び出し、そのモデルへの送信を一時停止します。
+
+        待ち時間は Retry-After / x-ratelimit-reset-* ヘッダーがあればそれを下限とし、
+        2^attempt 秒の指数バックオフにフルジッターを加えて max_backoff で打ち切ります。
+
+        戻り値:
+          一時停止する秒数
+        """
+        headers = headers or {}
+        hinted = [
+            parse_reset_duration(headers.get("retry-after")),
+            parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+            parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+        ]
+        floor = max([h for h in hinted if h is not None], default=0.0)
+        delay = min(self.max_backoff, max(floor, random.uniform(0, 2 ** attempt)))
+        with self._lock:
+            budget = self._budget(provider, model)
+            budget.paused_until = max(budget.paused_until, time.monotonic() + delay)
+        return delay
+
+
+def _to_number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _collect_payload_text(value, texts):
+    """
+    リクエストのJSONに含まれる文字列を texts に集め、画像の推定トークン数を返します。
+    base64 の画像データは文字列に含めず、画像1枚ごとに決まったトークン数として数えます。
+    """
+    if isinstance(value, str):
+        texts.append(value)
+        return 0
+    if isinstance(value, list):
+        return sum(_collect_payload_text(item, texts) for item in value)
+    if isinstance(value, dict):
+        if value.get("type") in _IMAGE_PART_TYPES:
+            image = value.get("image_url")
+            detail = image.get("detail") if isinstance(image, dict) else value.get("detail")
+            return LOW_DETAIL_IMAGE_TOKENS if detail == "low" else IMAGE_TOKENS
+        images = 0
+        for key, item in value.items():
+            texts.append(key)
+            images += _collect_payload_text(item, texts)
+        return images
+    texts.append(str(value))
+    return 0
+
+
+def estimate_request_tokens(request):
+    """
+    チャット補完リクエストの本文から消費トークン数を概算します。
+    テキストは tokens.estimate_tokens（日本語は1文字 ≒ 1トークン）、画像（vision のスクリーンショット）は
+    1枚 IMAGE_TOKENS として数え、出力上限を加えます。
+    """
+    try:
+        body = request.content
+    except httpx.RequestNotRead:
+        return 0
+    if not body:
+        return 0
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return estimate_tokens(body.decode("utf-8", "replace"))
+    texts = []
+    image_tokens = _collect_payload_text(payload, texts)
+    estimated = estimate_tokens("".join(texts)) + image_tokens
+    if isinstance(payload, dict):
+        try:
+            estimated += int(payload.get("max_tokens") or payload.get("max_completion_tokens") or 0)
+        except (TypeError, ValueError):
+            pass
+    return estimated
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    RateLimitScheduler を通してリクエストを送る httpx トランスポートです（同期クライアント用）。
+    """
+
+    def __init__(self, scheduler, provider, model, transport=None):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.model = model
+        self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        estimated_tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            self.scheduler.acquire(self.provider, self.model, estimated_tokens)
+            response = self._transport.handle_request(request)
+            self.scheduler.update_from_headers(self.provider, self.model, response.headers)
+            if response.status_code != 429 or attempt >= self.scheduler.max_retries:
+                return response
+            response.read()
+            response.close()
+            delay = self.scheduler.backoff(self.provider, self.model, attempt, response.headers)
+            print(f"レート制限に達しました ({self.provider}/{self.model})。{delay:.1f}秒待機して再送します。")
+            attempt += 1
+
+    def close(self):
+        self._transport.close()
+
+
+class RateLimitedAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    RateLimitScheduler を通してリクエストを送る httpx トランスポートです（非同期クライアント用）。
+    """
+
+    def __init__(self, scheduler, provider, model, transport=None):
+        self.scheduler = scheduler
+        self.provider = provider
+        self.model = model
+        self._transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        estimated_tokens = estimate_request_tokens(request)
+        attempt = 0
+        while True:
+            await self.scheduler.aacquire(self.provider, self.model, estimated_tokens)
+            response = await self._transport.handle_async_request(request)
+            self.scheduler.update_from_headers(self.provider, self.model, response.headers)
+            if response.status_code != 429 or attempt >= self.scheduler.max_retries:
+                return response
+            await response.aread()
+            await response.aclose()
+            delay = self.scheduler.backoff(self.provider, self.model, attempt, response.headers)
+            print(f"レート制限に達しました ({self.provider}/{self.model})。{delay:.1f}秒待機して再送します。")
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def make_rate_limiter(scheduler, provider, model):
+    """
+    HTTPクライアントを差し替えられないチャットモデル（Google など）向けに、
+    スケジューラを LangChain の rate_limiter 引数として使えるようにしたアダプタを返します。
+    ヘッダーによる予算更新は行われず、ローカルのバケットのみで送信間隔を制御します。
+    """
+    from langchain_core.rate_limiters import BaseRateLimiter
+
+    class _SchedulerRateLimiter(BaseRateLimiter):
+        def acquire(self, *, blocking=True):
+            if not blocking:
+                return scheduler._try_reserve(provider, model, 0) <= 0
+            scheduler.acquire(provider, model)
+            return True
+
+        async def aacquire(self, *, blocking=True):
+            if not blocking:
+                return scheduler._try_reserve(provider, model, 0) <= 0
+            await scheduler.aacquire(provider, model)
+            return True
+
+    return _SchedulerRateLimiter()
@@ -1,26 +1,21 @@
+import asyncio  # 非同期処理を行うためのライブラリ
 import os
 import json
 import re
 from llm_factory import get_llm
+from models import PromptFormat, products_from_results  # 製品情報の正規化とプロンプト用の簡潔な表記
+from tokens import estimate_tokens  # 日本語を考慮したトークン数の概算
+import tracing
 
 
-def generate_report(product_results, evaluation_criteria, top_n, report_model="gpt-4o-mini", ai_platform="openai"):
+def _build_report_prompt(user_preferences, product_info):
     """
-    製品情報と評価基準に基づき、Markdown形式のレポートを生成します。
+    レポート生成用のプロンプトを組み立てます。
 
     引数:
-      product_results: 各ECサイトから収集した製品情報（リストまたは辞書）
-      evaluation_criteria: 評価基準の辞書（ユーザーの自然言語による preferences を含む）
-      top_n: 上位抽出件数
-      report_model: レポート生成に使用するモデル名
-      ai_platform: 使用するAIプラットフォームの名前
-
-    戻り値:
-      生成されたMarkdown形式のレポート（文字列）
+      user_preferences: ユーザーの希望（自然言語）
+      product_info: プロンプトに埋め込む製品情報（文字列）
     """
-    # ユーザーの preferences を取得
-    user_preferences = evaluation_criteria.get('preferences', 'できるだけ安価な商品を探してください')
-
     prompt = (
         "以下の情報に基づいて調査レポートを生成してください。\n\n"
         "【ユーザーの希望】\n"
@@ -31,28 +26,344 @@ def generate_report(product_results, evaluation_criteria, top_n, report_model="g
         "・価格\n"
         "・URL\n"
         "・口コミ情報\n"
-        "・商品の詳細情報（特徴、仕様など）\n\n"
+        "・商品の詳細情報（特徴、仕様など）\n"
+        "・offers（複数のサイトで販売されている同一商品の、サイトごとの価格とURL。ある場合のみ）\n\n"
         "特に以下の点に注意してレポートを作成してください：\n"
         "1. ユーザーの希望に沿った製品を優先的に取り上げる\n"
         "2. 口コミ情報を活用して、実際のユーザー評価を反映する\n"
         "3. 商品の特徴や仕様を分かりやすく説明する\n"
-        "4. 価格についても言及し、コストパフォーマンスの観点からコメントを付ける\n\n"
+        "4. 価格についても言及し、コストパフォーマンスの観点からコメントを付ける\n"
+        "5. offers がある製品は、サイト間の価格差を比較して最も安く購入できるサイトを示す\n\n"
         "以下が製品情報の詳細です：\n"
-        f"{str(product_results)}\n\n"
+        f"{product_info}\n\n"
         "レポートはMarkdown形式で作成し、見出しや箇条書きを適切に使用して読みやすく構造化してください。"
     )
 
-    combined_prompt = "あなたはプロフェッショナルな製品レビューアーとして、以下の製品情報を分析し、ユーザーの希望に沿ったレポートを作成してください。\n" + prompt
+    return "あなたはプロフェッショナルな製品レビューアーとして、以下の製品情報を分析し、ユーザーの希望に沿ったレポートを作成してください。\n" + prompt
+
+
+def _split_into_chunks(product_results, chunk_tokens, prompt_format=None):
+    """
+    製品情報を、1チャンクあたりの推定トークン数が chunk_tokens 以下になるように分割します。
+    製品リストは製品単位で（prompt_format の表記で）、パースできなかった生の文字列は文字数で分割します。
 
+    戻り値:
+      チャンク（文字列）のリスト
+    """
+    products = products_from_results(product_results)
+    if products is None:
+        text = str(product_results)
+        step = max(1, chunk_tokens)
+        return [text[i:i + step] for i in range(0, len(text), step)]
+
+    prompt_format = prompt_format or PromptFormat()
+    chunks = []
+    current = []
+    current_tokens = 0
+    for index, product in enumerate(products, 1):
+        item_text = prompt_format.format_product(product, index)
+        item_tokens = estimate_tokens(item_text)
+        # 1製品だけで予算を超える場合も、その製品だけのチャンクとして扱う
+        if current and current_tokens + item_tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(item_text)
+        current_tokens += item_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _build_map_prompt(user_preferences, chunk):
+    """
+    map段階（製品ごとの要約）用のプロンプトを組み立てます。
+    """
+    return (
+        "あなたは製品情報を整理するアシスタントです。以下の製品情報を、後で比較レポートを作成するための要約に変換してください。\n\n"
+        "【ユーザーの希望】\n"
+        f"{user_preferences}\n\n"
+        "各製品について、以下を箇条書きで簡潔にまとめてください：\n"
+        "・サイト名、商品名、価格、URL、メーカー公式サイトURL\n"
+        "・主な仕様と特徴（ユーザーの希望に関係するものを優先）\n"
+        "・口コミの傾向（良い点・不具合や不満の報告）\n\n"
+        "推測で情報を補わず、製品情報に書かれている内容だけを使用してください。\n\n"
+        "【製品情報】\n"
+        f"{chunk}"
+    )
+
+
+async def _summarize_chunks(chunks, user_preferences, map_platform, map_model, concurrency):
+    """
+    チャンクごとの要約を、同時実行数を制限しながら並列に生成します。
+
+    要約に失敗したチャンク（レート制限など）は、他のチャンクの要約を捨てないよう元のチャンクの文字列をそのまま使います。
+    全てのチャンクの要約に失敗した場合は、最初のエラーを送出します。
+    """
+    variant = "genai" if map_platform.lower() == "google" else None
+    llm = get_llm(map_platform, map_model, variant=variant, use_response_cache=True)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def summarize(chunk):
+        async with semaphore:
+            response = await llm.ainvoke(_build_map_prompt(user_preferences, chunk))
+            return response.content
+
+    results = await asyncio.gather(*(summarize(chunk) for chunk in chunks), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        if not isinstance(error, Exception):
+            # キャンセルなどはチャンクの失敗として扱わずに伝える
+            raise error
+    if errors and len(errors) == len(results):
+        raise errors[0]
+    summaries = []
+    for index, (chunk, result) in enumerate(zip(chunks, results), 1):
+        if isinstance(result, Exception):
+            print(f"チャンク {index} の要約に失敗したため、元の製品情報を使用します。エラー: {result}")
+            result = chunk
+        summaries.append(result)
+    return summaries
+
+
+async def _build_map_reduce_prompt(product_results, user_preferences, report_model, ai_platform, map_reduce_settings,
+                                   prompt_format=None):
+    """
+    製品情報をチャンクに分けて並列に要約（map）し、要約をまとめたレポート生成用のプロンプト（reduce）を返します。
+    """
+    chunk_tokens = map_reduce_settings.get("chunk_tokens", 3000)
+    concurrency = map_reduce_settings.get("concurrency", 4)
+    map_platform = map_reduce_settings.get("map_platform", ai_platform)
+    map_model = map_reduce_settings.get("map_model", report_model)
+
+    chunks = _split_into_chunks(product_results, chunk_tokens, prompt_format)
+    print(f"製品情報を {len(chunks)} 個のチャンクに分割して要約します。")
+    with tracing.span("report.map", model=map_model, chunks=len(chunks)):
+        summaries = await _summarize_chunks(chunks, user_preferences, map_platform, map_model, concurrency)
+
+    product_info = "\n\n".join(f"--- 要約 {i + 1} ---\n{summary}" for i, summary in enumerate(summaries))
+    return _build_report_prompt(user_preferences, product_info)
+
+
+def _should_use_map_reduce(product_results, map_reduce_settings, product_info=None):
+    """
+    map-reduce 方式でレポートを生成するかどうかを判定します。
+    製品数が min_products 以上、または製品情報全体（product_info を指定した場合はその文字列）の
+    推定トークン数が max_direct_tokens を超える場合に使用します。
+    """
+    if not map_reduce_settings or not map_reduce_settings.get("enabled", False):
+        return False
+    if isinstance(product_results, dict) and isinstance(product_results.get("results"), list):
+        product_count = len(product_results["results"])
+    elif isinstance(product_results, list):
+        product_count = len(product_results)
+    else:
+        product_count = 0
+    if product_count >= map_reduce_settings.get("min_products", 8):
+        return True
+    text = product_info if product_info is not None else str(product_results)
+    return estimate_tokens(text) > map_reduce_settings.get("max_direct_tokens", 20000)
+
+
+def _plan_report_prompt(product_results, evaluation_criteria, report_model, ai_platform, reporting_settings):
+    """
+    レポート生成プロンプトの組み立て方を決めます。
+
+    戻り値:
+      (単一呼び出し用のプロンプト, map-reduce 用のプロンプトを返すコルーチンを作る関数) のタプル。
+      map-reduce を使う場合はプロンプトが None、使わない場合は関数が None になります
+    """
+    # ユーザーの preferences を取得
+    user_preferences = evaluation_criteria.get('preferences', 'できるだけ安価な商品を探してください')
+    map_reduce_settings = (reporting_settings or {}).get('map_reduce', {})
+
+    # 製品情報は str() ではなく、空の項目を省き口コミ・詳細情報を切り詰めた簡潔な表記で埋め込む
+    prompt_format = PromptFormat.from_settings((reporting_settings or {}).get('prompt'))
+    products = products_from_results(product_results)
+    product_info = prompt_format.format_products(products) if products is not None else str(product_results)
+
+    if _should_use_map_reduce(product_results, map_reduce_settings, product_info):
+        return None, lambda: _build_map_reduce_prompt(
+            products if products is not None else product_results, user_preferences, report_model, ai_platform,
+            map_reduce_settings, prompt_format
+        )
+    return _build_report_prompt(user_preferences, product_info), None
+
+
+async def _prepare_report_prompt_async(product_results, evaluation_criteria, report_model, ai_platform,
+                                      reporting_settings):
+    """
+    設定に応じて、単一呼び出し用または map-reduce 用のレポート生成プロンプトを返します（非同期版）。
+    """
+    prompt, map_reduce = _plan_report_prompt(product_results, evaluation_criteria, report_model, ai_platform,
+                                             reporting_settings)
+    return prompt if map_reduce is None else await map_reduce()
+
+
+def _prepare_report_prompt(product_results, evaluation_criteria, report_model, ai_platform, reporting_settings):
+    """
+    設定に応じて、単一呼び出し用または map-reduce 用のレポート生成プロンプトを返します。
+    map-reduce の要約を並列に生成する場合だけ、イベントループを起動します。
+    """
+    prompt, map_reduce = _plan_report_prompt(product_results, evaluation_criteria, report_model, ai_platform,
+                                             reporting_settings)
+    return prompt if map_reduce is None else asyncio.run(map_reduce())
+
+
+def _strip_code_fences(report):
+    # 不要なコードブロックのマーカー (```) を削除
+    report = re.sub(r'^```.*?\n', '', report, flags=re.DOTALL)
+    return re.sub(r'\n```$', '', report, flags=re.DOTALL)
+
+
+def generate_report(product_results, evaluation_criteria, top_n, report_model="gpt-4o-mini", ai_platform="openai",
+                    reporting_settings=None, raise_errors=False):
+    """
+    製品情報と評価基準に基づき、Markdown形式のレポートを生成します。
+
+    reporting_settings.map_reduce が有効で製品数（または製品情報の量）が多い場合は、製品情報を
+    チャンクに分けて安価なモデルで並列に要約し、その要約から1回の呼び出しでレポートを生成します。
+
+    引数:
+      product_results: 各ECサイトから収集した製品情報（リストまたは辞書）
+      evaluation_criteria: 評価基準の辞書（ユーザーの自然言語による preferences を含む）
+      top_n: 上位抽出件数
+      report_model: レポート生成に使用するモデル名
+      ai_platform: 使用するAIプラットフォームの名前
+      reporting_settings: settings.yaml の reporting セクション（map_reduce の設定を参照します）
+      raise_errors: True の場合、生成に失敗したら失敗のメッセージを返さずに例外をそのまま送出します
+
+    戻り値:
+      生成されたMarkdown形式のレポート（文字列）
+    """
     variant = "genai" if ai_platform.lower() == "google" else None
     try:
-        llm = get_llm(ai_platform, report_model, variant=variant)
-        report = llm.invoke(combined_prompt).content
+        with tracing.span("report.generate", model=report_model):
+            combined_prompt = _prepare_report_prompt(
+                product_results, evaluation_criteria, report_model, ai_platform, reporting_settings
+            )
+            llm = get_llm(ai_platform, report_model, variant=variant, use_response_cache=True)
+            report = llm.invoke(combined_prompt).content
     except Exception as e:
         print(f"レポート生成中にエラーが発生しました: {e}")
+        if raise_errors:
+            raise
         return "レポート生成に失敗しました。"
+    return _strip_code_fences(report)
 
-    # 不要なコードブロックのマーカー (```) を削除
-    report = re.sub(r'^```.*?\n', '', report, flags=re.DOTALL)
-    report = re.sub(r'\n```$', '', report, flags=re.DOTALL)
-    return report 
\ No newline at end of file
+
+async def generate_report_async(product_results, evaluation_criteria, top_n, report_model="gpt-4o-mini",
+                                ai_platform="openai", reporting_settings=None, timeout=None, raise_errors=False):
+    """
+    generate_report の非同期版です。呼び出し元のイベントループで、LLMを非同期に呼び出します（ainvoke）。
+    生成中のタスクがキャンセルされた場合は、LLMの呼び出しを中断して asyncio.CancelledError を送出します。
+
+    引数:
+      timeout: レポート生成全体（map-reduce の要約を含む）の制限時間（秒）。超えた場合は asyncio.TimeoutError を送出します
+      その他の引数は generate_report と同じです
+
+    戻り値:
+      生成されたMarkdown形式のレポート（文字列）
+    """
+    if timeout is not None:
+        return await asyncio.wait_for(
+            generate_report_async(product_results, evaluation_criteria, top_n, report_model, ai_platform,
+                                  reporting_settings, raise_errors=raise_errors),
+            timeout)
+    variant = "genai" if ai_platform.lower() == "google" else None
+    try:
+        with tracing.span("report.generate", model=report_model):
+            combined_prompt = await _prepare_report_prompt_async(
+                product_results, evaluation_criteria, report_model, ai_platform, reporting_settings
+            )
+            llm = get_llm(ai_platform, report_model, variant=variant, use_response_cache=True)
+            report = (await llm.ainvoke(combined_prompt)).content
+    except Exception as e:
+        print(f"レポート生成中にエラーが発生しました: {e}")
+        if raise_errors:
+            raise
+        return "レポート生成に失敗しました。"
+    return _strip_code_fences(report)
+
+
+class FenceStripper:
+    """
+    ストリーミング中のレポートから、先頭と末尾のコードブロックのマーカー (```) を逐次取り除きます。
+    generate_report の正規表現による除去と同じ結果になるよう、先頭は最初の改行まで、
+    末尾はマーカーの長さ分だけ出力を保留します。
+    """
+
+    _CLOSING_FENCE = "\n```"
+
+    def __init__(self):
+        self._head_checked = False
+        self._pending = ""
+
+    def feed(self, text):
+        """
+        受信したテキストを渡し、出力してよい部分を返します。
+        """
+        self._pending += text
+        if not self._head_checked:
+            if self._pending.startswith("```"):
+                newline = self._pending.find("\n")
+                if newline < 0:
+                    return ""
+                self._pending = self._pending[newline + 1:]
+                self._head_checked = True
+            elif len(self._pending) >= 3 or not "```".startswith(self._pending):
+                self._head_checked = True
+            else:
+                return ""
+        # 末尾のマーカー（直後の改行1つを含む）になり得る部分だけを残して出力する
+        keep = len(self._CLOSING_FENCE) + 1
+        if len(self._pending) <= keep:
+            return ""
+        ready, self._pending = self._pending[:-keep], self._pending[-keep:]
+        return ready
+
+    def finish(self):
+        """
+        ストリームの終了時に呼び出し、保留していた残りを返します。
+        """
+        rest = self._pending
+        self._pending = ""
+        if rest.endswith(self._CLOSING_FENCE):
+            rest = rest[:-len(self._CLOSING_FENCE)]
+        elif rest.endswith(self._CLOSING_FENCE + "\n"):
+            rest = rest[:-len(self._CLOSING_FENCE) - 1] + "\n"
+        return rest
+
+
+def stream_report(product_results, evaluation_criteria, top_n, report_model="gpt-4o-mini", ai_platform="openai",
+                  reporting_settings=None, raise_errors=False):
+    """
+    generate_report のストリーミング版です。生成されたレポートを、コードブロックのマーカーを
+    取り除きながら受信した順に少しずつ返します（ジェネレータ）。
+
+    引数・戻り値は generate_report と同じですが、戻り値はレポートの断片（文字列）を返すジェネレータです。
+    生成に失敗した場合は、エラーメッセージを最後の断片として返します（raise_errors が True の場合は、
+    それまでの断片を返したあとで例外を送出します）。
+    """
+    variant = "genai" if ai_platform.lower() == "google" else None
+    stripper = FenceStripper()
+    try:
+        with tracing.span("report.stream", model=report_model):
+            combined_prompt = _prepare_report_prompt(
+                product_results, evaluation_criteria, report_model, ai_platform, reporting_settings
+            )
+            llm = get_llm(ai_platform, report_model, variant=variant, use_response_cache=True)
+            for chunk in llm.stream(combined_prompt):
+                text = stripper.feed(chunk.content or "")
+                if text:
+                    yield text
+    except Exception as e:
+        print(f"レポート生成中にエラーが発生しました: {e}")
+        yield stripper.finish()
+        if raise_errors:
+            raise
+        yield "\n\nレポート生成に失敗しました。"
+        return
+    rest = stripper.finish()
+    if rest:
+        yield rest
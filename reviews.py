@@ -0,0 +1,348 @@
+# reviews.py
+
+import collections
+import contextlib
+import contextvars
+import hashlib  # ファイル名に使うハッシュ計算に使用
+import heapq
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import re  # 正規表現を扱うライブラリをインポートします
+import threading
+import unicodedata
+
+import tracing
+
+
+DEFAULT_QUOTES = 3
+DEFAULT_QUOTE_CHARS = 200
+RECORD_ACTION = "record_reviews"
+
+# 不満の傾向として数える話題と、その話題とみなすキーワード（settings.yaml の review_summary.themes で置き換えられます）
+DEFAULT_THEMES = {
+    "ノイズ": ["プチプチ", "ノイズ", "雑音", "ジー音"],
+    "初期不良・故障": ["初期不良", "故障", "壊れ", "動かな", "起動しな"],
+    "動作の不安定": ["不安定", "フリーズ", "落ちる", "再起動", "ブルースクリーン"],
+    "発熱": ["発熱", "熱い", "温度が高"],
+    "BIOS・設定": ["BIOS", "UEFI", "設定が分かりにく"],
+    "ネットワーク": ["Wi-Fi", "WiFi", "無線", "LAN", "切断", "繋がらな"],
+    "サポート": ["サポート", "問い合わせ", "保証"],
+}
+
+# 同じ口コミが二重に記録された（同じページを読み直した）場合に除外するため、直近の口コミのハッシュを覚えておく件数
+_RECENT_REVIEWS = 2000
+
+_STARS = re.compile(r"[★☆]{2,5}")
+_RATING = re.compile(r"(?:★|星|評価\s*[:：]?\s*)\s*([0-5](?:\.\d)?)|([0-5](?:\.\d)?)\s*(?:点|/\s*5)")
+
+_active_collector = contextvars.ContextVar("review_collector", default=None)
+
+
+def parse_rating(review):
+    """
+    口コミの本文（または {'rating', 'text'} の辞書）から 1〜5 の評価を読み取ります。読み取れなければ None を返します。
+    """
+    if isinstance(review, dict):
+        for key in ("rating", "score", "stars", "評価"):
+            value = review.get(key)
+            if isinstance(value, (int, float)) and 0 < value <= 5:
+                return round(value)
+        review = " ".join(str(v) for v in review.values() if v not in (None, ""))
+    text = unicodedata.normalize("NFKC", str(review))
+    stars = _STARS.search(text)
+    if stars:
+        return stars.group(0).count("★") or None
+    match = _RATING.search(text)
+    if match:
+        value = float(match.group(1) or match.group(2))
+        return round(value) if 0 < value <= 5 else None
+    return None
+
+
+def review_text(review):
+    """
+    口コミ（文字列または辞書）の本文を、空白を詰めた1つの文字列にします。
+    """
+    if isinstance(review, dict):
+        for key in ("text", "body", "comment", "review", "content"):
+            if review.get(key):
+                return re.sub(r"\s+", " ", str(review[key])).strip()
+        review = " ".join(str(v) for v in review.values() if v not in (None, ""))
+    return re.sub(r"\s+", " ", str(review)).strip()
+
+
+class ReviewSummary:
+    """
+    1製品の口コミを1件ずつ受け取りながら更新する集計です。口コミの件数に関わらず使うメモリは一定です。
+
+      count: 口コミの件数
+      ratings: 評価（1〜5）ごとの件数
+      themes: 不満の話題ごとの件数（評価3以下または評価不明の口コミで、キーワードを含むもの）
+      代表的な口コミ: 高評価（4以上）と低評価（3以下）からそれぞれ quotes 件
+        （不満の話題を多く含むもの、ある程度の長さがあるものを優先）
+    """
+
+    __slots__ = ("count", "ratings", "themes", "_theme_keywords", "_quotes", "_quote_chars", "_positive", "_negative",
+                 "_seq")
+
+    def __init__(self, themes=None, quotes=DEFAULT_QUOTES, quote_chars=DEFAULT_QUOTE_CHARS):
+        self.count = 0
+        self.ratings = collections.Counter()
+        self.themes = collections.Counter()
+        self._theme_keywords = {name: [k.lower() for k in keywords]
+                                for name, keywords in (DEFAULT_THEMES if themes is None else themes).items()}
+        self._quotes = quotes
+        self._quote_chars = quote_chars
+        # (優先度, 順番, 本文) の小さい方から捨てるヒープ
+        self._positive = []
+        self._negative = []
+        self._seq = 0
+
+    def add(self, review):
+        """
+        口コミを1件加えます。戻り値は (本文, 評価) です。
+        """
+        text = review_text(review)
+        rating = parse_rating(review)
+        self.count += 1
+        if rating is not None:
+            self.ratings[rating] += 1
+        hits = 0
+        if rating is None or rating <= 3:
+            lowered = text.lower()
+            for name, keywords in self._theme_keywords.items():
+                if any(keyword in lowered for keyword in keywords):
+                    self.themes[name] += 1
+                    hits += 1
+        if self._quotes > 0 and text:
+            heap = self._positive if rating is not None and rating >= 4 else self._negative
+            # 話題を含むものを優先し、同じなら短すぎない（情報量のある）ものを優先する
+            priority = (hits, min(len(text), self._quote_chars))
+            self._seq += 1
+            entry = (priority, -self._seq, text[:self._quote_chars])
+            if len(heap) < self._quotes:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+        return text, rating
+
+    def quotes(self):
+        """
+        代表的な口コミのリストを返します。レポートの max_reviews で先頭だけが使われても両方が残るよう、
+        低評価と高評価を交互に並べます（低評価から）。
+        """
+        negative = [text for _, _, text in sorted(self._negative, reverse=True)]
+        positive = [text for _, _, text in sorted(self._positive, reverse=True)]
+        merged = []
+        for index in range(max(len(negative), len(positive))):
+            merged.extend(quotes[index] for quotes in (negative, positive) if index < len(quotes))
+        return merged
+
+    def to_dict(self):
+        rated = sum(self.ratings.values())
+        return {
+            "count": self.count,
+            "average_rating": round(sum(r * n for r, n in self.ratings.items()) / rated, 2) if rated else None,
+            "ratings": {str(r): self.ratings[r] for r in sorted(self.ratings, reverse=True)},
+            "themes": dict(self.themes.most_common()),
+        }
+
+
+def format_review_summary(summary):
+    """
+    review_summary（ReviewSummary.to_dict の戻り値）を、プロンプトに埋め込む1行の文字列にします。
+    """
+    if not isinstance(summary, dict) or not summary.get("count"):
+        return ""
+    parts = [f"{summary['count']}件"]
+    if summary.get("average_rating") is not None:
+        parts.append(f"平均★{summary['average_rating']}")
+    if summary.get("ratings"):
+        parts.append(" ".join(f"★{rating}:{count}" for rating, count in summary["ratings"].items()))
+    if summary.get("themes"):
+        parts.append("主な不満: " + ", ".join(f"{name}({count})" for name, count in summary["themes"].items()))
+    return " / ".join(parts)
+
+
+class ReviewCollector:
+    """
+    エージェントが口コミのページを読むたびに record_reviews アクションで送ってくる口コミを、
+    製品ごとのファイル（<dir>/reviews/<URLのハッシュ>.jsonl）に書き出しながら集計します。
+
+    エージェントの記憶や最終出力のJSONには口コミを溜めないため、口コミが多い商品でもトークン数とメモリが増えません。
+    以降の処理（レポート生成など）には、集計（review_summary）と代表的な口コミ（reviews）だけを渡します。
+    """
+
+    def __init__(self, base_dir, themes=None, quotes=DEFAULT_QUOTES, quote_chars=DEFAULT_QUOTE_CHARS):
+        self.dir = os.path.join(base_dir, "reviews")
+        self.themes = themes
+        self.quotes = quotes
+        self.quote_chars = quote_chars
+        self._summaries = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._controller = None
+
+    @classmethod
+    def from_settings(cls, browser_settings, base_dir):
+        """
+        reviews_per_product が -1 で、review_summary.enabled が false でない場合に作成します。それ以外は None を返します。
+        """
+        browser_settings = browser_settings or {}
+        summary_settings = browser_settings.get("review_summary", {}) or {}
+        if browser_settings.get("reviews_per_product", 3) != -1 or not summary_settings.get("enabled", True):
+            return None
+        return cls(base_dir, themes=summary_settings.get("themes"),
+                   quotes=summary_settings.get("quotes", DEFAULT_QUOTES),
+                   quote_chars=summary_settings.get("quote_chars", DEFAULT_QUOTE_CHARS))
+
+    def path_for(self, product_url):
+        digest = hashlib.sha1(str(product_url).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.dir, f"{digest}.jsonl")
+
+    def _summary(self, product_url):
+        summary = self._summaries.get(product_url)
+        if summary is not None:
+            return summary
+        summary = ReviewSummary(self.themes, self.quotes, self.quote_chars)
+        recent = collections.OrderedDict()
+        # 以前の実行（--resume など）で書き出した口コミがあれば、1行ずつ読んで集計し直す
+        path = self.path_for(product_url)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    text = record.get("review", "")
+                    summary.add({"text": text, "rating": record.get("rating")})
+                    self._remember(recent, text)
+        self._summaries[product_url] = summary
+        self._recent[product_url] = recent
+        return summary
+
+    @staticmethod
+    def _remember(recent, text):
+        # 直近の口コミのハッシュを覚え、同じ口コミならFalseを返す
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        if key in recent:
+            return False
+        recent[key] = None
+        if len(recent) > _RECENT_REVIEWS:
+            recent.popitem(last=False)
+        return True
+
+    def add(self, product_url, reviews, page=None):
+        """
+        1ページ分の口コミを書き出して集計に加えます。
+
+        戻り値:
+          (今回加えた件数, この製品の累計件数)
+        """
+        if isinstance(reviews, (str, dict)):
+            reviews = [reviews]
+        with self._lock:
+            summary = self._summary(product_url)
+            recent = self._recent[product_url]
+            os.makedirs(self.dir, exist_ok=True)
+            added = 0
+            with open(self.path_for(product_url), "a", encoding="utf-8") as f:
+                for review in reviews or []:
+                    text = review_text(review)
+                    if not text or not self._remember(recent, text):
+                        continue
+                    _, rating = summary.add(review)
+                    f.write(json.dumps({"url": product_url, "page": page, "rating": rating, "review": text},
+                                       ensure_ascii=False) + "\n")
+                    added += 1
+            tracing.count("reviews_streamed", added)
+            return added, summary.count
+
+    def summary_for(self, product_url):
+        """
+        製品の (review_summary（集計と口コミのファイルのパス）, 代表的な口コミのリスト) を返します。
+        口コミを受け取っていなければ None を返します。
+        """
+        with self._lock:
+            summary = self._summaries.get(product_url)
+            if summary is None and os.path.exists(self.path_for(product_url)):
+                summary = self._summary(product_url)
+            if summary is None or not summary.count:
+                return None
+            return dict(summary.to_dict(), file=self.path_for(product_url)), summary.quotes()
+
+    def apply(self, products):
+        """
+        製品情報のリストに集計を反映した新しいリストを返します。口コミを受け取った製品は reviews を代表的な口コミに、
+        review_summary を集計に置き換えます。製品情報に代表的な口コミより多くの口コミが入っている場合
+        （サイトアダプタの結果など）は、先にそれを書き出して集計に加えます（同じ口コミは二重に数えません）。
+        """
+        applied = []
+        for product in products:
+            url = product.get("url") if isinstance(product, dict) else None
+            if not url:
+                applied.append(product)
+                continue
+            reviews = product.get("reviews")
+            if isinstance(reviews, (list, tuple)) and len(reviews) > self.quotes * 2:
+                self.add(url, reviews)
+            found = self.summary_for(url)
+            if found is None:
+                applied.append(product)
+                continue
+            summary, quotes = found
+            applied.append(dict(product, reviews=quotes, review_summary=summary))
+        return applied
+
+    def controller(self):
+        """
+        record_reviews アクションを追加した Browser-Use の Controller を返します。
+        """
+        if self._controller is not None:
+            return self._controller
+        # Browser-Use の読み込みには時間がかかるため、エージェントを使う場合にだけ読み込む
+        from browser_use import ActionResult, Controller
+        from pydantic import BaseModel
+
+        class RecordReviews(BaseModel):
+            product_url: str
+            reviews: list[str]
+            page: int | None = None
+
+        controller = Controller()
+        collector = self
+
+        @controller.action(
+            "Record the reviews shown on the current review page of a product. Call once per review page, "
+            "then move to the next page. Recorded reviews are saved outside your memory; do not repeat them "
+            "in the final output.",
+            param_model=RecordReviews,
+        )
+        async def record_reviews(params: RecordReviews):
+            added, total = collector.add(params.product_url, params.reviews, params.page)
+            message = f"{params.product_url} の口コミを {added} 件記録しました（累計 {total} 件）。"
+            return ActionResult(extracted_content=message, include_in_memory=True)
+
+        self._controller = controller
+        return controller
+
+
+@contextlib.contextmanager
+def collecting(collector):
+    """
+    with ブロックの中で起動するエージェントに、collector の record_reviews アクションを使わせます。
+    collector が None の場合は何もしません。
+    """
+    token = _active_collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _active_collector.reset(token)
+
+
+def active_collector():
+    """
+    collecting で設定された ReviewCollector を返します（設定されていなければ None）。
+    """
+    return _active_collector.get()
@@ -0,0 +1,142 @@
+# scrape_cache.py
+
+import hashlib  # キャッシュキーのハッシュ計算に使用
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import sqlite3  # キャッシュの永続化に使用
+import time
+import unicodedata
+from urllib.parse import urlparse
+
+
+DEFAULT_CACHE_DIR = ".ec_compass_cache"
+DEFAULT_TTL = 3600
+
+
+def _normalize_text(value):
+    """
+    全角/半角や大文字/小文字、前後の空白の違いを吸収した文字列を返します。
+    """
+    return unicodedata.normalize("NFKC", str(value)).strip().lower()
+
+
+def _normalize_site_url(url):
+    """
+    スキームや末尾のスラッシュの違いを吸収したサイトURLを返します。
+    """
+    parsed = urlparse(url or "")
+    host = (parsed.netloc or parsed.path).lower()
+    path = parsed.path.rstrip("/") if parsed.netloc else ""
+    return host + path
+
+
+def make_cache_key(site, search_parameters):
+    """
+    サイトと検索条件から、キャッシュキー（SHA-256のハッシュ値）を生成します。
+    キーワードの順序や表記ゆれ、辞書のキー順の違いではキーが変わらないよう正規化します。
+
+    引数:
+      site: ECサイト情報（辞書）
+      search_parameters: 検索条件を含む辞書
+
+    戻り値:
+      キャッシュキー（16進文字列）
+    """
+    browser_settings = search_parameters.get("browser_settings", {}) or {}
+    normalized = {
+        "site": _normalize_site_url(site.get("url", "")),
+        "keywords": sorted(_normalize_text(k) for k in search_parameters.get("keywords", []) or []),
+        "search_condition": search_parameters.get("search_condition", {}) or {},
+        "result_items": search_parameters.get("result_items", {}) or {},
+        "return_products_num": search_parameters.get("return_products_num"),
+        # 取得内容そのものを変える設定だけをキーに含める（use_vision などは結果の形に影響しない）
+        "reviews_per_product": browser_settings.get("reviews_per_product", 3),
+        "visit_official_site": bool(browser_settings.get("visit_official_site")),
+    }
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScrapeCache:
+    """
+    サイト単位のスクレイピング結果を SQLite に保存するキャッシュです。
+
+    キーはサイトURLと検索条件を正規化したハッシュ値で、有効期限（TTL）はサイトごとに
+    websites[].cache_ttl で、省略時は cache.default_ttl で指定します。
+    TTL は読み出し時に判定するため、設定を変更すると既存のキャッシュにもすぐ反映されます。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, default_ttl=DEFAULT_TTL, refresh=False):
+        """
+        引数:
+          cache_dir: キャッシュファイルを置くディレクトリ
+          default_ttl: サイトに cache_ttl が無い場合の有効期限（秒）
+          refresh: True の場合はキャッシュを読まずに再取得し、結果だけを書き込みます
+        """
+        self.default_ttl = default_ttl
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "scrape_cache.sqlite3")
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scrape_results ("
+                " cache_key TEXT PRIMARY KEY,"
+                " site_url TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " products TEXT NOT NULL)"
+            )
+
+    @classmethod
+    def from_settings(cls, cache_settings, refresh=False):
+        """
+        settings.yaml の cache セクションからキャッシュを作成します。
+        cache.enabled が false の場合は None を返します。
+        """
+        cache_settings = cache_settings or {}
+        if not cache_settings.get("enabled", True):
+            return None
+        return cls(
+            cache_dir=cache_settings.get("dir", DEFAULT_CACHE_DIR),
+            default_ttl=cache_settings.get("default_ttl", DEFAULT_TTL),
+            refresh=refresh,
+        )
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def ttl_for(self, site):
+        """
+        サイトごとの有効期限（秒）を返します。
+        """
+        return site.get("cache_ttl", self.default_ttl)
+
+    def get(self, site, search_parameters):
+        """
+        有効期限内のキャッシュがあれば製品情報のリストを返し、無ければ None を返します。
+        """
+        if self.refresh:
+            self.misses += 1
+            return None
+        key = make_cache_key(site, search_parameters)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT created_at, products FROM scrape_results WHERE cache_key = ?", (key,)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl_for(site):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[1])
+
+    def set(self, site, search_parameters, products):
+        """
+        サイトの製品情報リストをキャッシュに保存します。
+        """
+        key = make_cache_key(site, search_parameters)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO scrape_results (cache_key, site_url, created_at, products) VALUES (?, ?, ?, ?)",
+                (key, site.get("url", ""), time.time(), json.dumps(products, ensure_ascii=False)),
+            )
@@ -5,18 +5,25 @@ import json     # JSON形式のデータを扱うためのライブラリ
 import os
 import re  # 正規表現を扱うライブラリをインポートします
 import datetime
+import time
 
 # Browser-Useを利用するためのエージェントをインポート
 from browser_use import Agent
-from browser_use.browser.browser import Browser, BrowserConfig
-from browser_use.browser.context import BrowserContextConfig
+from browser_pool import BrowserPool
+from model_cascade import ANY_DOMAIN, ModelCascade, StepBudgetExceeded, site_domain
+from reviews import RECORD_ACTION, ReviewCollector, active_collector, collecting
+from pipeline import DEFAULT_QUEUE_SIZE, Stage, run_pipeline
+import tracing
 from llm_factory import get_llm
+from site_adapters import AdapterError, get_adapter
+from json_extract import extract_products, merge_fields, missing_fields, overwrite_fields, product_identity
 
 # LangChainのStructuredOutputParserを利用して、LLMの出力(result_str)をパース
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 
 
-def construct_task(websites, keywords, result_items=None, return_products_num=5, search_condition=None, browser_settings=None):
+def construct_task(websites, keywords, result_items=None, return_products_num=5, search_condition=None, browser_settings=None,
+                   exclude_urls=None):
     """
     ECサイト情報、検索キーワード、および抽出すべき製品情報に基づき、
     Browser-Use に渡すタスク命令文を生成します。
@@ -28,6 +35,7 @@ def construct_task(websites, keywords, result_items=None, return_products_num=5,
       return_products_num: 各サイトで取得する上位商品の件数
       search_condition: 検索条件（価格範囲、並び順、フィルター等）
       browser_settings: ブラウザの動作設定（vision使用有無、公式サイト訪問有無等）
+      exclude_urls: 取得済みのため対象から除外する商品URLのリスト
 
     戻り値:
       タスク命令文（文字列）
@@ -46,31 +54,15 @@ def construct_task(websites, keywords, result_items=None, return_products_num=5,
     lines.append(f"2. 各サイトごとに、空白区切りキーワード ({' '.join(keywords)}) を使用して検索してください。")
     
     # 3. 検索条件の適用
-    if search_condition:
-        lines.append("3. 以下の条件で検索結果を絞り込んでください：")
-        
-        # 価格範囲
-        if 'price_range' in search_condition:
-            price_range = search_condition['price_range']
-            if price_range.get('min') is not None:
-                lines.append(f"   - 最低価格: {price_range['min']}円以上")
-            if price_range.get('max') is not None:
-                lines.append(f"   - 最高価格: {price_range['max']}円以下")
-        
-        # 並び順
-        if 'sort_by' in search_condition:
-            lines.append(f"   - 並び順: {search_condition['sort_by']}")
-        
-        # フィルター条件
-        if 'filters' in search_condition and search_condition['filters']:
-            lines.append("   - 追加の絞り込み条件（可能な場合のみ適用してください）:")
-            for filter_condition in search_condition['filters']:
-                lines.append(f"     ・{filter_condition}")
-            lines.append("   ※ フィルタリングができない場合は、この条件を無視して商品情報を取得してください。")
+    lines.extend(_search_condition_lines(search_condition))
     
     # 4. 商品ページを開く
     lines.append(f"4. 検索結果ページで上位 {return_products_num} 件の商品をホイールクリックして新しいタブで開いてください。")
     lines.append("   ※ フィルタリングができなかった場合は、価格帯に合う商品を優先的に選んでください。")
+    if exclude_urls:
+        lines.append("   ※ 以下の商品は取得済みのため開かずに、次の順位の商品を選んでください：")
+        for url in exclude_urls:
+            lines.append(f"     ・{url}")
     
     # 5. 情報抽出
     if result_items:
@@ -81,14 +73,7 @@ def construct_task(websites, keywords, result_items=None, return_products_num=5,
         lines.append("   - 価格")
         lines.append("   - URL")
         
-        # 口コミ情報の取得設定
-        reviews_per_product = browser_settings.get('reviews_per_product', 3)
-        if reviews_per_product == 0:
-            lines.append("   - 口コミ情報は取得不要です")
-        elif reviews_per_product == -1:
-            lines.append("   - 全ての口コミ情報を取得してください")
-        else:
-            lines.append(f"   - 評価の高い順で{reviews_per_product}件の口コミ情報を取得してください")
+        lines.append(_reviews_instruction(browser_settings))
         
         lines.append("   - 商品の詳細情報（特徴、仕様、説明など）")
         
@@ -130,7 +115,8 @@ def construct_task(websites, keywords, result_items=None, return_products_num=5,
         lines.append(schema)
     
     # 最後の手順
-    lines.append("7. 次のサイトへ進んでください。")
+    if len(websites) > 1:
+        lines.append("7. 次のサイトへ進んでください。")
     lines.append("8. 全サイトの情報抽出が終了したら、必ず以下のJSON形式で全商品の情報をまとめて出力してください。")
     lines.append("   フィルタリングができなかった場合でも、取得できた商品情報は必ずJSON形式で出力してください。")
     lines.append("   出力の際は、JSONデータのみを出力し、説明文や追加のテキストは一切含めないでください。")
@@ -139,129 +125,1345 @@ def construct_task(websites, keywords, result_items=None, return_products_num=5,
     return "\n".join(lines)
 
 
-def run_browser_search(task, search_model="gpt-4o", ai_platform="openai", use_vision=True):
+def _search_condition_lines(search_condition):
     """
-    Browser-Use エージェントを使い、指定されたタスク命令文を実行して結果を取得します。
+    検索条件（価格範囲、並び順、フィルター）を絞り込むよう指示する、タスク命令文の「3.」の行を返します。
+    """
+    lines = []
+    if search_condition:
+        lines.append("3. 以下の条件で検索結果を絞り込んでください：")
+        
+        # 価格範囲
+        if 'price_range' in search_condition:
+            price_range = search_condition['price_range']
+            if price_range.get('min') is not None:
+                lines.append(f"   - 最低価格: {price_range['min']}円以上")
+            if price_range.get('max') is not None:
+                lines.append(f"   - 最高価格: {price_range['max']}円以下")
+        
+        # 並び順
+        if 'sort_by' in search_condition:
+            lines.append(f"   - 並び順: {search_condition['sort_by']}")
+        
+        # フィルター条件
+        if 'filters' in search_condition and search_condition['filters']:
+            lines.append("   - 追加の絞り込み条件（可能な場合のみ適用してください）:")
+            for filter_condition in search_condition['filters']:
+                lines.append(f"     ・{filter_condition}")
+            lines.append("   ※ フィルタリングができない場合は、この条件を無視して商品情報を取得してください。")
+    return lines
+
+
+def _reviews_instruction(browser_settings):
+    # 口コミ情報の取得設定
+    reviews_per_product = (browser_settings or {}).get('reviews_per_product', 3)
+    if reviews_per_product == 0:
+        return "   - 口コミ情報は取得不要です"
+    elif reviews_per_product == -1:
+        if active_collector() is not None:
+            # 口コミをエージェントの記憶や最終出力に溜めず、ページごとにアクションで書き出させる
+            return (
+                "   - 全ての口コミ情報を取得してください。ただし口コミは最終出力に含めず、口コミのページを1ページ読むごとに\n"
+                f"     {RECORD_ACTION} アクション（product_url: 商品ページのURL、reviews: そのページの口コミ本文のリスト"
+                "（評価があれば「★4 本文」のように先頭に付けてください）、page: ページ番号）で記録してから次のページへ進んでください。\n"
+                "     最終出力の reviews は空のリストにしてください"
+            )
+        return "   - 全ての口コミ情報を取得してください"
+    return f"   - 評価の高い順で{reviews_per_product}件の口コミ情報を取得してください"
+
+
+def construct_fill_task(site, incomplete_products, result_items, browser_settings=None):
+    """
+    取得済みの製品について、欠けている項目だけを取得し直すためのタスク命令文を生成します。
+
+    引数:
+      site: ECサイト情報（辞書）
+      incomplete_products: (製品情報, 欠けている項目名のリスト) のリスト
+      result_items: 抽出すべき製品情報のキーと説明（辞書）
+      browser_settings: ブラウザの動作設定（公式サイト訪問有無等）
+
+    戻り値:
+      タスク命令文（文字列）
+    """
+    lines = []
+    lines.append("以下の手順に従ってください。")
+    lines.append(f"1. {site.get('name', '不明')} の以下の商品ページを順に開き、指定された項目だけを抽出してください。")
+    lines.append("   検索や他の商品の閲覧は不要です。")
+    lines.append("また、サイト訪問中にモーダルウィンドウで広告が出ることがあります。そのときは、閉じるボタンで閉じてから再開してください。")
+    for product, fields in incomplete_products:
+        lines.append(f"- URL: {product.get('url')}")
+        lines.append("  取得する項目: " + ", ".join(f"{field}（{result_items.get(field, '')}）" for field in fields))
+    if any("reviews" in fields for _, fields in incomplete_products):
+        # 口コミの件数や記録方法は通常のタスクと同じ指示に従わせる
+        lines.append("   reviews は以下のとおり取得してください：")
+        lines.append(_reviews_instruction(browser_settings))
+    if browser_settings and browser_settings.get('visit_official_site'):
+        lines.append("   manufacturer_url や詳細情報が商品ページに無い場合は、メーカーの公式サイトの製品ページから取得してください。")
+    lines.append("2. 抽出した情報を、以下の形式の純粋なJSONのみで出力してください（url には上記の商品ページURLをそのまま入れてください）：")
+    lines.append('{"results": [{"url": "商品ページのURL", "項目名": "値", ...}, ...]}')
+    lines.append("   追加のテキストや説明は一切含めないでください。")
+    return "\n".join(lines)
+
+
+def construct_price_task(site, products):
+    """
+    既知の商品について、現在の価格だけを確認するためのタスク命令文を生成します（差分取得用）。
+    口コミや詳細情報、公式サイトは確認しないため、通常のタスクより少ないステップで終わります。
+
+    引数:
+      site: ECサイト情報（辞書）
+      products: 価格を確認する製品情報のリスト
+
+    戻り値:
+      タスク命令文（文字列）
+    """
+    lines = []
+    lines.append("以下の手順に従ってください。")
+    lines.append(f"1. {site.get('name', '不明')} の以下の商品ページを順に開き、現在の価格だけを確認してください。")
+    lines.append("   検索や他の商品の閲覧、口コミ・詳細情報・公式サイトの確認は不要です。")
+    lines.append("また、サイト訪問中にモーダルウィンドウで広告が出ることがあります。そのときは、閉じるボタンで閉じてから再開してください。")
+    for product in products:
+        lines.append(f"- URL: {product.get('url')}")
+    lines.append("2. 確認した価格を、以下の形式の純粋なJSONのみで出力してください（url には上記の商品ページURLをそのまま入れてください）：")
+    lines.append('{"results": [{"url": "商品ページのURL", "price": 価格（数値）}, ...]}')
+    lines.append("   販売終了などで価格が表示されていない場合は price を null にしてください。")
+    lines.append("   追加のテキストや説明は一切含めないでください。")
+    return "\n".join(lines)
+
+
+def construct_listing_task(site, keywords, return_products_num=5, search_condition=None, exclude_urls=None):
+    """
+    パイプラインの一覧段階のタスク命令文を生成します。検索結果から商品ページのURLを集めるだけで、商品ページは開きません。
+
+    戻り値:
+      タスク命令文（文字列）
+    """
+    lines = []
+    lines.append("以下の手順に従ってください。")
+    lines.append("1. 対象サイトにアクセスしてください。")
+    lines.append(f"- {site.get('name', '不明')} (URL: {site.get('url', '不明')})")
+    lines.append("また、サイト訪問中にモーダルウィンドウで広告が出ることがあります。そのときは、閉じるボタンで閉じてから再開してください。")
+    lines.append(f"2. 空白区切りキーワード ({' '.join(keywords)}) を使用して検索してください。")
+    lines.extend(_search_condition_lines(search_condition))
+    lines.append(f"4. 検索結果ページで上位 {return_products_num} 件の商品の商品名・価格・商品ページのURLを記録してください。")
+    lines.append("   商品ページは開かないでください（口コミや詳細情報は別の担当が取得します）。")
+    if exclude_urls:
+        lines.append("   ※ 以下の商品は取得済みのため除外し、次の順位の商品を選んでください：")
+        for url in exclude_urls:
+            lines.append(f"     ・{url}")
+    lines.append("5. 記録した商品を、以下の形式の純粋なJSONのみで出力してください：")
+    lines.append('{"results": [{"product_name": "商品名", "price": 価格（数値）, "url": "商品ページのURL"}, ...]}')
+    lines.append("   追加のテキストや説明は一切含めないでください。")
+    return "\n".join(lines)
+
+
+def construct_detail_task(site, product, result_items, browser_settings=None):
+    """
+    パイプラインの詳細段階のタスク命令文を生成します。1つの商品ページから価格・口コミ・仕様を抽出します。
+    メーカーの公式サイトは開かず、リンクがあればURLだけを記録します（公式サイトは次の段階で確認します）。
+
+    戻り値:
+      タスク命令文（文字列）
+    """
+    lines = []
+    lines.append("以下の手順に従ってください。")
+    lines.append(f"1. {site.get('name', '不明')} の以下の商品ページを開いてください。検索や他の商品の閲覧は不要です。")
+    lines.append(f"- URL: {product.get('url')}")
+    lines.append("また、サイト訪問中にモーダルウィンドウで広告が出ることがあります。そのときは、閉じるボタンで閉じてから再開してください。")
+    lines.append("2. 商品ページで、以下の情報を抽出してください：")
+    lines.append("   - 商品名")
+    lines.append("   - 価格")
+    lines.append(_reviews_instruction(browser_settings))
+    lines.append("   - 商品の詳細情報（特徴、仕様、説明など）")
+    lines.append("   - メーカーの公式サイトへのリンクがあれば、そのURL（公式サイトは開かないでください）")
+    lines.append("3. 抽出した情報を、以下の形式の純粋なJSONのみで出力してください（url には上記の商品ページURLをそのまま入れてください）：")
+    keys = result_items.keys() if isinstance(result_items, dict) and result_items else ("product_name", "price", "url")
+    lines.append('{"results": [{' + ", ".join(f'"{key}": "値"' for key in keys) + '}]}')
+    if isinstance(result_items, dict):
+        for key, desc in result_items.items():
+            lines.append(f"   - {key}: {desc}")
+    lines.append("   追加のテキストや説明は一切含めないでください。")
+    return "\n".join(lines)
+
+
+def construct_official_task(product):
+    """
+    パイプラインの公式サイト段階のタスク命令文を生成します。メーカーの公式サイトの製品ページから仕様と特徴を抽出します。
+
+    戻り値:
+      タスク命令文（文字列）
+    """
+    lines = []
+    lines.append("以下の手順に従ってください。")
+    lines.append("1. 以下の商品について、メーカーの公式サイトの製品ページを開いてください。")
+    lines.append(f"   商品名: {product.get('product_name', '')}")
+    lines.append(f"   商品ページ: {product.get('url', '')}")
+    if product.get("manufacturer_url"):
+        lines.append(f"- URL: {product.get('manufacturer_url')}")
+    else:
+        lines.append("   公式サイトのURLが分からないため、商品名で検索して公式サイトの製品ページを開いてください。")
+    lines.append("2. 公式サイトから詳細な製品仕様と特徴を抽出してください。")
+    lines.append("3. 以下の形式の純粋なJSONのみで出力してください（url には上記の商品ページのURLをそのまま入れてください）：")
+    lines.append('{"results": [{"url": "商品ページのURL", "manufacturer_url": "公式サイトの製品ページのURL", "details": "仕様と特徴"}]}')
+    lines.append("   追加のテキストや説明は一切含めないでください。")
+    return "\n".join(lines)
+
+
+async def run_agent(task, search_model="gpt-4o", ai_platform="openai", use_vision=True, browser_pool=None, on_step=None,
+                    max_steps=None):
+    """
+    Browser-Use エージェントを1つ起動し、タスク命令文を実行して結果文字列を返します（非同期版）。
 
     引数:
       task: タスク命令文（文字列）
       search_model: 使用するLLMのモデル名
       ai_platform: 使用するAIプラットフォームの名前
       use_vision: ブラウザの視覚情報を使用するかどうか（True/False）
+      browser_pool: 起動済みの BrowserPool。指定した場合はプールのブラウザコンテキストを使用します
+      on_step: ステップで抽出された内容を受け取るコールバック on_step(step_number, extracted_contents)。
+        エージェントが途中で失敗しても、それまでに抽出できた内容を保存できます
+      max_steps: ステップ数の上限。指定した場合、上限までに完了しなければ StepBudgetExceeded を送出します
 
     戻り値:
       エージェントの実行結果（文字列）
     """
-    async def async_run():
-        llm = get_llm(ai_platform, search_model)
-        combined_task = "以下の指示に従ってください。\n" + task
-        agent = Agent(task=combined_task, llm=llm, use_vision=use_vision, generate_gif=False)
-        result = await agent.run()
-        if hasattr(result, "final_result"):
-            result_str = result.final_result()
-        elif isinstance(result, list) and result:
-            try:
-                result_str = result[-1].message.content
-            except AttributeError:
-                result_str = str(result)
-        elif isinstance(result, str):
-            result_str = result
-        else:
+    llm = get_llm(ai_platform, search_model)
+    run_options = {"max_steps": max_steps} if max_steps else {}
+    combined_task = "以下の指示に従ってください。\n" + task
+    agent_options = {"use_vision": use_vision, "generate_gif": False}
+    collector = active_collector()
+    if collector is not None:
+        # 口コミをページごとに書き出す record_reviews アクションを使えるようにする
+        agent_options["controller"] = collector.controller()
+    agent = None
+    reported_steps = 0
+    step_started_at = time.perf_counter()
+
+    def report_new_steps(step_number):
+        # 前回の通知以降に履歴へ追加されたステップの抽出内容をまとめて通知する
+        nonlocal reported_steps
+        history_items = agent.history.history
+        new_items = history_items[reported_steps:]
+        reported_steps = len(history_items)
+        contents = [r.extracted_content for item in new_items for r in item.result if r.extracted_content]
+        if contents:
+            on_step(step_number, contents)
+
+    def on_new_step(step_number):
+        # 前のステップの終了（＝次のステップの開始）として、ステップごとの所要時間を記録する
+        nonlocal step_started_at
+        now = time.perf_counter()
+        tracing.record_span("agent.step", now - step_started_at, step=step_number)
+        step_started_at = now
+        if on_step is not None:
+            report_new_steps(step_number)
+
+    # 新しいステップの開始時に呼ばれるため、直前までのステップの結果を通知できる
+    agent_options["register_new_step_callback"] = lambda state, model_output, step_number: on_new_step(step_number)
+
+    with tracing.span("agent.run", model=search_model, platform=ai_platform, use_vision=use_vision) as agent_span:
+        try:
+            if browser_pool is None:
+                agent = Agent(task=combined_task, llm=llm, **agent_options)
+                result = await agent.run(**run_options)
+            else:
+                async with browser_pool.context() as browser_context:
+                    agent = Agent(task=combined_task, llm=llm, browser_context=browser_context, **agent_options)
+                    result = await agent.run(**run_options)
+        finally:
+            if agent is not None:
+                tracing.count("agent_steps", agent.n_steps)
+                if agent_span is not None:
+                    agent_span.set_attribute("steps", agent.n_steps)
+            if on_step is not None and agent is not None:
+                report_new_steps(agent.n_steps)
+    if max_steps and hasattr(result, "is_done") and not result.is_done():
+        raise StepBudgetExceeded(f"{max_steps} ステップで完了しませんでした。")
+    if hasattr(result, "final_result"):
+        result_str = result.final_result()
+    elif isinstance(result, list) and result:
+        try:
+            result_str = result[-1].message.content
+        except AttributeError:
             result_str = str(result)
-        return result_str
-    return asyncio.run(async_run())
+    elif isinstance(result, str):
+        result_str = result
+    else:
+        result_str = str(result)
+    return result_str
+
+
+def _has_final_products(result_str):
+    """
+    エージェントの最終出力から製品情報（{"results": [...]}）を1件以上読み取れるかを返します。
+    """
+    return bool(result_str) and bool(extract_products([result_str]))
+
+
+def _products_validator(required_fields, browser_settings=None):
+    """
+    model_cascade の validate に使う、最終出力の製品情報を result_items のスキーマで検証する関数を返します。
+
+    製品情報を1件以上読み取れ、どの製品にも required_fields の項目の欠けが無い場合に合格とします。
+    欠けているかどうかは再取得（_refill_missing）と同じ基準で判定します。
+    required_fields が空の場合は、製品情報を読み取れるかだけを確認します（_has_final_products）。
+    """
+    if not isinstance(required_fields, dict) or not required_fields:
+        return _has_final_products
+
+    def validate(result_str):
+        products = extract_products([result_str]) if result_str else []
+        if not products:
+            return False
+        return not any(_fields_to_refill(p, required_fields, browser_settings or {}) for p in products)
+    return validate
+
+
+async def run_agent_with_cascade(task, cascade, domain=ANY_DOMAIN, browser_pool=None, on_step=None, validate=None):
+    """
+    ModelCascade の段階を安いものから順に使ってタスクを実行します（非同期版）。
+    最終出力が validate を通らない場合・タイムアウトした場合・ステップ数の上限を超えた場合は次の段階で再実行し、
+    成功した段階を domain ごとに記録します。
+
+    引数:
+      task: タスク命令文（文字列）
+      cascade: ModelCascade
+      domain: 段階を記録するドメイン名（model_cascade.site_domain の戻り値）
+      browser_pool / on_step: run_agent を参照
+      validate: 最終出力を検証する関数（_products_validator の戻り値）。省略時は製品情報を読み取れるかだけを確認します
+
+    戻り値:
+      エージェントの実行結果（文字列）
+    """
+    async def run_tier(tier):
+        return await run_agent(task, tier["search_model"], tier["ai_platform"], tier["use_vision"],
+                               browser_pool=browser_pool, on_step=on_step, max_steps=tier["max_steps"])
+    return await cascade.run(domain, run_tier, validate or _has_final_products)
+
+
+async def _run_task(task, search_model, ai_platform, use_vision, browser_pool=None, on_step=None, cascade=None,
+                    domain=ANY_DOMAIN, validate=None):
+    # cascade があれば段階を切り替えながら、無ければ指定されたモデルで実行する
+    if cascade is None:
+        return await run_agent(task, search_model, ai_platform, use_vision, browser_pool=browser_pool, on_step=on_step)
+    return await run_agent_with_cascade(task, cascade, domain, browser_pool=browser_pool, on_step=on_step,
+                                        validate=validate)
+
+
+def _cascade_from(browser_settings, search_model, ai_platform, use_vision):
+    return ModelCascade.from_settings((browser_settings or {}).get("model_cascade"), search_model, ai_platform,
+                                      use_vision)
+
+
+def _run_sync(make_coro, browser_runtime=None):
+    """
+    非同期版の処理を、同期的に呼び出せるように実行します。
+
+    browser_runtime を指定した場合はそのイベントループとプールで、指定しない場合は asyncio.run で
+    新しいイベントループを作って実行します。make_coro(browser_pool) はコルーチンを返す関数で、
+    browser_pool には browser_runtime のプール（指定しない場合は None）が渡されます。
+    """
+    if browser_runtime is not None:
+        return browser_runtime.run(make_coro(browser_runtime.pool))
+    return asyncio.run(make_coro(None))
+
+
+async def run_browser_search_async(task, search_model="gpt-4o", ai_platform="openai", use_vision=True,
+                                   browser_settings=None, on_step=None, browser_pool=None, domain=ANY_DOMAIN,
+                                   required_fields=None):
+    """
+    run_browser_search の非同期版です。呼び出し元のイベントループで実行します。
+
+    引数:
+      browser_pool: 起動済みの BrowserPool。None の場合は実行の間だけブラウザを1つ起動します
+      その他の引数は run_browser_search と同じです
+
+    戻り値:
+      エージェントの実行結果（文字列）
+    """
+    cascade = _cascade_from(browser_settings, search_model, ai_platform, use_vision)
+    validate = _products_validator(required_fields, browser_settings)
+    if browser_pool is not None:
+        return await _run_task(task, search_model, ai_platform, use_vision, browser_pool=browser_pool, on_step=on_step,
+                               cascade=cascade, domain=domain, validate=validate)
+    async with BrowserPool.from_settings(browser_settings, default_size=1) as pool:
+        return await _run_task(task, search_model, ai_platform, use_vision, browser_pool=pool, on_step=on_step,
+                               cascade=cascade, domain=domain, validate=validate)
+
+
+def run_browser_search(task, search_model="gpt-4o", ai_platform="openai", use_vision=True, browser_settings=None,
+                       on_step=None, browser_runtime=None, domain=ANY_DOMAIN, required_fields=None):
+    """
+    Browser-Use エージェントを使い、指定されたタスク命令文を実行して結果を取得します。
+
+    引数:
+      task: タスク命令文（文字列）
+      search_model: 使用するLLMのモデル名
+      ai_platform: 使用するAIプラットフォームの名前
+      use_vision: ブラウザの視覚情報を使用するかどうか（True/False）
+      browser_settings: ブラウザの動作設定（browser_pool・model_cascade の設定を参照します）
+      on_step: ステップで抽出された内容を受け取るコールバック（run_agent を参照）
+      browser_runtime: 起動済みの BrowserRuntime。指定した場合はそのプールとイベントループで実行します
+      domain: model_cascade が有効な場合に、成功した段階を記録するドメイン名
+      required_fields: model_cascade が有効な場合に、最終出力の製品情報に欠けていてはならない項目（result_items の形式）。
+        欠けている製品があれば次の段階で再実行します。省略時は製品情報を読み取れるかだけを確認します
+
+    戻り値:
+      エージェントの実行結果（文字列）
+    """
+    return _run_sync(lambda pool: run_browser_search_async(task, search_model, ai_platform, use_vision,
+                                                           browser_settings, on_step, pool, domain, required_fields),
+                     browser_runtime)
+
+
+async def run_parallel_browser_search_async(tasks, search_model="gpt-4o", ai_platform="openai", use_vision=True,
+                                            max_concurrency=3, browser_settings=None, on_steps=None, browser_pool=None,
+                                            domains=None, required_fields=None):
+    """
+    run_parallel_browser_search の非同期版です。呼び出し元のイベントループで実行します。
+
+    引数:
+      browser_pool: 起動済みの BrowserPool。None の場合は実行の間だけ同時実行数分のブラウザを起動します
+      その他の引数は run_parallel_browser_search と同じです
+
+    戻り値:
+      tasks と同じ順序の結果リスト。失敗したタスクの位置には例外オブジェクトが入ります。
+    """
+    on_steps = on_steps or [None] * len(tasks)
+    domains = domains or [ANY_DOMAIN] * len(tasks)
+    required_fields = required_fields or [None] * len(tasks)
+    cascade = _cascade_from(browser_settings, search_model, ai_platform, use_vision)
+
+    async def run_all(pool):
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def run_one(task, on_step, domain, fields):
+            async with semaphore:
+                return await _run_task(task, search_model, ai_platform, use_vision, browser_pool=pool, on_step=on_step,
+                                       cascade=cascade, domain=domain,
+                                       validate=_products_validator(fields, browser_settings))
+
+        # 1サイトの失敗が他サイトの結果を巻き込まないよう、例外も結果として受け取る
+        return await asyncio.gather(*(run_one(task, on_step, domain, fields)
+                                      for task, on_step, domain, fields in zip(tasks, on_steps, domains,
+                                                                               required_fields)),
+                                    return_exceptions=True)
+
+    if browser_pool is not None:
+        return await run_all(browser_pool)
+    # 同時実行数を超えるブラウザは使われないため、プールの大きさもそこで頭打ちにする
+    default_size = min(max(1, max_concurrency), len(tasks))
+    async with BrowserPool.from_settings(browser_settings, default_size=default_size) as pool:
+        return await run_all(pool)
+
+
+def run_parallel_browser_search(tasks, search_model="gpt-4o", ai_platform="openai", use_vision=True, max_concurrency=3,
+                                browser_settings=None, on_steps=None, browser_runtime=None, domains=None,
+                                required_fields=None):
+    """
+    複数のタスク命令文を、それぞれ専用の Browser-Use エージェントで並列に実行します。
+    同時に動くエージェント数は max_concurrency で制限されます。
+
+    引数:
+      tasks: タスク命令文のリスト（サイトごとに1つ）
+      search_model: 使用するLLMのモデル名
+      ai_platform: 使用するAIプラットフォームの名前
+      use_vision: ブラウザの視覚情報を使用するかどうか（True/False）
+      max_concurrency: 同時実行するエージェント数の上限
+      browser_settings: ブラウザの動作設定（browser_pool・model_cascade の設定を参照します）
+      on_steps: tasks と同じ順序の、各エージェントのステップ通知コールバックのリスト（run_agent の on_step を参照）
+      browser_runtime: 起動済みの BrowserRuntime。指定した場合はそのプールとイベントループで実行します
+      domains: tasks と同じ順序の、model_cascade の段階を記録するドメイン名のリスト
+      required_fields: tasks と同じ順序の、最終出力の製品情報に欠けていてはならない項目のリスト
+        （run_browser_search を参照。None の要素は製品情報を読み取れるかだけを確認します）
+
+    戻り値:
+      tasks と同じ順序の結果リスト。失敗したタスクの位置には例外オブジェクトが入ります。
+    """
+    return _run_sync(lambda pool: run_parallel_browser_search_async(tasks, search_model, ai_platform, use_vision,
+                                                                    max_concurrency, browser_settings, on_steps, pool,
+                                                                    domains, required_fields),
+                     browser_runtime)
+
 
+def build_schema_description(result_items, ai_platform):
+    """
+    StructuredOutputParser に渡すスキーマ説明文を生成します。
 
-def scrape_data(websites, search_parameters):
+    引数:
+      result_items: 抽出すべき製品情報のキー（辞書）
+      ai_platform: 使用するAIプラットフォームの名前
+
+    戻り値:
+      スキーマ説明文（文字列）
+    """
+    if ai_platform.lower() == "google":
+        return (
+            "A JSON object with key 'results', where results is an array of objects. "
+            "Each object must have the following properties: site_name (string), product_name (string), "
+            "price (number), url (string), reviews (string), details (string), "
+            "manufacturer_url (string). "
+            "Ensure that the output is pure valid JSON without extra text."
+        )
+    elif result_items and isinstance(result_items, dict) and len(result_items) > 0:
+        keys_description = ", ".join([f"'{key}': {desc}" for key, desc in result_items.items()])
+        return (
+            "A JSON object should be returned with a key 'results' mapping to a list of product objects. "
+            "Each product object must have the following keys: " + keys_description + " "
+            "Ensure that the output is pure valid JSON without additional text or explanations."
+        )
+    else:
+        return (
+            "A JSON object should be returned with a key 'results' mapping to a list of product objects. "
+            "Each product object must contain the keys: 'product_name' (string), 'url' (string), and "
+            "'price' (number). Ensure that the output is pure valid JSON without additional text or explanations."
+        )
+
+
+def parse_result(result_str, schema_description):
+    """
+    エージェントの出力文字列を {"results": [...]} 形式の辞書にパースします。
+    パースに失敗した場合は例外を送出します。
+
+    引数:
+      result_str: エージェントの実行結果（文字列）
+      schema_description: build_schema_description で生成したスキーマ説明文
+
+    戻り値:
+      パース済みの辞書
+    """
+    schemas = [
+        ResponseSchema(name="results", description=schema_description)
+    ]
+    output_parser = StructuredOutputParser.from_response_schemas(schemas)
+    return output_parser.parse(result_str)
+
+
+def save_product_data(product_data, output_dir="."):
+    """
+    パース済みの製品情報を output_dir の scraped_data.json に保存します。
+    """
+    path = os.path.join(output_dir, 'scraped_data.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(product_data, f, ensure_ascii=False, indent=2)
+    print(f"スクレイピング結果を {path} に保存しました。")
+
+
+def save_raw_result(result_str, output_dir="."):
+    """
+    パースできなかった生の結果文字列を output_dir の scraped_data.txt に保存します。
+    """
+    path = os.path.join(output_dir, 'scraped_data.txt')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(result_str)
+    print(f"生のスクレイピング結果を {path} に保存しました。")
+
+
+def scrape_data(websites, search_parameters, scrape_cache=None, checkpoint=None, browser_runtime=None, output_dir=".",
+                product_store=None):
     """
     指定されたECサイトリストと検索条件に基づき、Browser-Useを利用して製品情報を取得します。
     すべてのサイトの検索結果をまとめた製品情報リスト（辞書形式）を返します。
 
+    browser_settings.parallel_sites が有効な場合は、サイトごとに専用のタスクとエージェントを作成し、
+    max_concurrent_agents を上限として並列に実行した結果を1つの {"results": [...]} にまとめます。
+    scrape_cache を指定した場合は、有効期限内のキャッシュがあるサイトについてはブラウザもエージェントも起動しません。
+    checkpoint を指定した場合は、サイト・製品ごとの途中経過を実行ディレクトリに保存し、
+    完了済みのサイトと取得済みの製品をスキップして続きから取得します。
+    product_store を指定した場合は取得結果を履歴として記録し、差分取得（incremental）が有効であれば、
+    既知の商品は価格だけを再確認して、口コミ・詳細情報は新しい商品と古くなった商品だけ取得し直します。
+
     引数:
       websites: 複数のECサイト情報を含むリスト
       search_parameters: 検索条件を含む辞書
+      scrape_cache: サイト単位の結果キャッシュ（ScrapeCache）。None の場合はキャッシュを使用しません
+      checkpoint: 途中経過の保存先（RunCheckpoint）。None の場合は保存しません
+      browser_runtime: 起動済みの BrowserRuntime。指定した場合は実行ごとにブラウザを起動せず、そのプールを使います
+      output_dir: scraped_data.json / scraped_data.txt の保存先ディレクトリ
+      product_store: 製品情報の履歴（ProductStore）。None の場合は記録も差分取得も行いません
 
     戻り値:
       製品情報を含むリスト。各製品情報は辞書形式です。
     """
+    return _run_sync(lambda pool: scrape_data_async(websites, search_parameters, scrape_cache, checkpoint, pool, output_dir,
+                                                    product_store),
+                     browser_runtime)
+
+
+async def scrape_data_async(websites, search_parameters, scrape_cache=None, checkpoint=None, browser_pool=None,
+                            output_dir=".", product_store=None, timeout=None):
+    """
+    scrape_data の非同期版です。呼び出し元のイベントループで実行するため、既存の asyncio のサービスに組み込んだり、
+    複数の検索条件の取得やレポート生成を1つのループ上で並行に進めたりできます。
+
+    取得中のタスクがキャンセルされた場合は、起動したブラウザを閉じて asyncio.CancelledError を送出します。
+    checkpoint を指定していれば、それまでに取得できた製品は次回の実行で再利用されます。
+
+    引数:
+      browser_pool: 起動済みの BrowserPool。None の場合はエージェントの実行ごとにブラウザを起動します
+      timeout: 取得全体の制限時間（秒）。超えた場合は取得を中断して asyncio.TimeoutError を送出します
+      その他の引数は scrape_data と同じです
+
+    戻り値:
+      scrape_data と同じです
+    """
+    if timeout is not None:
+        return await asyncio.wait_for(
+            scrape_data_async(websites, search_parameters, scrape_cache, checkpoint, browser_pool, output_dir,
+                              product_store),
+            timeout)
+
     # 各種パラメータの取得
     keywords = search_parameters.get("keywords", [])
     result_items = search_parameters.get("result_items", [])
     return_products_num = search_parameters.get("return_products_num", None)
     search_condition = search_parameters.get("search_condition", {})
     browser_settings = search_parameters.get("browser_settings", {})
-    
+
+    # AIモデルの設定を取得
+    search_model = search_parameters.get("search_model", "gpt-4o")
+    ai_platform = search_parameters.get("ai_platform", "openai")
+    use_vision = browser_settings.get("use_vision", True)
+
+    # キャッシュ・チェックポイントの確認
+    merged_results = []
+    has_products = False
+    pending_sites = []
+    for site in websites:
+        cached = scrape_cache.get(site, search_parameters) if scrape_cache is not None else None
+        if cached is not None:
+            print(f"{site.get('name', '不明')} はキャッシュされた結果を使用します。")
+            tracing.count("scrape_cache_hits")
+            merged_results.extend(cached)
+            has_products = True
+            continue
+        completed = checkpoint.load_site(site) if checkpoint is not None else None
+        if completed is not None:
+            print(f"{site.get('name', '不明')} は実行 {checkpoint.run_id} で取得済みのためスキップします。")
+            merged_results.extend(completed)
+            has_products = True
+            continue
+        pending_sites.append(site)
+
+    # reviews_per_product が -1 の場合は、口コミをエージェントに溜めさせず、ページごとにファイルへ書き出して集計する
+    collector = ReviewCollector.from_settings(browser_settings, checkpoint.path if checkpoint is not None else output_dir)
+    with collecting(collector):
+        # 差分取得: 既知の商品は価格だけを再確認する
+        incremental_outcomes = []
+        if pending_sites and product_store is not None and product_store.incremental:
+            with tracing.span("scrape.incremental", sites=len(pending_sites)):
+                incremental_outcomes, pending_sites = await _scrape_incrementally(pending_sites, search_parameters,
+                                                                                  product_store, browser_pool)
+        incremental_outcomes = _apply_review_summaries(incremental_outcomes, collector)
+
+        # サイトアダプタがあるサイトは、エージェントを使わずにHTTPとHTMLパーサーで取得する
+        adapter_outcomes = []
+        if pending_sites and browser_settings.get("use_site_adapters", True):
+            # アダプタはHTTPで同期的に取得するため、イベントループを止めないよう別スレッドで実行する
+            adapter_outcomes, pending_sites = await asyncio.to_thread(_scrape_with_adapters, pending_sites,
+                                                                      search_parameters)
+        adapter_outcomes = _apply_review_summaries(adapter_outcomes, collector)
+
+        agent_outcomes = []
+        if pending_sites:
+            # スキーマの設定
+            schema_description = build_schema_description(result_items, ai_platform)
+            print("Using schema description: ", schema_description)
+
+            if (browser_settings.get("pipeline") or {}).get("enabled"):
+                agent_outcomes = await _scrape_sites_pipelined(
+                    pending_sites, keywords, result_items, return_products_num, search_condition, browser_settings,
+                    search_model, ai_platform, use_vision, checkpoint, browser_pool
+                )
+            elif browser_settings.get("parallel_sites") and len(pending_sites) > 1:
+                agent_outcomes = await _scrape_sites_in_parallel(
+                    pending_sites, keywords, result_items, return_products_num, search_condition, browser_settings,
+                    search_model, ai_platform, use_vision, schema_description, checkpoint, browser_pool
+                )
+            else:
+                agent_outcomes = await _scrape_sites_together(
+                    pending_sites, keywords, result_items, return_products_num, search_condition, browser_settings,
+                    search_model, ai_platform, use_vision, schema_description, checkpoint, browser_pool
+                )
+            # 口コミを記録した製品は、欠けている項目の判定の前に集計と代表的な口コミを反映する
+            agent_outcomes = _apply_review_summaries(agent_outcomes, collector)
+
+            # 欠けている項目・不足している製品だけを再取得する（エージェントで取得したサイトのみ）
+            if browser_settings.get("max_refill_attempts", 1) > 0:
+                with tracing.span("scrape.refill"):
+                    agent_outcomes = await _refill_missing(
+                        agent_outcomes, keywords, result_items, return_products_num, search_condition, browser_settings,
+                        search_model, ai_platform, use_vision, browser_pool
+                    )
+                agent_outcomes = _apply_review_summaries(agent_outcomes, collector)
+    if product_store is not None:
+        # 差分取得の結果は _scrape_incrementally で記録済み
+        for site, products, _ in adapter_outcomes + agent_outcomes:
+            if site is not None and products:
+                product_store.record(site, search_parameters, products)
+    site_outcomes = incremental_outcomes + adapter_outcomes + agent_outcomes
+
+    # サイトごとの結果を統合
+    raw_results = []
+    for site, products, raw_result in site_outcomes:
+        if products is None:
+            if raw_result:
+                raw_results.append(raw_result)
+            continue
+        has_products = True
+        merged_results.extend(products)
+        if site is not None:
+            if scrape_cache is not None:
+                scrape_cache.set(site, search_parameters, products)
+            if checkpoint is not None:
+                checkpoint.save_site(site, products)
+
+    if has_products:
+        product_data = {"results": merged_results}
+        save_product_data(product_data, output_dir)
+        if raw_results:
+            save_raw_result("\n\n".join(raw_results), output_dir)
+        return product_data
+
+    if raw_results:
+        # パースに失敗した場合は、生の結果文字列をそのまま返す
+        result_str = "\n\n".join(raw_results)
+        save_raw_result(result_str, output_dir)
+        return result_str
+
+    return "Browser-Useの実行に失敗しました。"
+
+
+def _apply_review_summaries(outcomes, collector):
+    """
+    サイトごとの結果に、ReviewCollector で集計した口コミ（review_summary と代表的な口コミ）を反映します。
+    collector が None の場合はそのまま返します。
+    """
+    if collector is None:
+        return outcomes
+    return [(site, collector.apply(products) if products else products, raw) for site, products, raw in outcomes]
+
+
+def _scrape_with_adapters(websites, search_parameters):
+    """
+    サイトアダプタが登録されているサイトを、アダプタで取得します。
+
+    戻り値:
+      (アダプタで取得できたサイトの結果リスト, エージェントで取得すべき残りのサイトのリスト)
+    """
+    outcomes = []
+    remaining_sites = []
+    for site in websites:
+        adapter = get_adapter(site.get("url", ""))
+        if adapter is None:
+            remaining_sites.append(site)
+            continue
+        site_name = site.get('name', '不明')
+        unsupported = adapter.unsupported_conditions(search_parameters)
+        if unsupported:
+            print(f"{site_name} のサイトアダプタは {', '.join(unsupported)} の指定に対応していないため、Browser-Useで取得します。")
+            remaining_sites.append(site)
+            continue
+        try:
+            with tracing.span("adapter.scrape", site=site_name):
+                products = adapter.scrape(site, search_parameters)
+        except (AdapterError, NotImplementedError) as e:
+            print(f"{site_name} のサイトアダプタでの取得に失敗しました。Browser-Useで取得します。エラー:", e)
+            remaining_sites.append(site)
+            continue
+        except Exception as e:
+            # ページ構造の変更などによる想定外の解析エラーも、エージェントで取得し直す
+            print(f"{site_name} のサイトアダプタで予期しないエラーが発生しました。Browser-Useで取得します。エラー:", e)
+            remaining_sites.append(site)
+            continue
+        print(f"{site_name} はサイトアダプタで {len(products)} 件の製品情報を取得しました。")
+        outcomes.append((site, products, None))
+    return outcomes, remaining_sites
+
+
+async def _scrape_incrementally(websites, search_parameters, product_store, browser_pool=None):
+    """
+    前回までに取得済みの商品（同じサイト・検索条件）について、価格だけを再確認します。
+
+    口コミ・詳細情報が product_store.max_detail_age より古い商品は、欠けている項目の再取得と同じ
+    商品ページ単位のタスクで全項目を取り直します。既知の商品が return_products_num に満たないサイトは
+    新しい商品を探す必要があるため、通常どおり取得するサイトとして返します。
+    価格の確認に失敗したサイトも、通常どおり取得するサイトとして返します。
+
+    戻り値:
+      (差分取得できたサイトの結果リスト, 通常どおり取得すべき残りのサイトのリスト)
+    """
+    result_items = search_parameters.get("result_items", {}) or {}
+    return_products_num = search_parameters.get("return_products_num", None)
+    browser_settings = search_parameters.get("browser_settings", {}) or {}
+    search_model = search_parameters.get("search_model", "gpt-4o")
+    ai_platform = search_parameters.get("ai_platform", "openai")
+    use_vision = browser_settings.get("use_vision", True)
+    use_adapters = browser_settings.get("use_site_adapters", True)
+    skipped_fields = ("site_name", "url", "reviews") if browser_settings.get("reviews_per_product", 3) == 0 else ("site_name", "url")
+    detail_fields = [key for key in result_items if key not in skipped_fields] if isinstance(result_items, dict) else []
+
+    now = time.time()
+    plans = []
+    remaining_sites = []
+    tasks = []
+    targets = []
+    for site in websites:
+        known = product_store.known_products(site, search_parameters, limit=return_products_num)
+        if not known or (return_products_num is not None and len(known) < return_products_num):
+            remaining_sites.append(site)
+            continue
+        fresh = [k["product"] for k in known if not product_store.is_detail_stale(k, now)]
+        stale = [k["product"] for k in known if product_store.is_detail_stale(k, now)]
+        adapter = get_adapter(site.get("url", "")) if use_adapters else None
+        if adapter is not None and adapter.unsupported_conditions(search_parameters):
+            adapter = None
+        if adapter is not None and stale:
+            # アダプタは商品ページ・仕様・口コミをHTTPで取得できるため、サイトごと取り直す
+            remaining_sites.append(site)
+            continue
+        plan = {"site": site, "products": [k["product"] for k in known], "prices": {}, "details": {},
+                "price_only_urls": {p.get("url") for p in fresh}, "adapter": adapter, "failed": False}
+        plans.append(plan)
+        if adapter is None and fresh:
+            tasks.append(construct_price_task(site, fresh))
+            targets.append((plan, "price"))
+        if stale:
+            tasks.append(construct_fill_task(site, [(p, detail_fields) for p in stale], result_items, browser_settings))
+            targets.append((plan, "detail"))
+        print(f"{site.get('name', '不明')} は既知の {len(known)} 件のうち {len(fresh)} 件の価格だけを再確認し、"
+              f"{len(stale)} 件の口コミ・詳細情報を取り直します。")
+
+    # アダプタのあるサイトは、商品ページだけをHTTPで取得して価格を確認する
+    for plan in plans:
+        if plan["adapter"] is None:
+            continue
+        try:
+            prices = await asyncio.to_thread(plan["adapter"].scrape_prices, sorted(plan["price_only_urls"]))
+        except Exception as e:
+            print(f"{plan['site'].get('name', '不明')} の価格の再確認に失敗しました。エラー:", e)
+            prices = []
+        if not prices:
+            plan["failed"] = True
+        plan["prices"].update({product_identity(p): p for p in prices})
+
+    if tasks:
+        recorders = [_StepRecorder(None, []) for _ in tasks]
+        try:
+            results = await run_parallel_browser_search_async(
+                tasks, search_model, ai_platform, use_vision, browser_settings.get("max_concurrent_agents", 3),
+                browser_settings=browser_settings, on_steps=recorders, browser_pool=browser_pool,
+                domains=[site_domain(plan["site"]) for plan, _ in targets])
+        except Exception as e:
+            print("差分取得のためのBrowser-Useの実行に失敗しました。エラー:", e)
+            results = [e] * len(tasks)
+        for (plan, kind), result_str, recorder in zip(targets, results, recorders):
+            if isinstance(result_str, Exception):
+                print(f"{plan['site'].get('name', '不明')} の差分取得に失敗しました。エラー:", result_str)
+                plan["failed"] = True
+                continue
+            found = {product_identity(p): p for p in extract_products([result_str or ""] + recorder.contents)}
+            plan["prices" if kind == "price" else "details"].update(found)
+
+    outcomes = []
+    for plan in plans:
+        site = plan["site"]
+        if plan["failed"]:
+            remaining_sites.append(site)
+            continue
+        products = []
+        refreshed = []
+        for product in plan["products"]:
+            key = product_identity(product)
+            if key in plan["details"]:
+                product = overwrite_fields(product, plan["details"][key])
+                refreshed.append(product)
+            elif key in plan["prices"]:
+                product = dict(product, price=plan["prices"][key].get("price"))
+                refreshed.append(product)
+            products.append(product)
+        if len(refreshed) < len(products):
+            print(f"{site.get('name', '不明')} の {len(products) - len(refreshed)} 件は再確認できなかったため、前回の情報を使用します。")
+        # 再確認できなかった商品は、前回の値を新しいスナップショットとして記録しない
+        product_store.record(site, search_parameters, refreshed, price_only_urls=plan["price_only_urls"])
+        outcomes.append((site, products, None))
+    return outcomes, remaining_sites
+
+
+def _merge_products(*product_lists):
+    """
+    複数の製品リストを、URL（無ければ商品名）の重複を除いて連結します。先に現れたものを優先し、
+    空の項目だけを後から現れたもので補います。
+    """
+    merged = {}
+    for products in product_lists:
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            key = product_identity(product) or id(product)
+            merged[key] = merge_fields(merged[key], product) if key in merged else product
+    return list(merged.values())
+
+
+class _StepRecorder:
+    """
+    エージェントのステップごとの抽出内容を集め、チェックポイントが指定されていれば
+    抽出内容とそこから読み取れた製品情報を保存する、run_agent の on_step 用コールバックです。
+    site が None の場合（1つのエージェントが複数サイトを巡回する場合）は、製品を site_name でサイトに振り分けます。
+    """
+
+    def __init__(self, checkpoint, websites, site=None):
+        self.checkpoint = checkpoint
+        self.websites = websites
+        self.site = site
+        self.contents = []
+
+    def __call__(self, step_number, contents):
+        self.contents.extend(contents)
+        if self.checkpoint is None:
+            return
+        self.checkpoint.save_step(self.site, step_number, contents)
+        products = extract_products(contents)
+        if self.site is not None:
+            for product in products:
+                self.checkpoint.save_product(self.site, product)
+            return
+        for assigned_site, assigned_products, _ in _assign_results_to_sites(self.websites, products):
+            if assigned_site is not None:
+                for product in assigned_products:
+                    self.checkpoint.save_product(assigned_site, product)
+
+
+def _parse_agent_output(result_str, step_contents, schema_description):
+    """
+    エージェントの最終出力を製品情報のリストに変換します。
+
+    まず StructuredOutputParser で厳密にパースし、失敗した場合は最終出力と各ステップの抽出内容から
+    読み取れるJSONを修正しながらすべて拾い集めます。1件も見つからなければ None を返します。
+    """
+    with tracing.span("parse") as parse_span:
+        try:
+            return parse_result(result_str, schema_description).get("results", [])
+        except Exception as e:
+            print("JSONのパースに失敗しました。出力の中から読み取れる製品情報を抽出します。エラー:", e)
+        products = extract_products([result_str or ""] + list(step_contents))
+        if parse_span is not None:
+            parse_span.set_attribute("salvaged", len(products))
+        if not products:
+            return None
+        print(f"{len(products)} 件の製品情報を抽出しました。")
+        return products
+
+
+def _remaining_products_num(return_products_num, done_products):
+    """
+    取得済みの製品数を差し引いた、これから取得すべき製品数を返します（指定が無い場合は None）。
+    """
+    if return_products_num is None:
+        return None
+    return max(0, return_products_num - len(done_products))
+
+
+def _assign_results_to_sites(websites, products):
+    """
+    1つのエージェントが複数サイトを巡回した結果を、site_name を手がかりにサイトごとに振り分けます。
+    どのサイトにも対応付けられなかった製品は site=None のグループにまとめます。
+    """
+    if len(websites) == 1:
+        return [(websites[0], products, None)]
+    if not products:
+        return [(None, [], None)]
+
+    grouped = {id(site): [] for site in websites}
+    unassigned = []
+    for product in products:
+        product_site_name = str(product.get("site_name", "")).lower() if isinstance(product, dict) else ""
+        for site in websites:
+            site_name = str(site.get("name", "")).lower()
+            if site_name and product_site_name and (site_name in product_site_name or product_site_name in site_name):
+                grouped[id(site)].append(product)
+                break
+        else:
+            unassigned.append(product)
+
+    outcomes = [(site, grouped[id(site)], None) for site in websites if grouped[id(site)]]
+    if unassigned:
+        outcomes.append((None, unassigned, None))
+    return outcomes
+
+
+async def _scrape_sites_together(websites, keywords, result_items, return_products_num, search_condition,
+                                 browser_settings, search_model, ai_platform, use_vision, schema_description,
+                                 checkpoint=None, browser_pool=None):
+    """
+    1つのエージェントで全サイトを順番に巡回してスクレイピングします。
+
+    戻り値:
+      (サイト, 製品情報リスト, 生の結果文字列) のリスト。パースに失敗した場合は製品情報リストが None になります。
+    """
+    # 前回の実行で取得済みの製品は除外し、残りの件数だけを取得する
+    done_by_site = {id(site): checkpoint.load_products(site) if checkpoint is not None else [] for site in websites}
+    exclude_urls = [p.get("url") for products in done_by_site.values() for p in products if p.get("url")]
+    remaining_by_site = {id(site): _remaining_products_num(return_products_num, done_by_site[id(site)])
+                         for site in websites}
+    # 取得済みの製品で件数が足りているサイトは巡回しない
+    done_outcomes = [(site, done_by_site[id(site)], None) for site in websites if remaining_by_site[id(site)] == 0]
+    websites = [site for site in websites if remaining_by_site[id(site)] != 0]
+    if not websites:
+        return done_outcomes
+    # 1つのタスクで全サイトを巡回するため、サイトごとの残りの件数のうち最大のものを指示する
+    remaining = None if return_products_num is None else max(remaining_by_site[id(site)] for site in websites)
+
     # タスク命令文の作成
     task_instruction = construct_task(
         websites,
         keywords,
         result_items,
-        return_products_num,
+        remaining,
         search_condition,
-        browser_settings
+        browser_settings,
+        exclude_urls
     )
-    
-    product_data = []
 
+    recorder = _StepRecorder(checkpoint, websites)
     try:
-        # AIモデルの設定を取得
-        search_model = search_parameters.get("search_model", "gpt-4o")
-        ai_platform = search_parameters.get("ai_platform", "openai")
-        use_vision = browser_settings.get("use_vision", True)
-
         # Browser-Useの実行
-        result_str = run_browser_search(task_instruction, search_model, ai_platform, use_vision)
-        
-        # スキーマの設定
-        if ai_platform.lower() == "google":
-            schema_description = (
-                "A JSON object with key 'results', where results is an array of objects. "
-                "Each object must have the following properties: site_name (string), product_name (string), "
-                "price (number), url (string), reviews (string), details (string), "
-                "manufacturer_url (string). "
-                "Ensure that the output is pure valid JSON without extra text."
-            )
-        elif result_items and isinstance(result_items, dict) and len(result_items) > 0:
-            keys_description = ", ".join([f"'{key}': {desc}" for key, desc in result_items.items()])
-            schema_description = (
-                "A JSON object should be returned with a key 'results' mapping to a list of product objects. "
-                "Each product object must have the following keys: " + keys_description + " "
-                "Ensure that the output is pure valid JSON without additional text or explanations."
-            )
-        else:
-            schema_description = (
-                "A JSON object should be returned with a key 'results' mapping to a list of product objects. "
-                "Each product object must contain the keys: 'product_name' (string), 'url' (string), and "
-                "'price' (number). Ensure that the output is pure valid JSON without additional text or explanations."
-            )
-        
-        print("Using schema description: ", schema_description)
-        schemas = [
-            ResponseSchema(name="results", description=schema_description)
+        result_str = await run_browser_search_async(
+            task_instruction, search_model, ai_platform, use_vision, browser_settings, on_step=recorder,
+            browser_pool=browser_pool, domain=site_domain(websites[0]) if len(websites) == 1 else ANY_DOMAIN,
+            required_fields=result_items)
+    except Exception as e:
+        print("Browser-Useの実行に失敗しました。エラー:", e)
+        return done_outcomes + _partial_outcomes(websites, done_by_site, checkpoint,
+                                                 extract_products(recorder.contents))
+    print(f"result_str: \n{result_str}")
+
+    # 結果のパース
+    products = _parse_agent_output(result_str, recorder.contents, schema_description)
+    if products is None:
+        print("製品情報を抽出できませんでした。生の結果を使用します。")
+        return done_outcomes + [(None, None, result_str)]
+    outcomes = []
+    for site, site_products, raw in _assign_results_to_sites(websites, products):
+        if site is not None:
+            site_products = _merge_products(done_by_site.get(id(site), []), site_products)
+            if return_products_num is not None:
+                site_products = site_products[:return_products_num]
+        outcomes.append((site, site_products, raw))
+    return done_outcomes + outcomes
+
+
+def _partial_outcomes(websites, done_by_site, checkpoint, salvaged=()):
+    """
+    エージェントが失敗した場合に、途中までに取得できた製品情報を未完了のまま返します。
+    site=None として返すため、キャッシュや完了済みとしては記録されず、再開時には続きから取得されます。
+
+    引数:
+      salvaged: 失敗したエージェントの途中の抽出内容から読み取れた製品情報
+    """
+    saved = [p for site in websites for p in checkpoint.load_products(site)] if checkpoint is not None else []
+    partial = _merge_products([p for products in done_by_site.values() for p in products], saved, salvaged)
+    if not partial:
+        return []
+    message = f"途中までに取得できた {len(partial)} 件の製品情報を使用します。"
+    if checkpoint is not None:
+        message += f"（--resume {checkpoint.run_id} で残りを再取得できます）"
+    print(message)
+    return [(None, partial, None)]
+
+
+async def _scrape_sites_in_parallel(websites, keywords, result_items, return_products_num, search_condition,
+                                    browser_settings, search_model, ai_platform, use_vision, schema_description,
+                                    checkpoint=None, browser_pool=None):
+    """
+    サイトごとに1エージェントを割り当てて並列にスクレイピングします。
+    一部のサイトが失敗しても、成功したサイトの製品情報は保持されます。
+
+    戻り値:
+      (サイト, 製品情報リスト, 生の結果文字列) のリスト。パースに失敗した場合は製品情報リストが None になります。
+    """
+    max_concurrency = browser_settings.get("max_concurrent_agents", 3)
+
+    outcomes = []
+    run_sites = []
+    tasks = []
+    on_steps = []
+    done_by_site = {}
+    for site in websites:
+        # 前回の実行で取得済みの製品は除外し、残りの件数だけを取得する
+        done = checkpoint.load_products(site) if checkpoint is not None else []
+        done_by_site[id(site)] = done
+        remaining = _remaining_products_num(return_products_num, done)
+        if remaining == 0:
+            outcomes.append((site, done, None))
+            continue
+        run_sites.append(site)
+        tasks.append(construct_task([site], keywords, result_items, remaining,
+                                    search_condition, browser_settings, [p.get("url") for p in done if p.get("url")]))
+        on_steps.append(_StepRecorder(checkpoint, [site], site))
+
+    if not tasks:
+        return outcomes
+
+    try:
+        site_results = await run_parallel_browser_search_async(
+            tasks, search_model, ai_platform, use_vision, max_concurrency, browser_settings=browser_settings,
+            on_steps=on_steps, browser_pool=browser_pool, domains=[site_domain(site) for site in run_sites],
+            required_fields=[result_items] * len(tasks))
+    except Exception as e:
+        print("Browser-Useの実行に失敗しました。エラー:", e)
+        return outcomes + _partial_outcomes(run_sites, done_by_site, checkpoint)
+
+    for site, result_str, recorder in zip(run_sites, site_results, on_steps):
+        site_name = site.get('name', '不明')
+        if isinstance(result_str, Exception):
+            print(f"{site_name} でBrowser-Useの実行に失敗しました。エラー:", result_str)
+            outcomes.extend(_partial_outcomes([site], {id(site): done_by_site[id(site)]}, checkpoint,
+                                              extract_products(recorder.contents)))
+            continue
+        print(f"result_str ({site_name}): \n{result_str}")
+        products = _parse_agent_output(result_str, recorder.contents, schema_description)
+        if products is None:
+            print(f"{site_name} の製品情報を抽出できませんでした。")
+            outcomes.append((site, None, f"[{site_name}]\n{result_str}"))
+            continue
+        outcomes.append((site, _merge_products(done_by_site[id(site)], products), None))
+    return outcomes
+
+
+def _stage_options(pipeline_settings, name, search_model, ai_platform, use_vision, default_concurrency, cascade=None):
+    """
+    パイプラインの段階ごとの設定（browser_settings.pipeline.<段階名>）を返します。
+    モデル・vision の指定が無い項目は search_parameters の値を使います。
+    段階でモデル・vision のどれかを指定した場合は、model_cascade を使わずにその指定で実行します。
+    """
+    stage_settings = pipeline_settings.get(name, {}) or {}
+    overridden = any(key in stage_settings for key in ("search_model", "ai_platform", "use_vision"))
+    return {
+        "cascade": None if overridden else cascade,
+        "search_model": stage_settings.get("search_model", search_model),
+        "ai_platform": stage_settings.get("ai_platform", ai_platform),
+        "use_vision": stage_settings.get("use_vision", use_vision),
+        "concurrency": max(1, stage_settings.get("concurrency", default_concurrency)),
+        "timeout": stage_settings.get("timeout"),
+    }
+
+
+async def _scrape_sites_pipelined(websites, keywords, result_items, return_products_num, search_condition,
+                                  browser_settings, search_model, ai_platform, use_vision, checkpoint=None,
+                                  browser_pool=None):
+    """
+    一覧・詳細・公式サイトの3段階に分けたエージェントを、上限付きのキューでつないで並行に実行します。
+
+      listing: サイトごとに検索結果から商品ページのURLを集める
+      detail: 商品ページごとに価格・口コミ・仕様を抽出する
+      official: 製品ごとにメーカーの公式サイトから仕様と特徴を取得する（visit_official_site が有効な場合のみ）
+
+    1つのエージェントが全商品を順に処理する場合と違い、時間のかかる公式サイトの確認は他の商品の詳細の抽出と
+    並行して進みます。段階ごとの同時実行数・モデル・タイムアウトは browser_settings.pipeline で指定します。
+    詳細の抽出に失敗した商品は一覧の情報だけで残し、欠けた項目は _refill_missing で再取得します。
+
+    戻り値:
+      (サイト, 製品情報リスト, 生の結果文字列) のリスト
+    """
+    pipeline_settings = browser_settings.get("pipeline", {}) or {}
+    default_concurrency = browser_settings.get("max_concurrent_agents", 3)
+    cascade = _cascade_from(browser_settings, search_model, ai_platform, use_vision)
+    listing = _stage_options(pipeline_settings, "listing", search_model, ai_platform, use_vision,
+                             min(default_concurrency, len(websites)), cascade)
+    detail = _stage_options(pipeline_settings, "detail", search_model, ai_platform, use_vision, default_concurrency,
+                            cascade)
+    official = _stage_options(pipeline_settings, "official", search_model, ai_platform, use_vision, default_concurrency,
+                              cascade)
+    visit_official_site = browser_settings.get("visit_official_site", False)
+
+    done_by_site = {id(site): checkpoint.load_products(site) if checkpoint is not None else [] for site in websites}
+    products_by_site = {id(site): [] for site in websites}
+    # 段階の処理は完了した順になるため、検索結果での順位を覚えておき最後に並べ直す
+    ranks = {}
+    failed_sites = set()
+    run_sites = []
+    for site in websites:
+        remaining = _remaining_products_num(return_products_num, done_by_site[id(site)])
+        if remaining != 0:
+            run_sites.append(site)
+
+    # 詳細段階の出力の検証に使う項目。url・site_name は一覧の値を使い、メーカーのURLはリンクがある場合だけ記録させる
+    detail_fields = ({key: desc for key, desc in result_items.items() if key not in ("site_name", "url", "manufacturer_url")}
+                     if isinstance(result_items, dict) else None)
+
+    async def run_stage_agent(options, task, pool, site, required_fields=None):
+        return await _run_task(task, options["search_model"], options["ai_platform"], options["use_vision"],
+                               browser_pool=pool, cascade=options["cascade"], domain=site_domain(site),
+                               validate=_products_validator(required_fields, browser_settings))
+
+    def build_stages(pool):
+        async def list_products(site):
+            done = done_by_site[id(site)]
+            remaining = _remaining_products_num(return_products_num, done)
+            task = construct_listing_task(site, keywords, remaining if remaining is not None else 5, search_condition,
+                                          [p.get("url") for p in done if p.get("url")])
+            entries = [p for p in extract_products([await run_stage_agent(listing, task, pool, site) or ""]) if p.get("url")]
+            if remaining is not None:
+                entries = entries[:remaining]
+            print(f"{site.get('name', '不明')} の検索結果から {len(entries)} 件の商品を見つけました。")
+            for rank, entry in enumerate(entries):
+                ranks[entry["url"]] = rank
+            return [(site, dict(entry, site_name=entry.get("site_name") or site.get("name", ""))) for entry in entries]
+
+        def listing_failed(site, error):
+            failed_sites.add(id(site))
+            return []
+
+        async def extract_detail(item):
+            site, entry = item
+            task = construct_detail_task(site, entry, result_items, browser_settings)
+            found = extract_products([await run_stage_agent(detail, task, pool, site, detail_fields) or ""])
+            updates = {product_identity(p): p for p in found}
+            # 商品ページの値を優先し、取れなかった項目は一覧の値で補う
+            product = merge_fields(updates.get(product_identity(entry)) or (found[0] if found else {}), entry)
+            product["url"] = entry["url"]
+            return [(site, product)]
+
+        async def resolve_official(item):
+            site, product = item
+            found = extract_products([await run_stage_agent(official, construct_official_task(product), pool, site) or ""])
+            if not found:
+                return [item]
+            update = found[0]
+            product = dict(product)
+            if update.get("manufacturer_url"):
+                product["manufacturer_url"] = update["manufacturer_url"]
+            if update.get("details"):
+                product["details"] = "\n".join(
+                    str(part) for part in (product.get("details"), f"公式サイト: {update['details']}") if part)
+            return [(site, product)]
+
+        stages = [
+            Stage("listing", list_products, listing["concurrency"], listing["timeout"], on_error=listing_failed),
+            Stage("detail", extract_detail, detail["concurrency"], detail["timeout"], on_error=lambda item, e: [item]),
         ]
-        print(f"result_str: \n{result_str}")
-        
-        # 結果のパース
+        if visit_official_site:
+            stages.append(Stage("official", resolve_official, official["concurrency"], official["timeout"],
+                                on_error=lambda item, e: [item]))
+        return stages
+
+    def on_result(item):
+        site, product = item
+        products_by_site[id(site)].append(product)
+        if checkpoint is not None:
+            checkpoint.save_product(site, product)
+
+    queue_size = pipeline_settings.get("queue_size", DEFAULT_QUEUE_SIZE)
+
+    async def run_all(pool):
+        return await run_pipeline(run_sites, build_stages(pool), queue_size, on_result)
+
+    if run_sites:
         try:
-            output_parser = StructuredOutputParser.from_response_schemas(schemas)
-            product_data = output_parser.parse(result_str)
+            if browser_pool is not None:
+                await run_all(browser_pool)
+            else:
+                # 全段階のエージェントが同時に動けるだけのブラウザを用意する
+                pool_size = listing["concurrency"] + detail["concurrency"] + (
+                    official["concurrency"] if visit_official_site else 0)
+                async with BrowserPool.from_settings(browser_settings, default_size=pool_size) as pool:
+                    await run_all(pool)
+        except Exception as e:
+            print("Browser-Useの実行に失敗しました。エラー:", e)
+            return _partial_outcomes(websites, done_by_site, checkpoint,
+                                     [p for products in products_by_site.values() for p in products])
+
+    outcomes = []
+    for site in websites:
+        found = sorted(products_by_site[id(site)], key=lambda p: ranks.get(p.get("url"), len(ranks)))
+        products_by_site[id(site)] = found
+        products = _merge_products(done_by_site[id(site)], found)
+        if id(site) in failed_sites:
+            # 一覧の取得に失敗したサイトは未完了として扱い、キャッシュや完了済みとしては記録しない
+            outcomes.extend(_partial_outcomes([site], {id(site): done_by_site[id(site)]}, checkpoint,
+                                              products_by_site[id(site)]))
+        elif products:
+            outcomes.append((site, products, None))
+    return outcomes
+
+
+def _fields_to_refill(product, result_items, browser_settings):
+    """
+    製品情報の欠けている項目のうち、再取得すべきものを返します。
+
+    口コミを取得しない設定（reviews_per_product: 0）の場合や、口コミをページごとに記録している場合
+    （reviews_per_product: -1 で ReviewCollector が有効）は、reviews が空でも欠けているとはみなしません。
+    記録した口コミは最終出力に含めないよう指示しているため、空であることが正常な結果です。
+    """
+    fields = missing_fields(product, result_items)
+    reviews_per_product = browser_settings.get("reviews_per_product", 3)
+    if reviews_per_product == 0 or (reviews_per_product == -1 and active_collector() is not None):
+        fields = [field for field in fields if field != "reviews"]
+    return fields
+
+
+async def _refill_missing(outcomes, keywords, result_items, return_products_num, search_condition, browser_settings,
+                          search_model, ai_platform, use_vision, browser_pool=None):
+    """
+    抽出できた製品情報を result_items のスキーマで検証し、欠けている項目と不足している製品だけを
+    サイトごとの小さなタスクで再取得します。取得済みの項目・製品は取り直しません。
+
+    再取得は browser_settings.max_refill_attempts 回（既定: 1回）まで行います。
+
+    戻り値:
+      欠けていた項目・製品を補った outcomes
+    """
+    if not isinstance(result_items, dict) or not result_items:
+        return outcomes
+    outcomes = list(outcomes)
+    max_concurrency = browser_settings.get("max_concurrent_agents", 3)
 
-            # パース済みのデータを保存
-            with open('scraped_data.json', 'w', encoding='utf-8') as f:
-                json.dump(product_data, f, ensure_ascii=False, indent=2)
-            print("スクレイピング結果を scraped_data.json に保存しました。")
+    for attempt in range(browser_settings.get("max_refill_attempts", 1)):
+        tasks = []
+        targets = []
+        for index, (site, products, _) in enumerate(outcomes):
+            if site is None or products is None:
+                continue
+            incomplete = [(p, _fields_to_refill(p, result_items, browser_settings)) for p in products if p.get("url")]
+            incomplete = [(p, fields) for p, fields in incomplete if fields]
+            if incomplete:
+                tasks.append(construct_fill_task(site, incomplete, result_items, browser_settings))
+                targets.append((index, "fill"))
+            remaining = _remaining_products_num(return_products_num, products)
+            if remaining:
+                exclude_urls = [p.get("url") for p in products if p.get("url")]
+                tasks.append(construct_task([site], keywords, result_items, remaining, search_condition,
+                                            browser_settings, exclude_urls))
+                targets.append((index, "more"))
+        if not tasks:
+            break
 
+        print(f"欠けている項目・製品を再取得します（{attempt + 1}回目、{len(tasks)} タスク）。")
+        recorders = [_StepRecorder(None, []) for _ in tasks]
+        try:
+            results = await run_parallel_browser_search_async(
+                tasks, search_model, ai_platform, use_vision, max_concurrency, browser_settings=browser_settings,
+                on_steps=recorders, browser_pool=browser_pool,
+                domains=[site_domain(outcomes[index][0]) for index, _ in targets],
+                # 不足した製品を探すタスクは result_items の全項目で検証する（項目の補完はURLと指定した項目だけを出力させる）
+                required_fields=[result_items if kind == "more" else None for _, kind in targets])
         except Exception as e:
-            print("JSONのパースに失敗しました。生の結果を使用します。エラー:", e)
-            # パースに失敗した場合は、生の結果文字列をそのまま返す
-            product_data = result_str
-            # 生の結果も保存しておく
-            with open('scraped_data.txt', 'w', encoding='utf-8') as f:
-                f.write(result_str)
-            print("生のスクレイピング結果を scraped_data.txt に保存しました。")
+            print("再取得のためのBrowser-Useの実行に失敗しました。エラー:", e)
+            break
 
-    except Exception as e:
-        print("Browser-Useの実行に失敗しました。エラー:", e)
-        product_data = "Browser-Useの実行に失敗しました。"
-    
-    return product_data
\ No newline at end of file
+        for (index, kind), result_str, recorder in zip(targets, results, recorders):
+            if isinstance(result_str, Exception):
+                print("再取得に失敗しました。エラー:", result_str)
+                continue
+            found = extract_products([result_str or ""] + recorder.contents)
+            site, products, raw = outcomes[index]
+            if kind == "fill":
+                updates = {product_identity(p): p for p in found}
+                products = [merge_fields(p, updates.get(product_identity(p), {})) for p in products]
+            else:
+                products = _merge_products(products, found)
+                if return_products_num is not None:
+                    products = products[:return_products_num]
+            outcomes[index] = (site, products, raw)
+    return outcomes
@@ -0,0 +1,495 @@
+# service.py
+
+import contextvars
+import datetime
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import sqlite3  # ジョブキューの永続化に使用
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from batch import _run_job, _safe_job_id
+from browser_pool import BrowserRuntime
+from llm_factory import get_llm
+import tracing
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_RETRIES = 1
+DEFAULT_OUTPUT_DIR = "service_out"
+
+# 終了した（これ以上状態が変わらない）ジョブの状態
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+# 進捗のストリームで新しいイベントを確認する間隔（秒）
+_POLL_INTERVAL = 0.5
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+class JobStore:
+    """
+    比較ジョブのキューと進捗のイベントを SQLite に保存します（<output_dir>/jobs.sqlite3）。
+    サービスを再起動しても、待機中のジョブと実行途中だったジョブは続きから実行されます。
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR):
+        os.makedirs(output_dir, exist_ok=True)
+        self.path = os.path.join(output_dir, "jobs.sqlite3")
+        # 待機中のジョブを複数のワーカーが同時に取り出さないようにする
+        self._claim_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " override TEXT NOT NULL,"
+                " created_at TEXT NOT NULL,"
+                " started_at TEXT,"
+                " finished_at TEXT,"
+                " result TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                " event_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " job_id TEXT NOT NULL,"
+                " time TEXT NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, event_id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    @staticmethod
+    def _to_dict(row):
+        job_id, status, override, created_at, started_at, finished_at, result = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "config": json.loads(override),
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "result": json.loads(result) if result else None,
+        }
+
+    def submit(self, override, job_id=None):
+        """
+        ジョブを待機中として追加します。同じIDのジョブが既にある場合は ValueError を送出します。
+
+        戻り値:
+          追加したジョブ（辞書）
+        """
+        job_id = _safe_job_id(job_id) if job_id else datetime.datetime.now().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        try:
+            with self._connect() as conn:
+                conn.execute("INSERT INTO jobs (job_id, status, override, created_at) VALUES (?, 'queued', ?, ?)",
+                             (job_id, json.dumps(override, ensure_ascii=False), _now()))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"ジョブID {job_id} は既に使われています。")
+        self.add_event(job_id, "status", {"status": "queued"})
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """
+        ジョブ（辞書）を返します。存在しない場合は None を返します。
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT job_id, status, override, created_at, started_at, finished_at, result"
+                               " FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        """
+        新しい順にジョブのリストを返します。status を指定した場合はその状態のジョブだけを返します。
+        """
+        query = "SELECT job_id, status, override, created_at, started_at, finished_at, result FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created_at DESC, rowid DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self):
+        """
+        状態ごとのジョブ数を返します。
+        """
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def claim_next(self):
+        """
+        最も古い待機中のジョブを実行中にして返します。待機中のジョブが無ければ None を返します。
+        """
+        with self._claim_lock, self._connect() as conn:
+            row = conn.execute("SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at, rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE job_id = ?", (_now(), row[0]))
+        return self.get(row[0])
+
+    def finish(self, job_id, status, result=None):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE job_id = ?",
+                         (status, _now(), json.dumps(result, ensure_ascii=False) if result is not None else None, job_id))
+
+    def cancel(self, job_id):
+        """
+        待機中のジョブを取り消します。取り消せた場合は True を返します（実行中・終了済みのジョブは取り消せません）。
+        """
+        with self._claim_lock, self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                                  (_now(), job_id))
+        if cursor.rowcount:
+            self.add_event(job_id, "status", {"status": "cancelled"})
+        return bool(cursor.rowcount)
+
+    def requeue_interrupted(self):
+        """
+        前回のサービスの終了時に実行中だったジョブを待機中に戻し、その件数を返します。
+        チェックポイントはジョブIDごとに保存されているため、取得済みのサイト・製品はスキップして再開されます。
+        """
+        with self._connect() as conn:
+            cursor = conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+        return cursor.rowcount
+
+    def add_event(self, job_id, kind, data):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO job_events (job_id, time, kind, data) VALUES (?, ?, ?, ?)",
+                         (job_id, _now(), kind, json.dumps(data, ensure_ascii=False)))
+
+    def events(self, job_id, after=0):
+        """
+        event_id が after より大きいイベントを古い順に返します。
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT event_id, time, kind, data FROM job_events"
+                                " WHERE job_id = ? AND event_id > ? ORDER BY event_id", (job_id, after)).fetchall()
+        return [{"id": event_id, "time": time_, "kind": kind, "data": json.loads(data)}
+                for event_id, time_, kind, data in rows]
+
+
+class _JobStatusLog:
+    """
+    batch._run_job が書き込むジョブの状態（開始・リトライ・成功・失敗）を、ジョブのイベントとして記録します。
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def write(self, job_id, status, **fields):
+        self.store.add_event(job_id, "status", dict(fields, status=status))
+
+
+class _JobProgress:
+    """
+    ジョブの実行中に開始・終了したスパン（スクレイピングの段階、サイトごとの取得、エージェントの実行、
+    レポート生成など）を、そのジョブの進捗イベントとして記録します（tracing.listening の通知先）。
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def __call__(self, event):
+        try:
+            self.store.add_event(self.job_id, "progress", event)
+        except sqlite3.Error as e:
+            print(f"ジョブ {self.job_id} の進捗を記録できませんでした。エラー:", e)
+
+
+class ComparisonService:
+    """
+    比較ジョブを受け付けて、起動済みのブラウザプールとLLMクライアントで実行し続けるサービスです。
+
+    1回ごとに python main.py を起動する場合と違い、インタプリタ・ライブラリの読み込み、ブラウザの起動、
+    LLMクライアントの作成は起動時に1回だけ行います。ジョブは workers 個のワーカースレッドで並列に実行し、
+    キャッシュ・レート制限・製品情報の履歴は全ジョブで共有します。
+    各ジョブの report.md / scraped_data.json は <output_dir>/<ジョブID>/ に出力します。
+
+    使用例:
+      with ComparisonService(config) as service:
+          job = service.submit({"product": "...", "search_parameters": {"keywords": [...]}})
+    """
+
+    def __init__(self, base_config, output_dir=None, workers=None, max_retries=None, scrape_cache=None,
+                 product_store=None):
+        """
+        引数:
+          base_config: 基本の設定（settings.yaml を読み込んだ辞書）。ジョブの設定はこれに重ねる上書き設定です
+          output_dir: 出力先ディレクトリ（省略時は service.output_dir）
+          workers: 同時に実行するジョブ数（省略時は service.workers）
+          max_retries: 失敗したジョブを再実行する回数（省略時は service.max_retries）
+          scrape_cache: 全ジョブで共有するスクレイピング結果のキャッシュ（ScrapeCache）
+          product_store: 全ジョブで共有する製品情報の履歴（ProductStore）
+        """
+        service_settings = base_config.get("service", {}) or {}
+        self.base_config = base_config
+        self.output_dir = output_dir or service_settings.get("output_dir", DEFAULT_OUTPUT_DIR)
+        self.workers = max(1, workers or service_settings.get("workers", DEFAULT_WORKERS))
+        self.max_retries = max(0, max_retries if max_retries is not None
+                               else service_settings.get("max_retries", DEFAULT_MAX_RETRIES))
+        self.scrape_cache = scrape_cache
+        self.product_store = product_store
+        self.store = JobStore(self.output_dir)
+        self.runtime = None
+        self._threads = []
+        self._wakeup = threading.Condition()
+        self._stopping = False
+
+    def start(self):
+        """
+        ブラウザプールを起動し、LLMクライアントを作成してから、ワーカースレッドを開始します。
+        """
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            print(f"前回の終了時に実行中だった {requeued} 件のジョブを再実行します。")
+        browser_settings = self.base_config.get("search_parameters", {}).get("browser_settings", {})
+        self.runtime = BrowserRuntime.from_settings(browser_settings, default_size=self.workers).start()
+        self._warm_up_llms()
+        for index in range(self.workers):
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(self._work,),
+                                      name=f"service-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _warm_up_llms(self):
+        # ジョブの最初の呼び出しでクライアントを作成する時間がかからないよう、設定のモデルのインスタンスを作っておく
+        search_params = self.base_config.get("search_parameters", {})
+        reporting = self.base_config.get("reporting", {}) or {}
+        report_platform = reporting.get("ai_platform", self.base_config.get("ai_platform", "openai"))
+        report_model = reporting.get("report_model", self.base_config.get("report_model", "gpt-4o-mini"))
+
+        async def warm_up_agent_llm():
+            # エージェントはランタイムのイベントループで動くため、そのループ用のインスタンスを作る
+            get_llm(search_params.get("ai_platform", "openai"), search_params.get("search_model", "gpt-4o"))
+
+        try:
+            self.runtime.run(warm_up_agent_llm())
+            get_llm(report_platform, report_model, variant="genai" if report_platform.lower() == "google" else None,
+                    use_response_cache=True)
+        except Exception as e:
+            print("LLMクライアントの事前作成に失敗しました（ジョブの実行時に作成します）。エラー:", e)
+
+    def stop(self):
+        """
+        新しいジョブの取り出しを止め、実行中のジョブの完了を待ってからブラウザプールを終了します。
+        """
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.runtime is not None:
+            self.runtime.close()
+            self.runtime = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def submit(self, override, job_id=None):
+        """
+        ジョブを待機中として追加し、ワーカーに知らせます。
+
+        戻り値:
+          追加したジョブ（辞書）
+        """
+        job = self.store.submit(override or {}, job_id)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def _work(self):
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+            job = self.store.claim_next()
+            if job is None:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(timeout=1.0)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        try:
+            with tracing.listening(_JobProgress(self.store, job_id)), tracing.span("service.job", job_id=job_id):
+                result = _run_job({"id": job_id, "override": job["config"]}, self.base_config, self.output_dir,
+                                  self.scrape_cache, self.product_store, self.runtime, self.max_retries,
+                                  _JobStatusLog(self.store))
+            self.store.finish(job_id, result["status"], result)
+        except Exception as e:
+            # _run_job は比較の失敗を結果として返すため、ここに来るのは設定の誤りなど想定外の失敗のみ
+            print(f"ジョブ {job_id} の実行に失敗しました。エラー:", e)
+            self.store.add_event(job_id, "status", {"status": "failed", "error": f"{type(e).__name__}: {e}"})
+            self.store.finish(job_id, "failed", {"job_id": job_id, "status": "failed", "error": str(e)})
+
+    def job_file(self, job_id, name):
+        """
+        ジョブの出力ファイル（report.md / scraped_data.json）のパスを返します。
+        """
+        return os.path.join(self.output_dir, job_id, name)
+
+
+def _make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        """
+        サービスのHTTP API です。
+
+          POST   /jobs                    ジョブの投入（本文は batch のジョブファイルの1行と同じ形式のJSON）
+          GET    /jobs                    ジョブの一覧（?status=queued などで絞り込み）
+          GET    /jobs/<id>               ジョブの状態
+          GET    /jobs/<id>/events        進捗のストリーム（text/event-stream。ジョブが終わると閉じます）
+          GET    /jobs/<id>/report        report.md
+          GET    /jobs/<id>/data          scraped_data.json
+          DELETE /jobs/<id>               待機中のジョブの取り消し
+          GET    /health                  ワーカー数と状態ごとのジョブ数
+        """
+
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, body, content_type="application/json; charset=utf-8"):
+            if not isinstance(body, (bytes, str)):
+                body = json.dumps(body, ensure_ascii=False)
+            data = body.encode("utf-8") if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _error(self, status, message):
+            self._send(status, {"error": message})
+
+        def _route(self):
+            parsed = urlparse(self.path)
+            return [part for part in parsed.path.split("/") if part], parse_qs(parsed.query)
+
+        def do_POST(self):
+            parts, _ = self._route()
+            if parts != ["jobs"]:
+                return self._error(404, "Not Found")
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                entry = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:
+                return self._error(400, f"本文をJSONとして読み込めません: {e}")
+            if not isinstance(entry, dict):
+                return self._error(400, "本文はJSONオブジェクトで指定してください。")
+            override = entry["config"] if "config" in entry else {k: v for k, v in entry.items() if k != "id"}
+            try:
+                job = service.submit(override, entry.get("id"))
+            except ValueError as e:
+                return self._error(409, str(e))
+            self._send(202, job)
+
+        def do_DELETE(self):
+            parts, _ = self._route()
+            if len(parts) != 2 or parts[0] != "jobs":
+                return self._error(404, "Not Found")
+            job = service.store.get(parts[1])
+            if job is None:
+                return self._error(404, f"ジョブ {parts[1]} が見つかりません。")
+            if not service.store.cancel(parts[1]):
+                return self._error(409, f"ジョブ {parts[1]} は {job['status']} のため取り消せません。")
+            self._send(200, service.store.get(parts[1]))
+
+        def do_GET(self):
+            parts, query = self._route()
+            if parts == ["health"]:
+                return self._send(200, {"workers": service.workers, "jobs": service.store.counts()})
+            if parts == ["jobs"]:
+                status = (query.get("status") or [None])[0]
+                return self._send(200, {"jobs": service.store.list(status)})
+            if len(parts) < 2 or parts[0] != "jobs":
+                return self._error(404, "Not Found")
+            job = service.store.get(parts[1])
+            if job is None:
+                return self._error(404, f"ジョブ {parts[1]} が見つかりません。")
+            if len(parts) == 2:
+                return self._send(200, job)
+            if parts[2:] == ["events"]:
+                after = int((query.get("after") or ["0"])[0] or 0)
+                return self._stream_events(job["job_id"], after)
+            files = {"report": ("report.md", "text/markdown; charset=utf-8"),
+                     "data": ("scraped_data.json", "application/json; charset=utf-8")}
+            if len(parts) == 3 and parts[2] in files:
+                name, content_type = files[parts[2]]
+                path = service.job_file(job["job_id"], name)
+                if not os.path.exists(path):
+                    return self._error(409, f"ジョブ {job['job_id']} の {name} はまだありません（状態: {job['status']}）。")
+                with open(path, "rb") as f:
+                    return self._send(200, f.read(), content_type)
+            return self._error(404, "Not Found")
+
+        def _stream_events(self, job_id, after):
+            # Server-Sent Events 形式で、ジョブが終わるまで新しいイベントを送り続ける
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    for event in service.store.events(job_id, after):
+                        after = event["id"]
+                        payload = json.dumps(dict(event["data"], time=event["time"]), ensure_ascii=False)
+                        self.wfile.write(f"id: {event['id']}\nevent: {event['kind']}\ndata: {payload}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if service.store.get(job_id)["status"] in FINISHED_STATUSES and not service.store.events(job_id, after):
+                        return
+                    time.sleep(_POLL_INTERVAL)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(base_config, host=None, port=None, output_dir=None, workers=None, scrape_cache=None, product_store=None):
+    """
+    サービスを起動し、Ctrl+C で停止するまでHTTP APIでジョブを受け付けます。
+    停止時は実行中のジョブの完了を待ちます（待機中のジョブは次回の起動時に実行されます）。
+
+    引数:
+      base_config: 基本の設定（settings.yaml を読み込んだ辞書）
+      host / port: 待ち受けるアドレスとポート（省略時は service.host / service.port）
+      output_dir / workers / scrape_cache / product_store: ComparisonService を参照
+    """
+    service_settings = base_config.get("service", {}) or {}
+    host = host or service_settings.get("host", DEFAULT_HOST)
+    port = port or service_settings.get("port", DEFAULT_PORT)
+    with ComparisonService(base_config, output_dir=output_dir, workers=workers, scrape_cache=scrape_cache,
+                           product_store=product_store) as service:
+        server = ThreadingHTTPServer((host, port), _make_handler(service))
+        server.daemon_threads = True
+        print(f"EC Compass サービスを http://{host}:{server.server_address[1]}/ で起動しました"
+              f"（ワーカー {service.workers} 個、出力先: {service.output_dir}）。Ctrl+C で停止します。")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n停止しています（実行中のジョブの完了を待ちます）...")
+        finally:
+            server.server_close()
@@ -0,0 +1,52 @@
+# site_adapters/__init__.py
+"""
+ECサイトごとの決定的なスクレイピング処理（サイトアダプタ）のレジストリです。
+
+websites[].url のドメインに対応するアダプタが登録されていれば、scraper は Browser-Use エージェントを
+起動する前に、HTTPリクエストとHTMLパーサーだけで製品情報を取得します。アダプタが無いサイトや、
+アダプタが失敗したサイトは従来どおりエージェントで取得します。
+
+新しいサイトに対応する場合は SiteAdapter を継承したクラスを作成し、register_adapter で登録してください。
+"""
+
+from urllib.parse import urlparse
+
+from site_adapters.base import AdapterError, SiteAdapter, fetch_html
+
+_ADAPTERS = []
+
+
+def register_adapter(adapter):
+    """
+    アダプタ（SiteAdapter のインスタンス）を登録します。後から登録したものが優先されます。
+    """
+    _ADAPTERS.insert(0, adapter)
+    return adapter
+
+
+def get_adapter(url):
+    """
+    URLのドメインに対応するアダプタを返します。対応するものが無ければ None を返します。
+    """
+    host = urlparse(url or "").netloc.lower()
+    if not host:
+        return None
+    for adapter in _ADAPTERS:
+        if any(host == domain or host.endswith("." + domain) for domain in adapter.domains):
+            return adapter
+    return None
+
+
+def _register_builtin_adapters():
+    try:
+        from site_adapters.kakaku import KakakuAdapter
+    except ImportError as e:
+        # HTMLパーサー（beautifulsoup4）が無い環境では、全サイトをエージェントで取得する
+        print("サイトアダプタを読み込めませんでした。Browser-Useエージェントのみを使用します。エラー:", e)
+        return
+    register_adapter(KakakuAdapter())
+
+
+_register_builtin_adapters()
+
+__all__ = ["AdapterError", "SiteAdapter", "fetch_html", "get_adapter", "register_adapter"]
@@ -0,0 +1,222 @@
+# site_adapters/base.py
+
+import re  # 正規表現を扱うライブラリをインポートします
+from concurrent.futures import ThreadPoolExecutor
+
+import requests  # HTTPリクエストを送信するためのライブラリ
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    ),
+    "Accept-Language": "ja,en;q=0.8",
+}
+DEFAULT_TIMEOUT = 15
+
+
+class AdapterError(Exception):
+    """
+    アダプタで製品情報を取得できなかったことを表す例外です。
+    scraper はこの例外を受け取ると、そのサイトを Browser-Use エージェントで取得し直します。
+    """
+
+
+_session = requests.Session()
+_session.headers.update(DEFAULT_HEADERS)
+
+
+def fetch_html(url):
+    """
+    URLのHTMLをバイト列で取得します。文字コードの判定は HTML パーサーに任せます。
+    ステータスコードが 200 以外の場合は AdapterError を送出します。
+    """
+    try:
+        response = _session.get(url, timeout=DEFAULT_TIMEOUT)
+    except requests.RequestException as e:
+        raise AdapterError(f"{url} の取得に失敗しました: {e}") from e
+    if response.status_code != 200:
+        raise AdapterError(f"{url} の取得に失敗しました。ステータスコード: {response.status_code}")
+    return response.content
+
+
+def parse_price_text(text):
+    """
+    '¥23,980' / '23,980円' のような価格表記を int に変換します。変換できない場合は None を返します。
+    """
+    if text is None:
+        return None
+    match = re.search(r"\d[\d,]*", str(text).replace("，", ","))
+    if not match:
+        return None
+    return int(match.group(0).replace(",", ""))
+
+
+class SiteAdapter:
+    """
+    サイトアダプタの基底クラスです。
+
+    サブクラスは domains と、HTMLを解析する以下のメソッドを実装します。解析メソッドは
+    HTML（文字列またはバイト列）だけを受け取る純粋な関数として実装し、保存したHTMLで検証できるようにします。
+
+      search_url(keywords, search_condition): 検索結果ページのURL
+      parse_search_results(html, page_url): 検索結果ページから商品ページのURLのリスト
+      parse_item(html, item_url): 商品ページから製品情報の辞書（product_name, price, manufacturer_url など）
+      spec_url(item_url) / parse_specs(html): 仕様ページのURLと、仕様の {項目: 値}（任意）
+      review_url(item_url) / parse_reviews(html): 口コミページのURLと、口コミ本文のリスト（任意）
+    """
+
+    name = ""
+    domains = ()
+    max_workers = 4
+    # HTTPリクエストだけで反映できる search_condition の項目です。これ以外の条件が指定されている場合は
+    # アダプタでは取得せず、エージェントで取得します
+    supported_conditions = ("price_range", "sort_by")
+
+    def search_url(self, keywords, search_condition):
+        raise NotImplementedError
+
+    def parse_search_results(self, html, page_url):
+        raise NotImplementedError
+
+    def parse_item(self, html, item_url):
+        raise NotImplementedError
+
+    def spec_url(self, item_url):
+        return None
+
+    def parse_specs(self, html):
+        return {}
+
+    def review_url(self, item_url):
+        return None
+
+    def parse_reviews(self, html):
+        return []
+
+    def unsupported_conditions(self, search_parameters):
+        """
+        アダプタでは反映できない検索条件の名前のリストを返します（空のリストならアダプタで取得できます）。
+
+        filters（自然言語の絞り込み条件）や visit_official_site（メーカー公式サイトの参照）は
+        検索結果ページと商品ページの解析だけでは再現できないため、指定されていれば対応外とします。
+        """
+        search_condition = search_parameters.get("search_condition", {}) or {}
+        browser_settings = search_parameters.get("browser_settings", {}) or {}
+        unsupported = [key for key, value in search_condition.items()
+                       if value and key not in self.supported_conditions]
+        if browser_settings.get("visit_official_site"):
+            unsupported.append("visit_official_site")
+        return unsupported
+
+    def scrape(self, site, search_parameters, fetch=fetch_html):
+        """
+        検索から商品ページ・仕様・口コミの取得までを行い、result_items のキーを持つ製品情報のリストを返します。
+
+        引数:
+          site: ECサイト情報（辞書）
+          search_parameters: 検索条件を含む辞書
+          fetch: URLからHTMLを取得する関数（保存したHTMLで検証する場合に差し替えます）
+
+        戻り値:
+          製品情報（辞書）のリスト
+
+        unsupported_conditions が空でない場合は、条件を無視した結果を返さないよう AdapterError を送出します。
+        """
+        unsupported = self.unsupported_conditions(search_parameters)
+        if unsupported:
+            raise AdapterError(f"{', '.join(unsupported)} の指定にはアダプタで対応できません。")
+
+        keywords = search_parameters.get("keywords", [])
+        search_condition = search_parameters.get("search_condition", {}) or {}
+        return_products_num = search_parameters.get("return_products_num") or 5
+        browser_settings = search_parameters.get("browser_settings", {}) or {}
+        reviews_per_product = browser_settings.get("reviews_per_product", 3)
+        result_items = search_parameters.get("result_items", {}) or {}
+
+        page_url = self.search_url(keywords, search_condition)
+        item_urls = self.parse_search_results(fetch(page_url), page_url)
+        if not item_urls:
+            raise AdapterError(f"{page_url} から商品ページが見つかりませんでした。")
+
+        # 価格条件での絞り込み・並べ替えは商品ページの価格で行うため、候補は多めに取得する
+        candidates = item_urls[:max(return_products_num * 3, return_products_num)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            items = list(executor.map(lambda url: self._scrape_item(url, reviews_per_product, fetch), candidates))
+        items = [item for item in items if item is not None]
+        items = self._apply_search_condition(items, search_condition)[:return_products_num]
+        if not items:
+            raise AdapterError(f"{site.get('name', self.name)} で条件に合う商品を取得できませんでした。")
+
+        site_name = site.get("name", self.name)
+        products = []
+        for item in items:
+            product = {key: "" for key in result_items} if isinstance(result_items, dict) else {}
+            product.update(item)
+            product["site_name"] = site_name
+            products.append(product)
+        return products
+
+    def scrape_prices(self, item_urls, fetch=fetch_html):
+        """
+        既知の商品ページの価格だけを取得し直します（仕様・口コミのページは取得しません）。
+
+        戻り値:
+          {'url': 商品ページのURL, 'price': 価格} のリスト。取得できなかった商品は含みません
+        """
+        def scrape_price(item_url):
+            try:
+                item = self.parse_item(fetch(item_url), item_url)
+            except AdapterError as e:
+                print(f"{item_url} の価格の取得に失敗しました。エラー:", e)
+                return None
+            if item.get("price") is None:
+                return None
+            return {"url": item_url, "price": item["price"]}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            prices = list(executor.map(scrape_price, item_urls))
+        return [price for price in prices if price is not None]
+
+    def _scrape_item(self, item_url, reviews_per_product, fetch):
+        """
+        1商品分のページを取得して製品情報を返します。取得・解析に失敗した商品は None を返します。
+        """
+        try:
+            item = self.parse_item(fetch(item_url), item_url)
+            if not item.get("product_name") or item.get("price") is None:
+                return None
+            item["url"] = item_url
+
+            spec_url = self.spec_url(item_url)
+            specs = self.parse_specs(fetch(spec_url)) if spec_url else {}
+            if specs:
+                item["details"] = "; ".join(f"{k}: {v}" for k, v in specs.items())
+
+            review_url = self.review_url(item_url)
+            if reviews_per_product != 0 and review_url:
+                reviews = self.parse_reviews(fetch(review_url))
+                item["reviews"] = reviews if reviews_per_product < 0 else reviews[:reviews_per_product]
+            return item
+        except AdapterError as e:
+            print(f"{item_url} の取得に失敗しました。エラー:", e)
+            return None
+
+    @staticmethod
+    def _apply_search_condition(items, search_condition):
+        """
+        価格範囲と価格順の並べ替えを、取得した価格に基づいて適用します。
+        """
+        price_range = search_condition.get("price_range", {}) or {}
+        low, high = price_range.get("min"), price_range.get("max")
+        if low is not None:
+            items = [item for item in items if item["price"] >= low]
+        if high is not None:
+            items = [item for item in items if item["price"] <= high]
+        sort_by = search_condition.get("sort_by", "")
+        if sort_by == "価格の安い順":
+            items = sorted(items, key=lambda item: item["price"])
+        elif sort_by == "価格の高い順":
+            items = sorted(items, key=lambda item: item["price"], reverse=True)
+        return items
@@ -0,0 +1,109 @@
+# site_adapters/kakaku.py
+
+import re  # 正規表現を扱うライブラリをインポートします
+from urllib.parse import quote, urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from site_adapters.base import SiteAdapter, parse_price_text
+
+
+_ITEM_PATH = re.compile(r"^/item/(K\d{10})/?$")
+
+
+def _soup(html):
+    return BeautifulSoup(html, "html.parser")
+
+
+def _text(node):
+    return re.sub(r"\s+", " ", node.get_text(" ", strip=True)) if node is not None else ""
+
+
+class KakakuAdapter(SiteAdapter):
+    """
+    価格.com（kakaku.com）用のアダプタです。
+
+    商品ページは https://kakaku.com/item/K0001476940/ の形式で、仕様は .../spec/、口コミ（レビュー）は
+    .../review/ に固定の構造で掲載されているため、エージェントを使わずに取得できます。
+    """
+
+    name = "価格.com"
+    domains = ("kakaku.com",)
+
+    def search_url(self, keywords, search_condition):
+        # 価格.com の検索URLはキーワードを Shift_JIS でエンコードする
+        query = quote(" ".join(keywords), encoding="shift_jis", errors="ignore")
+        return f"https://kakaku.com/search_results/{query}/"
+
+    def parse_search_results(self, html, page_url):
+        """
+        検索結果ページから、商品ページのURLを表示順に重複なく返します。
+        """
+        urls = []
+        for anchor in _soup(html).find_all("a", href=True):
+            absolute = urljoin(page_url, anchor["href"])
+            parsed = urlparse(absolute)
+            match = _ITEM_PATH.match(parsed.path)
+            if parsed.netloc.endswith("kakaku.com") and match:
+                url = f"https://kakaku.com/item/{match.group(1)}/"
+                if url not in urls:
+                    urls.append(url)
+        return urls
+
+    def parse_item(self, html, item_url):
+        """
+        商品ページから商品名・最安価格・メーカーの製品情報ページのURLを取り出します。
+        """
+        soup = _soup(html)
+
+        # ページ内の他の h2（関連商品の見出しなど）を商品名と取り違えないよう、商品名の位置に限定する
+        name_node = soup.select_one("[itemprop=name]") or soup.select_one("#titleBox h2")
+        product_name = _text(name_node)
+        if not product_name:
+            og_title = soup.find("meta", property="og:title")
+            product_name = (og_title.get("content", "") if og_title else "").split("の価格")[0].strip()
+
+        price = None
+        price_meta = soup.select_one("[itemprop=lowPrice], [itemprop=price]")
+        if price_meta is not None:
+            price = parse_price_text(price_meta.get("content") or _text(price_meta))
+        if price is None:
+            price_node = soup.select_one("#priceBox .priceTxt") or soup.select_one(".priceTxt")
+            price = parse_price_text(_text(price_node))
+
+        manufacturer_url = ""
+        for anchor in soup.find_all("a", href=True):
+            label = _text(anchor)
+            if "メーカー" in label and ("製品情報" in label or "サイト" in label):
+                manufacturer_url = urljoin(item_url, anchor["href"])
+                break
+
+        return {"product_name": product_name, "price": price, "manufacturer_url": manufacturer_url}
+
+    def spec_url(self, item_url):
+        return item_url.rstrip("/") + "/spec/"
+
+    def parse_specs(self, html):
+        """
+        仕様ページの表（見出しセルと値セルの組）を {項目: 値} にまとめます。
+        """
+        specs = {}
+        for row in _soup(html).select("table tr"):
+            headers = row.find_all("th")
+            values = row.find_all("td")
+            for header, value in zip(headers, values):
+                key, text = _text(header), _text(value)
+                if key and text and key not in specs:
+                    specs[key] = text
+        return specs
+
+    def review_url(self, item_url):
+        return item_url.rstrip("/") + "/review/"
+
+    def parse_reviews(self, html):
+        """
+        口コミページから口コミ本文を表示順に返します。
+        """
+        soup = _soup(html)
+        nodes = soup.select(".revEntryCont") or soup.select("[itemprop=reviewBody]") or soup.select(".revMainClmWrap")
+        return [text for text in (_text(node) for node in nodes) if text]
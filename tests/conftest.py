@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# テストからリポジトリ直下のモジュール（json_extract など）を読み込めるようにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+# tests/test_checkpoint.py
+
+from checkpoint import RunCheckpoint
+
+SITE = {"name": "価格.com", "url": "https://kakaku.com/"}
+
+
+def test_save_product_skips_saved_products_without_rereading(tmp_path, monkeypatch):
+    checkpoint = RunCheckpoint("run", runs_dir=str(tmp_path))
+    checkpoint.save_product(SITE, {"url": "https://kakaku.com/item/K0000000001/", "price": 100})
+
+    # 再開時は、前回の実行で追記された製品も取得済みとして扱う
+    resumed = RunCheckpoint.resume("run", runs_dir=str(tmp_path))
+    reads = []
+    original = RunCheckpoint.load_products
+    monkeypatch.setattr(RunCheckpoint, "load_products", lambda self, site: reads.append(site) or original(self, site))
+    for number in range(1, 51):
+        resumed.save_product(SITE, {"url": f"https://kakaku.com/item/K{number:010d}/", "price": number})
+
+    assert len(reads) == 1
+    products = original(resumed, SITE)
+    assert len(products) == 50
+    assert products[0]["price"] == 100
+
+
+def test_runs_started_in_the_same_second_get_separate_directories(tmp_path):
+    first = RunCheckpoint(runs_dir=str(tmp_path))
+    second = RunCheckpoint(runs_dir=str(tmp_path))
+    assert first.run_id != second.run_id
+    first.save_product(SITE, {"url": "https://kakaku.com/item/K0000000001/"})
+    assert second.load_products(SITE) == []
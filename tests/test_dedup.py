@@ -0,0 +1,28 @@
+# tests/test_dedup.py
+
+from dedup import deduplicate_products, is_same_product, normalize_name
+
+
+def _same(a, b):
+    return is_same_product(normalize_name(a), normalize_name(b))
+
+
+def test_revision_is_a_different_product():
+    assert not _same("GIGABYTE B650 AORUS ELITE AX", "GIGABYTE B650 AORUS ELITE AX V2")
+    assert not _same("ASUS TUF GAMING B650-PLUS Rev.1.0", "ASUS TUF GAMING B650-PLUS Rev 1.1")
+
+
+def test_same_revision_with_different_notation():
+    assert _same("GIGABYTE B650 AORUS ELITE AX V2", "ギガバイト B650 AORUS ELITE AX V2 マザーボード")
+    assert _same("ASUS TUF GAMING B650-PLUS Rev.1.1", "ASUS TUF GAMING B650-PLUS rev1.1")
+
+
+def test_deduplicate_keeps_revisions_apart():
+    products = [
+        {"product_name": "GIGABYTE B650 AORUS ELITE AX", "price": 32800, "site_name": "A"},
+        {"product_name": "GIGABYTE B650 AORUS ELITE AX V2", "price": 30980, "site_name": "B"},
+        {"product_name": "【国内正規品】GIGABYTE B650 AORUS ELITE AX V2", "price": 31500, "site_name": "C"},
+    ]
+    merged = deduplicate_products(products)
+    assert len(merged) == 2
+    assert [offer["site_name"] for offer in merged[1]["offers"]] == ["B", "C"]
@@ -0,0 +1,20 @@
+# tests/test_evaluator.py
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from evaluator import score_products  # noqa: E402
+
+
+PRODUCTS = [{"price": 20000}, {"price": 40000}]
+
+
+def test_legacy_price_threshold():
+    assert list(score_products(PRODUCTS, {"price": {"weight": 1, "threshold": 20000}})) == [10.0, 5.0]
+
+
+def test_legacy_price_without_threshold_is_not_scored():
+    # threshold の無い旧形式の設定で、価格のある全製品が満点にならないこと
+    scoring = {"price": {"weight": 2}, "rules": [{"field": "price", "max": 30000, "weight": 1}]}
+    assert list(score_products(PRODUCTS, scoring)) == [10.0, 0.0]
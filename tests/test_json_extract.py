@@ -0,0 +1,43 @@
+# tests/test_json_extract.py
+
+import time
+
+from json_extract import extract_products, iter_json_values
+
+
+def test_truncated_output_is_repaired():
+    text = '{"results": [{"product_name": "A", "url": "u1"}, {"product_name": "B", "url": "u2"'
+    assert extract_products(text) == [{"product_name": "A", "url": "u1"}, {"product_name": "B", "url": "u2"}]
+
+
+def test_python_style_output_is_repaired():
+    assert list(iter_json_values("result: {'results': [{'product_name': 'A', 'price': None,}]}")) == [
+        {"results": [{"product_name": "A", "price": None}]}
+    ]
+
+
+def test_valid_object_inside_broken_object_is_found():
+    assert list(iter_json_values('{"broken": oops {"product_name": "inner"} ,,, }')) == [{"product_name": "inner"}]
+
+
+def test_object_after_stray_quote_is_found():
+    text = '27" モニター [注1] {"product_name": "x", "url": "y"} その他'
+    assert extract_products(text) == [{"product_name": "x", "url": "y"}]
+
+
+def test_large_non_json_input_finishes_quickly():
+    # 閉じていない括弧・引用符が多いページの内容でも、読めない候補を何度も修正し直さずに終わること
+    valid = '{"product_name": "tail", "url": "https://example.com/tail"}'
+    for unit in ('{x: [y, ', '[注1: 価格 {税込', '5" [a] {b: "c'):
+        text = (unit * 3000)[:20000] + " " + valid
+        started_at = time.perf_counter()
+        products = extract_products(text)
+        assert time.perf_counter() - started_at < 2.0
+        assert {"product_name": "tail", "url": "https://example.com/tail"} in products
+
+
+def test_deeply_nested_non_json_input_finishes_quickly():
+    text = "[a" * 3000 + "]" * 3000 + '{"product_name": "x"}'
+    started_at = time.perf_counter()
+    assert list(iter_json_values(text))[-1] == {"product_name": "x"}
+    assert time.perf_counter() - started_at < 2.0
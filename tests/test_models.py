@@ -0,0 +1,11 @@
+# tests/test_models.py
+
+from models import normalize_reviews
+
+
+def test_rating_prefix_is_not_treated_as_bullet():
+    assert normalize_reviews(["4.5 (22 reviews)", "5. 静かで良い"]) == ("4.5 (22 reviews)", "静かで良い")
+
+
+def test_multiline_reviews_are_split_and_bullets_removed():
+    assert normalize_reviews("- 速い\n・安い\n1) 静か\n2.音が良い") == ("速い", "安い", "静か", "2.音が良い")
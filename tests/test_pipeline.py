@@ -0,0 +1,36 @@
+# tests/test_pipeline.py
+
+import asyncio
+
+import pytest
+
+from pipeline import Stage, run_pipeline
+
+
+async def _double(item):
+    return [item * 2]
+
+
+def test_results_pass_through_all_stages():
+    stages = [Stage("a", _double, concurrency=2), Stage("b", _double)]
+    assert sorted(asyncio.run(run_pipeline(range(5), stages, queue_size=1))) == [0, 4, 8, 12, 16]
+
+
+def test_failing_on_result_does_not_hang():
+    def on_result(item):
+        raise OSError("disk full")
+
+    stages = [Stage("a", _double), Stage("b", _double)]
+    results = asyncio.run(asyncio.wait_for(run_pipeline(range(20), stages, queue_size=1, on_result=on_result), 5))
+    assert sorted(results) == [i * 4 for i in range(20)]
+
+
+def test_worker_failure_outside_handler_is_raised():
+    # Stage.process の外で起きた例外（ここでは出力を次の段階へ渡すときのエラー）で、前の段階が待ち続けないこと
+    class BrokenStage(Stage):
+        async def process(self, item):
+            raise RuntimeError("broken")
+
+    stages = [Stage("a", _double), BrokenStage("b", _double)]
+    with pytest.raises(RuntimeError, match="broken"):
+        asyncio.run(asyncio.wait_for(run_pipeline(range(20), stages, queue_size=1), 5))
@@ -0,0 +1,42 @@
+# tests/test_rate_limiter.py
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from rate_limiter import IMAGE_TOKENS, LOW_DETAIL_IMAGE_TOKENS, estimate_request_tokens  # noqa: E402
+
+
+def _request(payload):
+    return SimpleNamespace(content=json.dumps(payload).encode("utf-8"))
+
+
+def test_screenshot_is_charged_a_fixed_cost():
+    # base64 のスクリーンショットの長さではなく、画像1枚分のトークン数で数えること
+    screenshot = "data:image/png;base64," + "A" * 400000
+    payload = {"model": "gpt-4o", "max_tokens": 100, "messages": [
+        {"role": "user", "content": [{"type": "text", "text": "a" * 400},
+                                     {"type": "image_url", "image_url": {"url": screenshot}}]},
+    ]}
+    estimated = estimate_request_tokens(_request(payload))
+    assert IMAGE_TOKENS + 200 <= estimated < IMAGE_TOKENS + 400
+
+
+def test_low_detail_image():
+    payload = {"messages": [{"role": "user", "content": [
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64," + "A" * 1000, "detail": "low"}}]}]}
+    assert LOW_DETAIL_IMAGE_TOKENS <= estimate_request_tokens(_request(payload)) < LOW_DETAIL_IMAGE_TOKENS + 50
+
+
+def test_text_only_request_counts_characters():
+    payload = {"messages": [{"role": "user", "content": "a" * 4000}], "max_tokens": 500}
+    assert 1500 <= estimate_request_tokens(_request(payload)) < 1550
+
+
+def test_japanese_text_is_counted_per_character():
+    # 日本語のプロンプトは4文字 ≒ 1トークンではなく、1文字 ≒ 1トークンとして数えること
+    payload = {"messages": [{"role": "user", "content": "価格の安い順に並べてください。" * 200}], "max_tokens": 0}
+    assert 3000 <= estimate_request_tokens(_request(payload)) < 3050
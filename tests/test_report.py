@@ -0,0 +1,60 @@
+# tests/test_report.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import report
+
+
+class _StubLLM:
+    """
+    プロンプトを記録し、固定の応答を返す LLM の代わりです。fail_on を含むプロンプトでは例外を送出します。
+    """
+
+    def __init__(self, fail_on=None):
+        self.prompts = []
+        self.fail_on = fail_on
+
+    def _respond(self, prompt):
+        self.prompts.append(prompt)
+        if self.fail_on and self.fail_on in prompt:
+            raise RuntimeError("rate limited")
+        return SimpleNamespace(content=f"要約{len(self.prompts)}")
+
+    def invoke(self, prompt):
+        return self._respond(prompt)
+
+    async def ainvoke(self, prompt):
+        return self._respond(prompt)
+
+
+PRODUCTS = {"results": [{"product_name": f"製品{i}", "price": 1000 * i} for i in range(1, 4)]}
+
+
+def test_sync_report_inside_running_event_loop(monkeypatch):
+    llm = _StubLLM()
+    monkeypatch.setattr(report, "get_llm", lambda *args, **kwargs: llm)
+
+    async def call_from_coroutine():
+        return report.generate_report(PRODUCTS, {"preferences": "安いもの"}, 3, raise_errors=True)
+
+    assert asyncio.run(call_from_coroutine()) == "要約1"
+    assert "製品3" in llm.prompts[0]
+
+
+def test_failed_chunk_falls_back_to_its_product_text(monkeypatch):
+    llm = _StubLLM(fail_on="製品2")
+    monkeypatch.setattr(report, "get_llm", lambda *args, **kwargs: llm)
+    chunks = ["1. 製品1", "2. 製品2", "3. 製品3"]
+
+    summaries = asyncio.run(report._summarize_chunks(chunks, "安いもの", "openai", "gpt-4o-mini", 1))
+
+    assert summaries == ["要約1", "2. 製品2", "要約3"]
+
+
+def test_all_chunks_failing_raises(monkeypatch):
+    monkeypatch.setattr(report, "get_llm", lambda *args, **kwargs: _StubLLM(fail_on="製品"))
+    with pytest.raises(RuntimeError, match="rate limited"):
+        asyncio.run(report._summarize_chunks(["1. 製品1", "2. 製品2"], "安いもの", "openai", "gpt-4o-mini", 2))
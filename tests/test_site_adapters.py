@@ -0,0 +1,133 @@
+# tests/test_site_adapters.py
+
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("requests")
+
+from site_adapters import AdapterError  # noqa: E402
+from site_adapters.kakaku import KakakuAdapter  # noqa: E402
+
+FIXTURES = Path(__file__).parent / "fixtures" / "kakaku"
+SEARCH_URL = "https://kakaku.com/search_results/B650/"
+
+
+def _fixture(name):
+    return (FIXTURES / name).read_bytes()
+
+
+def _fetch(url):
+    """
+    価格.com のURLを保存したHTMLに対応付けます。search_results 以外の未知のURLは AdapterError にします。
+    """
+    parts = [part for part in urlparse(url).path.split("/") if part]
+    if parts[0] == "search_results":
+        return _fixture("search.html")
+    if parts[0] == "item" and len(parts) == 2:
+        path = FIXTURES / f"item_{parts[1]}.html"
+        if path.exists():
+            return path.read_bytes()
+    if parts[0] == "item" and parts[2:] == ["spec"]:
+        return _fixture("spec.html")
+    if parts[0] == "item" and parts[2:] == ["review"]:
+        return _fixture("review.html")
+    raise AdapterError(f"{url} の取得に失敗しました。ステータスコード: 404")
+
+
+def _parameters(**overrides):
+    parameters = {
+        "keywords": ["B650"],
+        "search_condition": {"price_range": {"min": 10000, "max": 30000}, "sort_by": "価格の安い順"},
+        "return_products_num": 2,
+        "browser_settings": {"reviews_per_product": 2},
+        "result_items": {"site_name": "", "product_name": "", "price": "", "url": "",
+                         "manufacturer_url": "", "reviews": "", "details": ""},
+    }
+    parameters.update(overrides)
+    return parameters
+
+
+def test_search_results_are_item_pages_in_order():
+    urls = KakakuAdapter().parse_search_results(_fixture("search.html"), SEARCH_URL)
+    assert urls == [
+        "https://kakaku.com/item/K0001476940/",
+        "https://kakaku.com/item/K0001476938/",
+        "https://kakaku.com/item/K0001512345/",
+    ]
+
+
+def test_item_with_microdata():
+    url = "https://kakaku.com/item/K0001476940/"
+    item = KakakuAdapter().parse_item(_fixture("item_K0001476940.html"), url)
+    assert item == {
+        "product_name": "ASRock B650M Pro RS",
+        "price": 18980,
+        "manufacturer_url": "https://www.asrock.com/mb/AMD/B650M%20Pro%20RS/index.jp.asp",
+    }
+
+
+def test_item_without_microdata():
+    url = "https://kakaku.com/item/K0001476938/"
+    item = KakakuAdapter().parse_item(_fixture("item_K0001476938.html"), url)
+    assert item == {
+        "product_name": "GIGABYTE B650 AORUS ELITE AX [Rev.1.0]",
+        "price": 32800,
+        "manufacturer_url": "https://kakaku.com/jump/maker/K0001476938/",
+    }
+
+
+def test_unrelated_heading_is_not_used_as_product_name():
+    # 商品名の要素が無いページでは、関連商品の見出しではなく og:title から商品名を取ること
+    url = "https://kakaku.com/item/K0001512345/"
+    item = KakakuAdapter().parse_item(_fixture("item_K0001512345.html"), url)
+    assert item["product_name"] == "MSI PRO B650M-A WIFI"
+    assert item["price"] == 22480
+
+
+def test_specs_and_reviews():
+    adapter = KakakuAdapter()
+    assert adapter.parse_specs(_fixture("spec.html")) == {
+        "フォームファクタ": "MicroATX",
+        "CPUソケット": "Socket AM5",
+        "チップセット": "AMD B650",
+        "メモリタイプ": "DDR5",
+        "M.2ソケット数": "2",
+    }
+    assert adapter.parse_reviews(_fixture("review.html")) == [
+        "安定性 5 初めての自作でしたが、BIOS更新後は 問題なく起動しました。",
+        "拡張性 3 M.2スロットは2つで十分ですが、SATAポートが少なめです。",
+        "コスパ 5 この価格でDDR5とPCIe 5.0対応は満足です。",
+    ]
+
+
+def test_scrape_applies_price_range_and_sort():
+    products = KakakuAdapter().scrape({"name": "価格.com"}, _parameters(), fetch=_fetch)
+    assert [(p["product_name"], p["price"]) for p in products] == [
+        ("ASRock B650M Pro RS", 18980),
+        ("MSI PRO B650M-A WIFI", 22480),
+    ]
+    first = products[0]
+    assert first["site_name"] == "価格.com"
+    assert first["url"] == "https://kakaku.com/item/K0001476940/"
+    assert len(first["reviews"]) == 2
+    assert first["details"].startswith("フォームファクタ: MicroATX; CPUソケット: Socket AM5")
+
+
+@pytest.mark.parametrize("overrides, condition", [
+    ({"search_condition": {"sort_by": "価格の安い順", "filters": ["AMD Socket AM5対応のみ"]}}, "filters"),
+    ({"browser_settings": {"reviews_per_product": 2, "visit_official_site": True}}, "visit_official_site"),
+])
+def test_conditions_the_adapter_cannot_apply_fall_back_to_the_agent(overrides, condition):
+    adapter = KakakuAdapter()
+    parameters = _parameters(**overrides)
+    assert adapter.unsupported_conditions(parameters) == [condition]
+    with pytest.raises(AdapterError):
+        adapter.scrape({"name": "価格.com"}, parameters, fetch=_fetch)
+
+
+def test_empty_filters_are_supported():
+    parameters = _parameters(search_condition={"sort_by": "価格の安い順", "filters": []})
+    assert KakakuAdapter().unsupported_conditions(parameters) == []
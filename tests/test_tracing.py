@@ -0,0 +1,33 @@
+# tests/test_tracing.py
+
+import asyncio
+
+import pytest
+
+import tracing
+
+
+def test_listening_reports_spans_without_a_tracer():
+    events = []
+
+    def scrape_with_adapter():
+        with tracing.span("adapter"):
+            pass
+
+    async def scrape():
+        with tracing.span("scrape", sites=2):
+            await asyncio.to_thread(scrape_with_adapter)
+
+    with tracing.listening(events.append):
+        asyncio.run(scrape())
+        with pytest.raises(ValueError):
+            with tracing.span("report"):
+                raise ValueError("失敗")
+    with tracing.span("outside"):
+        pass
+
+    assert [(e["event"], e["name"]) for e in events] == [
+        ("start", "scrape"), ("start", "adapter"), ("end", "adapter"), ("end", "scrape"), ("start", "report"), ("end", "report"),
+    ]
+    assert events[0]["attributes"] == {"sites": 2}
+    assert events[-1]["status"] == "error"
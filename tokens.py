@@ -0,0 +1,10 @@
+# tokens.py
+
+
+def estimate_tokens(text):
+    """
+    文字列のトークン数を概算します（ASCII文字は4文字で1トークン、それ以外は1文字1トークンとして計算）。
+    日本語のプロンプトを4文字 ≒ 1トークンで数えると大幅に少なく見積もるため、レポートの分割とレート制限で共通に使います。
+    """
+    ascii_count = len(text.encode("ascii", "ignore"))
+    return ascii_count // 4 + (len(text) - ascii_count)
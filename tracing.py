@@ -0,0 +1,417 @@
+# tracing.py
+
+import contextvars
+import json     # JSON形式のデータを扱うためのライブラリ
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+# 100万トークンあたりの料金（USD）。settings.yaml の tracing.pricing で上書き・追加できます
+DEFAULT_PRICING = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60},
+    "o1-mini": {"input": 1.10, "output": 4.40},
+    "o1-preview": {"input": 15.00, "output": 60.00},
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40},
+    "gemini-2.0-flash-exp": {"input": 0.0, "output": 0.0},
+    "gemini-2.0-pro-exp-02-05": {"input": 0.0, "output": 0.0},
+    "deepseek-chat": {"input": 0.27, "output": 1.10},
+    "deepseek-reasoner": {"input": 0.55, "output": 2.19},
+}
+
+# 実行中のスパン（コンテキストごと。asyncio のタスクにも引き継がれる）
+_current_span = contextvars.ContextVar("ec_compass_current_span", default=None)
+
+# 進捗の通知先（コンテキストごと）。service がジョブごとに設定し、スパンの開始・終了をジョブの進捗として受け取る
+_progress_listener = contextvars.ContextVar("ec_compass_progress_listener", default=None)
+
+# configure_tracing で設定される Tracer（未設定の場合は None で、計測は行いません）
+_tracer = None
+
+
+class Span:
+    """
+    計測区間（スパン）1つ分の情報です。
+
+    counters には区間内で発生したトークン数・推定コスト・エージェントのステップ数・キャッシュヒット数などを
+    加算します（子スパンの分は含みません）。
+    """
+
+    def __init__(self, name, trace_id, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or {})
+        self.counters = {}
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.otel_span = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add(self, key, amount=1):
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+            "counters": self.counters,
+        }
+
+
+class Tracer:
+    """
+    スパンを記録し、終了したものから順に JSONL のトレースファイルへ書き出します。
+
+    各行は1スパン（trace_id / span_id / parent_id / name / start_time / duration / attributes / counters）です。
+    opentelemetry が有効な場合は、同じスパンを OpenTelemetry のトレーサーにも送ります。
+    """
+
+    def __init__(self, path=None, pricing=None, opentelemetry=False):
+        """
+        引数:
+          path: トレースファイル（JSONL）のパス。None の場合はファイルに書き出しません
+          pricing: モデル名ごとの100万トークンあたりの料金 {'gpt-4o': {'input': 2.5, 'output': 10.0}}
+          opentelemetry: True の場合、OpenTelemetry のトレーサーにもスパンを送ります
+        """
+        self.path = path
+        self.trace_id = uuid.uuid4().hex
+        self.pricing = dict(DEFAULT_PRICING)
+        self.pricing.update(pricing or {})
+        self.spans = []
+        self.model_usage = {}
+        self._lock = threading.Lock()
+        self._otel_tracer = _make_otel_tracer() if opentelemetry else None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        span = Span(name, self.trace_id, parent, attributes)
+        if self._otel_tracer is not None:
+            span.otel_span = _start_otel_span(self._otel_tracer, name, parent)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.set_attribute("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # ジェネレータが別のコンテキストで閉じられた場合は、現在のスパンを親に戻す
+                _current_span.set(parent)
+            self.finish(span)
+
+    def finish(self, span):
+        span.duration = time.perf_counter() - span._start
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+        if span.otel_span is not None:
+            _end_otel_span(span)
+
+    def record_span(self, name, duration, **attributes):
+        """
+        計測済みの区間を、現在のスパンの子として記録します（コールバックなどで区間の終了だけが分かる場合に使います）。
+        """
+        span = Span(name, self.trace_id, _current_span.get(), attributes)
+        span.start_time -= duration
+        span._start -= duration
+        self.finish(span)
+        return span
+
+    def estimate_cost(self, model, prompt_tokens, completion_tokens):
+        """
+        トークン数から推定コスト（USD）を返します。料金表に無いモデルは 0 とします。
+        """
+        price = self.pricing.get(model)
+        if price is None:
+            # 'gpt-4o-2024-08-06' のような日付付きのモデル名は、最も長く一致する料金表の名前を使う
+            matches = [name for name in self.pricing if model.startswith(name)]
+            price = self.pricing[max(matches, key=len)] if matches else {}
+        return (prompt_tokens * price.get("input", 0.0) + completion_tokens * price.get("output", 0.0)) / 1_000_000
+
+    def record_usage(self, model, prompt_tokens, completion_tokens):
+        """
+        LLM呼び出し1回分のトークン数を、現在のスパンとモデル別の合計に加算します。
+        """
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            usage = self.model_usage.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["cost"] += cost
+            span = _current_span.get()
+            if span is not None:
+                span.add("llm_calls")
+                span.add("prompt_tokens", prompt_tokens)
+                span.add("completion_tokens", completion_tokens)
+                span.add("cost", cost)
+
+    def summary(self):
+        """
+        スパン名ごとの回数・合計時間・カウンタの合計を、合計時間の長い順に返します。
+        """
+        rows = {}
+        with self._lock:
+            for span in self.spans:
+                row = rows.setdefault(span.name, {"name": span.name, "count": 0, "duration": 0.0, "counters": {}})
+                row["count"] += 1
+                row["duration"] += span.duration or 0.0
+                for key, value in span.counters.items():
+                    row["counters"][key] = row["counters"].get(key, 0) + value
+        return sorted(rows.values(), key=lambda row: row["duration"], reverse=True)
+
+    def print_summary(self):
+        """
+        計測結果の集計表を端末に表示します。
+        """
+        rows = self.summary()
+        if not rows:
+            return
+        print()
+        print("=== 計測結果 ===")
+        print(f"{'区間':<24}{'回数':>6}{'合計時間(秒)':>14}{'入力トークン':>14}{'出力トークン':>14}{'推定コスト($)':>14}"
+              f"{'ステップ':>10}{'キャッシュヒット':>16}")
+        for row in rows:
+            counters = row["counters"]
+            cache_hits = counters.get("scrape_cache_hits", 0) + counters.get("llm_cache_hits", 0)
+            print(f"{row['name']:<24}{row['count']:>6}{row['duration']:>14.2f}"
+                  f"{counters.get('prompt_tokens', 0):>14}{counters.get('completion_tokens', 0):>14}"
+                  f"{counters.get('cost', 0.0):>14.4f}{counters.get('agent_steps', 0):>10}{cache_hits:>16}")
+        if self.model_usage:
+            print()
+            print(f"{'モデル':<28}{'呼び出し':>10}{'入力トークン':>14}{'出力トークン':>14}{'推定コスト($)':>14}")
+            for model, usage in sorted(self.model_usage.items()):
+                print(f"{model:<28}{usage['calls']:>10}{usage['prompt_tokens']:>14}{usage['completion_tokens']:>14}"
+                      f"{usage['cost']:>14.4f}")
+            total_cost = sum(usage["cost"] for usage in self.model_usage.values())
+            print(f"推定コスト合計: ${total_cost:.4f}")
+        if self.path:
+            print(f"トレースを {self.path} に保存しました。")
+
+
+def _make_otel_tracer():
+    """
+    OpenTelemetry のトレーサーを返します。opentelemetry がインストールされていない場合は None を返します。
+    送信先は OpenTelemetry SDK の設定（OTEL_EXPORTER_OTLP_ENDPOINT などの環境変数）に従います。
+    """
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        print("opentelemetry がインストールされていないため、OpenTelemetry への送信は行いません。")
+        return None
+    try:
+        # SDK と OTLP エクスポーターがあれば、TracerProvider が未設定の場合に限り設定する
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        if not isinstance(trace.get_tracer_provider(), TracerProvider):
+            provider = TracerProvider()
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            trace.set_tracer_provider(provider)
+    except ImportError:
+        pass
+    return trace.get_tracer("ec-compass")
+
+
+def _start_otel_span(otel_tracer, name, parent):
+    from opentelemetry import trace
+    context = None
+    if parent is not None and parent.otel_span is not None:
+        context = trace.set_span_in_context(parent.otel_span)
+    return otel_tracer.start_span(name, context=context)
+
+
+def _end_otel_span(span):
+    for key, value in list(span.attributes.items()) + list(span.counters.items()):
+        if isinstance(value, (str, bool, int, float)):
+            span.otel_span.set_attribute(key, value)
+        else:
+            span.otel_span.set_attribute(key, json.dumps(value, ensure_ascii=False, default=str))
+    if span.status == "error":
+        from opentelemetry.trace import Status, StatusCode
+        span.otel_span.set_status(Status(StatusCode.ERROR, span.attributes.get("error", "")))
+    span.otel_span.end()
+
+
+def configure_tracing(tracing_settings, path=None):
+    """
+    計測を設定します。settings.yaml の tracing セクションを渡してください。
+    enabled が false の場合は計測を無効にし、None を返します。
+
+    引数:
+      tracing_settings: tracing セクションの辞書
+      path: トレースファイル（JSONL）のパス
+
+    戻り値:
+      設定された Tracer（無効の場合は None）
+    """
+    global _tracer
+    tracing_settings = tracing_settings or {}
+    if not tracing_settings.get("enabled", True):
+        _tracer = None
+        return None
+    _tracer = Tracer(
+        path=path,
+        pricing=tracing_settings.get("pricing"),
+        opentelemetry=tracing_settings.get("opentelemetry", False),
+    )
+    return _tracer
+
+
+def get_tracer():
+    """
+    現在設定されている Tracer を返します（未設定の場合は None）。
+    """
+    return _tracer
+
+
+@contextmanager
+def listening(callback):
+    """
+    このコンテキストで開始したスパンの開始と終了を、callback(event) で通知するコンテキストマネージャです。
+    計測が設定されていなくても通知します。asyncio のタスク・asyncio.to_thread・BrowserRuntime.run で
+    実行した処理にも引き継がれます。
+
+    event は {'event': 'start' または 'end', 'name': スパン名, 'attributes': 属性} の辞書で、
+    'end' には 'duration'（秒）と 'status'（'ok' / 'error'）が加わります。
+    """
+    token = _progress_listener.set(callback)
+    try:
+        yield
+    finally:
+        _progress_listener.reset(token)
+
+
+def _notify(listener, event):
+    try:
+        listener(event)
+    except Exception as e:
+        # 進捗の通知に失敗しても、計測対象の処理は止めない
+        print("進捗を通知できませんでした。エラー:", e)
+
+
+@contextmanager
+def _notifying(listener, name, attributes):
+    _notify(listener, {"event": "start", "name": name, "attributes": attributes})
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _notify(listener, {"event": "end", "name": name, "attributes": attributes,
+                           "duration": round(time.perf_counter() - start, 3), "status": status})
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    計測区間を記録するコンテキストマネージャです。計測が設定されていない場合は何もしません
+    （listening で通知先が設定されている場合は、開始と終了だけを通知します）。
+
+    使用例:
+      with tracing.span("agent.run", model="gpt-4o") as s:
+          ...
+          if s is not None:
+              s.set_attribute("steps", agent.n_steps)
+    """
+    listener = _progress_listener.get()
+    if _tracer is None and listener is None:
+        yield None
+        return
+    if listener is None:
+        with _tracer.span(name, **attributes) as current:
+            yield current
+        return
+    with _notifying(listener, name, attributes):
+        if _tracer is None:
+            yield None
+            return
+        with _tracer.span(name, **attributes) as current:
+            yield current
+
+
+def record_span(name, duration, **attributes):
+    """
+    計測済みの区間を記録します（Tracer.record_span を参照）。計測が設定されていない場合は何もしません。
+    """
+    if _tracer is not None:
+        _tracer.record_span(name, duration, **attributes)
+
+
+def count(key, amount=1):
+    """
+    現在のスパンのカウンタ（エージェントのステップ数・キャッシュヒット数など）に加算します。
+    """
+    current = _current_span.get()
+    if _tracer is not None and current is not None:
+        with _tracer._lock:
+            current.add(key, amount)
+
+
+def record_usage(model, prompt_tokens, completion_tokens):
+    """
+    LLM呼び出し1回分のトークン数を記録します。計測が設定されていない場合は何もしません。
+    """
+    if _tracer is not None:
+        _tracer.record_usage(model, prompt_tokens, completion_tokens)
+
+
+def make_usage_callback(default_model=""):
+    """
+    LLMの応答からトークン数を読み取って記録する、LangChain のコールバックハンドラを返します。
+    llm_factory で作成するすべてのチャットモデルに登録されます。
+
+    引数:
+      default_model: 応答にモデル名が含まれていない場合に使うモデル名
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class _UsageCallback(BaseCallbackHandler):
+        def on_llm_end(self, response, **kwargs):
+            if _tracer is None:
+                return
+            llm_output = response.llm_output or {}
+            model = llm_output.get("model_name") or llm_output.get("model") or ""
+            usage = llm_output.get("token_usage") or llm_output.get("usage") or {}
+            prompt_tokens = usage.get("prompt_tokens") or usage.get("input_tokens") or 0
+            completion_tokens = usage.get("completion_tokens") or usage.get("output_tokens") or 0
+            if not prompt_tokens and not completion_tokens:
+                # ストリーミングや Google のモデルでは、メッセージの usage_metadata に入っている
+                for generations in response.generations:
+                    for generation in generations:
+                        message = getattr(generation, "message", None)
+                        metadata = getattr(message, "usage_metadata", None) or {}
+                        prompt_tokens += metadata.get("input_tokens", 0)
+                        completion_tokens += metadata.get("output_tokens", 0)
+                        if not model:
+                            model = (getattr(message, "response_metadata", None) or {}).get("model_name", "")
+            if prompt_tokens or completion_tokens:
+                _tracer.record_usage(model or default_model or "unknown", prompt_tokens, completion_tokens)
+
+    return _UsageCallback()